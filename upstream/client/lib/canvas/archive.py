@@ -0,0 +1,210 @@
+#
+# Copyright (C) 2013-2016   Ian Firns   <firnsy@kororaproject.org>
+#                           Chris Smart <csmart@kororaproject.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import io
+import os
+import tarfile
+import zipfile
+
+# leading bytes identifying each archive format
+MAGIC = [
+    (b'PK\x03\x04',         'zip'),
+    (b'PK\x05\x06',         'zip'),
+    (b'\x1f\x8b',           'gz'),
+    (b'BZh',                'bz2'),
+    (b'\xfd7zXZ\x00',       'xz'),
+    (b'\x28\xb5\x2f\xfd',   'zst'),
+]
+
+# file name suffixes identifying each archive format
+SUFFIXES = [
+    ('.zip',     'zip'),
+    ('.tar.gz',  'gz'),
+    ('.tgz',     'gz'),
+    ('.tar.bz2', 'bz2'),
+    ('.tbz',     'bz2'),
+    ('.tbz2',    'bz2'),
+    ('.tar.xz',  'xz'),
+    ('.txz',     'xz'),
+    ('.tar.zst', 'zst'),
+    ('.tzst',    'zst'),
+    ('.tar',     'tar'),
+]
+
+# bytes required to identify an archive, ie. the ustar magic of a tar header
+HEAD_SIZE = 512
+
+
+class _PrefixedReader(io.RawIOBase):
+    """ A reader returning the already consumed head of a stream before the
+    remainder of the stream. """
+
+    def __init__(self, head, stream):
+        self._head = head
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self._head:
+            n = min(len(b), len(self._head))
+            b[:n] = self._head[:n]
+            self._head = self._head[n:]
+            return n
+
+        data = self._stream.read(len(b))
+        b[:len(data)] = data
+
+        return len(data)
+
+
+def archive_format(head, name=None):
+    """
+    Identify the format of an archive from its leading bytes, falling back
+    to the suffix of its file name.
+
+    Args:
+      head: leading bytes of the archive.
+      name: file name of the archive.
+
+    Returns:
+      One of 'zip', 'tar', 'gz', 'bz2', 'xz' or 'zst' (the latter four being
+      compressed tarballs), or None if the format is unknown.
+    """
+    for (magic, fmt) in MAGIC:
+        if head.startswith(magic):
+            return fmt
+
+    if head[257:262] == b'ustar':
+        return 'tar'
+
+    if name is not None:
+        for (suffix, fmt) in SUFFIXES:
+            if name.lower().endswith(suffix):
+                return fmt
+
+    return None
+
+
+def _member_path(to_directory, name):
+    """
+    Return the extraction path of an archive member, ensuring it's within
+    to_directory.
+
+    Raises:
+      ValueError: The member would be extracted outside to_directory.
+    """
+    path = os.path.realpath(os.path.join(to_directory, name))
+
+    # os.path.commonpath is not available before python 3.5
+    if path != to_directory and not path.startswith(os.path.join(to_directory, '')):
+        raise ValueError('Refusing to extract `{0}` outside of `{1}`'.format(name, to_directory))
+
+    return path
+
+
+def _zstd_reader(stream):
+    try:
+        import zstandard
+
+    except ImportError:
+        raise ValueError('Extracting zstd compressed archives requires the zstandard module')
+
+    return zstandard.ZstdDecompressor().stream_reader(stream)
+
+
+def _extract_tar(stream, fmt, to_directory):
+    if fmt == 'zst':
+        stream = _zstd_reader(stream)
+        mode = 'r|'
+
+    elif fmt == 'tar':
+        mode = 'r|'
+
+    else:
+        mode = 'r|' + fmt
+
+    # use the extraction filter where available, which also strips any
+    # setuid bits, whilst still preserving ownership and permissions
+    kwargs = {'filter': 'tar'} if hasattr(tarfile, 'tar_filter') else {}
+
+    with tarfile.open(fileobj=stream, mode=mode) as tar:
+        # members are extracted in order as they are read from the stream
+        for member in tar:
+            path = _member_path(to_directory, member.name)
+
+            if member.issym():
+                _member_path(to_directory, os.path.join(os.path.dirname(path), member.linkname))
+
+            elif member.islnk():
+                _member_path(to_directory, member.linkname)
+
+            elif member.isdev():
+                raise ValueError('Refusing to extract device `{0}`'.format(member.name))
+
+            tar.extract(member, to_directory, **kwargs)
+
+
+def _extract_zip(source, to_directory):
+    with zipfile.ZipFile(source) as z:
+        for info in z.infolist():
+            _member_path(to_directory, info.filename)
+            z.extract(info, to_directory)
+
+
+def extract(source, to_directory, name=None):
+    """
+    Extract an archive into to_directory without changing the working
+    directory. Tarballs (optionally gzip, bzip2, xz or zstd compressed) are
+    extracted member by member as they are read so they can be extracted
+    straight from a stream, zip archives require a file or seekable stream.
+
+    Args:
+      source: path or binary file object of the archive.
+      to_directory: directory to extract the archive into.
+      name: file name of the archive, used to identify the archive format
+            when it can't be identified from its content.
+
+    Raises:
+      ValueError: The archive format is not supported or a member would be
+                  extracted outside of to_directory.
+    """
+    to_directory = os.path.realpath(to_directory)
+
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            return extract(f, to_directory, name=name or os.path.basename(source))
+
+    head = source.read(HEAD_SIZE)
+    fmt = archive_format(head, name)
+
+    if fmt is None:
+        raise ValueError("Could not extract `{0}` as no appropriate extractor is found".format(name or source))
+
+    os.makedirs(to_directory, exist_ok=True)
+
+    if fmt == 'zip':
+        if not (hasattr(source, 'seekable') and source.seekable()):
+            raise ValueError('Zip archives can only be extracted from a file')
+
+        source.seek(-len(head), io.SEEK_CUR)
+
+        return _extract_zip(source, to_directory)
+
+    return _extract_tar(io.BufferedReader(_PrefixedReader(head, source)), fmt, to_directory)
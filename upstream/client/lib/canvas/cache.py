@@ -0,0 +1,478 @@
+#
+# Copyright (C) 2013-2016   Ian Firns   <firnsy@kororaproject.org>
+#                           Chris Smart <csmart@kororaproject.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+
+def user_cache_dir():
+    """ Return the canvas cache directory of the invoking user. """
+    base = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+
+    return os.path.join(base, 'canvas')
+
+
+def kickstart_cache_dir():
+    """ Return the directory parsed kickstarts are cached in. """
+    return os.path.join(user_cache_dir(), 'kickstarts')
+
+
+def object_cache_dir():
+    """ Return the directory downloaded template objects are cached in. """
+    return os.getenv('CANVAS_CACHE_DIR', '/var/cache/canvas')
+
+
+def host_cache_dir(host, cache_dir=None):
+    """ Return the cache directory for the specified canvas host. """
+    if cache_dir is None:
+        cache_dir = user_cache_dir()
+
+    return os.path.join(cache_dir, re.sub(r'[^\w\.\-]+', '_', host).strip('_'))
+
+
+def parse_size(value):
+    """
+    Return the number of bytes of a size such as 512M or 10G.
+
+    Raises:
+      ValueError: The size is not valid.
+    """
+    m = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([kKmMgGtT]?)[iI]?[bB]?\s*$', str(value))
+
+    if m is None:
+        raise ValueError('invalid size: {0}'.format(value))
+
+    return int(float(m.group(1)) * 1024 ** ' KMGT'.index(m.group(2).upper() or ' '))
+
+
+def write_atomic(path, data):
+    """ Write data to path such that readers never see a partial file. """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    (fd, tmp_path) = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+
+        os.replace(tmp_path, path)
+
+    except:
+        os.unlink(tmp_path)
+        raise
+
+
+class UUIDCache(object):
+    """
+    A persistent cache mapping template and machine identifiers (ie.
+    user:name[@version]) to their UUIDs on a canvas host.
+
+    Entries expire after ttl seconds and the cache is saved on every change.
+    Failing to read or write the cache is never fatal.
+    """
+
+    def __init__(self, path, ttl=86400):
+        self._path = path
+        self._ttl = ttl
+
+        self._lock = threading.Lock()
+        self._entries = None
+
+    def _load(self):
+        if self._entries is not None:
+            return
+
+        self._entries = {}
+
+        try:
+            with open(self._path, 'r') as f:
+                self._entries = json.load(f)
+
+        except (IOError, OSError, ValueError):
+            pass
+
+    def _save(self):
+        try:
+            write_atomic(self._path, json.dumps(self._entries, separators=(',', ':')).encode('utf-8'))
+
+        except (IOError, OSError) as e:
+            logging.debug('Unable to save uuid cache: {0}'.format(e))
+
+    def discard(self, kind, unv):
+        with self._lock:
+            self._load()
+
+            if self._entries.pop('{0}/{1}'.format(kind, unv), None) is not None:
+                self._save()
+
+    def get(self, kind, unv, expire=True):
+        """
+        Return the cached UUID of the identifier or None if not known. Expired
+        entries are still returned if expire is False.
+        """
+        if unv is None:
+            return None
+
+        with self._lock:
+            self._load()
+
+            entry = self._entries.get('{0}/{1}'.format(kind, unv))
+
+            if entry is None or (expire and entry[1] + self._ttl < time.time()):
+                return None
+
+            return entry[0]
+
+    def set(self, kind, unv, uuid):
+        if unv is None or uuid is None:
+            return
+
+        with self._lock:
+            self._load()
+
+            self._entries['{0}/{1}'.format(kind, unv)] = [uuid, int(time.time())]
+            self._save()
+
+
+class KickstartCache(object):
+    """
+    A persistent cache of parsed kickstarts keyed by kickstart_key(), so
+    kickstarts that have not changed are never parsed again.
+
+    Each entry is a single gzip compressed file of compact JSON. Failing to
+    read or write the cache is never fatal.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = kickstart_cache_dir()
+
+        self._path = path
+
+    def _entry_path(self, key):
+        return os.path.join(self._path, '{0}.json.gz'.format(key))
+
+    def get(self, key):
+        """ Return the cached content of the kickstart or None if not cached. """
+        try:
+            with gzip.open(self._entry_path(key), 'rb') as f:
+                return json.loads(f.read().decode('utf-8'))
+
+        except (IOError, OSError, EOFError, ValueError):
+            return None
+
+    def set(self, key, content):
+        data = json.dumps(content, separators=(',', ':'), sort_keys=True).encode('utf-8')
+
+        try:
+            write_atomic(self._entry_path(key), gzip.compress(data))
+
+        except (IOError, OSError) as e:
+            logging.debug('Unable to save kickstart cache: {0}'.format(e))
+
+
+class TemplateCache(object):
+    """
+    A persistent cache of raw template JSON keyed by template UUID, stored
+    along with the validators (ETag and Last-Modified) the server returned.
+
+    Each entry is a single file holding a line of JSON encoded validators
+    followed by the raw template JSON, so validators and data are always
+    replaced together. Failing to read or write the cache is never fatal.
+    """
+
+    def __init__(self, path):
+        self._path = path
+
+    def _entry_path(self, uuid):
+        return os.path.join(self._path, re.sub(r'[^\w\-]+', '_', uuid))
+
+    def discard(self, uuid):
+        try:
+            os.unlink(self._entry_path(uuid))
+
+        except (IOError, OSError):
+            pass
+
+    def get(self, uuid):
+        """
+        Return a tuple of the cached raw JSON and validators dictionary of
+        the template, or None if the template is not cached.
+        """
+        try:
+            with open(self._entry_path(uuid), 'rb') as f:
+                validators = json.loads(f.readline().decode('utf-8'))
+                data = f.read()
+
+        except (IOError, OSError, ValueError):
+            return None
+
+        return (data, validators)
+
+    def set(self, uuid, data, etag=None, last_modified=None):
+        """
+        Cache the raw JSON of a template. Templates without validators can't
+        be revalidated but remain available for offline use.
+        """
+        validators = json.dumps({'etag': etag, 'last_modified': last_modified}, separators=(',', ':'))
+
+        try:
+            write_atomic(self._entry_path(uuid), validators.encode('utf-8') + b'\n' + data)
+
+        except (IOError, OSError) as e:
+            logging.debug('Unable to save template cache: {0}'.format(e))
+
+
+class ObjectStore(object):
+    """
+    A content addressed store of downloaded objects. Each object is kept
+    once at sha256/ab/abcdef... by the sha256 of its content, regardless of
+    the templates or sources referencing it.
+
+    Objects are downloaded to partial files within the store, which are kept
+    so interrupted downloads can be resumed, and only moved into place once
+    complete. A stored object is therefore always whole.
+
+    The store also records the content last downloaded from each source with
+    the validators (ETag and Last-Modified) returned, so sources without a
+    known checksum can be revalidated instead of downloaded again.
+
+    The modification time of a stored object tracks when it was last used,
+    so the least recently used objects can be evicted to keep the store
+    within a size budget. Objects of the currently applied template are
+    pinned and never evicted.
+    """
+
+    # partial downloads not resumed within this time are removed by gc
+    PART_TTL = 7 * 86400
+
+    def __init__(self, path=None):
+        if path is None:
+            path = object_cache_dir()
+
+        self._path = path
+
+    def _key(self, *values):
+        return hashlib.sha256('\0'.join(v or '' for v in values).encode('utf-8')).hexdigest()
+
+    def add(self, part_path, xsum):
+        """
+        Move a complete partial file into the store.
+
+        Returns:
+          Path of the stored object.
+        """
+        path = self.path(xsum)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(part_path, path)
+
+        return path
+
+    def _objects(self):
+        """ Return a list of tuples of checksum, size and last use of all objects. """
+        objects = []
+
+        for (root, dirs, files) in os.walk(os.path.join(self._path, 'sha256')):
+            for f in files:
+                try:
+                    st = os.stat(os.path.join(root, f))
+
+                except (IOError, OSError):
+                    continue
+
+                objects.append((f, st.st_size, st.st_mtime))
+
+        return objects
+
+    def _parts(self):
+        """ Return a list of tuples of path, size and last modification of all partial downloads. """
+        parts = []
+
+        try:
+            names = os.listdir(os.path.join(self._path, 'tmp'))
+
+        except (IOError, OSError):
+            return parts
+
+        for f in names:
+            path = os.path.join(self._path, 'tmp', f)
+
+            try:
+                st = os.stat(path)
+
+            except (IOError, OSError):
+                continue
+
+            parts.append((path, st.st_size, st.st_mtime))
+
+        return parts
+
+    def gc(self, max_size=None):
+        """
+        Remove stale partial downloads and evict the least recently used
+        objects that aren't pinned until the store is within max_size bytes.
+
+        Args:
+          max_size: size budget of the store in bytes, no objects are
+                    evicted if None.
+
+        Returns:
+          Tuple of the number and total size of the files removed.
+        """
+        removed = 0
+        removed_size = 0
+
+        now = time.time()
+
+        for (path, size, mtime) in self._parts():
+            if mtime + self.PART_TTL < now:
+                try:
+                    os.unlink(path)
+
+                except (IOError, OSError) as e:
+                    logging.debug('Unable to remove {0}: {1}'.format(path, e))
+                    continue
+
+                removed += 1
+                removed_size += size
+
+        if max_size is None:
+            return (removed, removed_size)
+
+        objects = self._objects()
+        size = sum(o[1] for o in objects)
+        pinned = self.pinned()
+
+        for (xsum, o_size, mtime) in sorted(objects, key=lambda o: o[2]):
+            if size <= max_size:
+                break
+
+            if xsum in pinned:
+                continue
+
+            try:
+                os.unlink(self.path(xsum))
+
+            except (IOError, OSError) as e:
+                logging.debug('Unable to evict {0}: {1}'.format(xsum, e))
+                continue
+
+            logging.debug('Evicted {0} ({1} bytes)'.format(xsum, o_size))
+
+            size -= o_size
+            removed += 1
+            removed_size += o_size
+
+        if size > max_size:
+            logging.warning('Object cache exceeds {0} bytes with pinned objects only.'.format(max_size))
+
+        return (removed, removed_size)
+
+    def has(self, xsum):
+        return os.path.isfile(self.path(xsum))
+
+    def pin(self, xsums):
+        """ Pin the objects of the currently applied template, replacing any previous pins. """
+        try:
+            write_atomic(os.path.join(self._path, 'pins.json'), json.dumps(sorted(set(x.lower() for x in xsums))).encode('utf-8'))
+
+        except (IOError, OSError) as e:
+            logging.debug('Unable to save object pins: {0}'.format(e))
+
+    def pinned(self):
+        try:
+            with open(os.path.join(self._path, 'pins.json'), 'r') as f:
+                return set(json.load(f))
+
+        except (IOError, OSError, ValueError, TypeError):
+            return set()
+
+    def part_path(self, source, xsum=None):
+        """ Return the path of the partial download of source. """
+        part_dir = os.path.join(self._path, 'tmp')
+
+        os.makedirs(part_dir, exist_ok=True)
+
+        return os.path.join(part_dir, self._key(source, xsum) + '.part')
+
+    def path(self, xsum):
+        xsum = xsum.lower()
+
+        return os.path.join(self._path, 'sha256', xsum[0:2], xsum)
+
+    def source_get(self, source):
+        """
+        Return a dictionary of the checksum (xsum) and validators (etag and
+        last_modified) of the content last downloaded from source, or None
+        if unknown or no longer stored.
+        """
+        try:
+            with open(os.path.join(self._path, 'sources', self._key(source)), 'r') as f:
+                entry = json.load(f)
+
+        except (IOError, OSError, ValueError):
+            return None
+
+        if not isinstance(entry, dict) or not entry.get('xsum') or not self.has(entry['xsum']):
+            return None
+
+        return entry
+
+    def source_set(self, source, xsum, etag=None, last_modified=None):
+        entry = {'xsum': xsum, 'etag': etag, 'last_modified': last_modified}
+
+        try:
+            write_atomic(os.path.join(self._path, 'sources', self._key(source)), json.dumps(entry, separators=(',', ':')).encode('utf-8'))
+
+        except (IOError, OSError) as e:
+            logging.debug('Unable to save object source: {0}'.format(e))
+
+    def stats(self):
+        """
+        Return a dictionary of the number and total size of all objects,
+        pinned objects and partial downloads in the store.
+        """
+        objects = self._objects()
+        parts = self._parts()
+        pinned = self.pinned()
+
+        return {
+            'objects':      len(objects),
+            'size':         sum(o[1] for o in objects),
+            'pinned':       len([o for o in objects if o[0] in pinned]),
+            'pinned_size':  sum(o[1] for o in objects if o[0] in pinned),
+            'partial':      len(parts),
+            'partial_size': sum(p[1] for p in parts),
+            'oldest':       min([o[2] for o in objects], default=None),
+        }
+
+    def touch(self, xsum):
+        """ Mark an object as used now. """
+        try:
+            os.utime(self.path(xsum))
+
+        except (IOError, OSError):
+            pass
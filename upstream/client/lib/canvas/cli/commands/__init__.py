@@ -16,21 +16,15 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-import argcomplete
 import argparse
+import importlib
 import logging
 import os
 import pwd
+import shlex
 import sys
 
 import canvas.cli.commands.argparsers.root
-import canvas.cli.commands.argparsers.config
-import canvas.cli.commands.argparsers.template
-import canvas.cli.commands.argparsers.store
-import canvas.cli.commands.argparsers.object
-import canvas.cli.commands.argparsers.package
-import canvas.cli.commands.argparsers.repo
-import canvas.cli.commands.argparsers.machine
 
 # set default log level
 if os.environ.get('CANVAS_DEBUG', '0').lower() in ('1', 'true'):
@@ -48,6 +42,20 @@ CANVAS_HOST = 'https://canvas.kororaproject.org'
 # establish invoking user
 CANVAS_USER = os.environ.get('SUDO_USER', pwd.getpwuid(os.getuid())[0])
 
+# sub commands, in the order listed by help, with the shared arguments
+# given as parents to their parsers
+COMMANDS = [
+    ('config',   'Get and set configuration elements.', []),
+    ('cache',    'Inspect and trim the local object cache.', ['dry_run']),
+    ('template', 'List, create or delete templates.', ['output', 'dry_run', 'verbose', 'template', 'connection_overrides']),
+    ('store',    'Find, add and remove stores in templates.', ['dry_run', 'verbose', 'template', 'connection_overrides']),
+    ('object',   'Find, add and remove objects in templates.', ['output', 'dry_run', 'verbose', 'template', 'connection_overrides']),
+    ('package',  'Find, add and remove packages in templates.', ['output', 'dry_run', 'verbose', 'template', 'connection_overrides']),
+    ('repo',     'Find, add and remove repos in templates.', ['output', 'dry_run', 'verbose', 'template', 'connection_overrides']),
+    ('machine',  'List, create or delete machines.', ['output', 'dry_run', 'verbose', 'template', 'connection_overrides']),
+    ('batch',    'Run canvas commands read from a file or stdin.', []),
+]
+
 class LogFormatter(logging.Formatter):
     def format(self, record):
         if record.levelno in (logging.WARNING, logging.ERROR, logging.CRITICAL):
@@ -55,7 +63,26 @@ class LogFormatter(logging.Formatter):
 
         return super(LogFormatter, self).format(record)
 
-def buildCommandLineParser(config):
+class SelectionParser(argparse.ArgumentParser):
+    """ Argument parser raising ValueError on errors, rather than exiting. """
+
+    def error(self, message):
+        raise ValueError(message)
+
+def buildCommandLineParser(config, command=None, argv=None):
+    """
+    Build the command line parser. Only the parser of the selected sub
+    command is built, all others are only listed so they can be chosen.
+
+    Args:
+      config: Config providing argument defaults.
+      command: name of the sub command to build the parser for.
+      argv: command line words (excluding the program name) to select the
+            sub command from, when command is not given.
+
+    Returns:
+      Namespace holding the main parser and the parser of the sub command.
+    """
     parsers = argparse.Namespace()
 
     #
@@ -79,6 +106,12 @@ def buildCommandLineParser(config):
         default=config.get('core', 'host', CANVAS_HOST),
         help='url of the canvas server'
     )
+    connection_overrides.add_argument(
+        '--offline',
+        action='store_true',
+        default=config.get('core', 'offline', 'false').lower() in ('1', 'true', 'yes'),
+        help='only use previously fetched templates, never contact the canvas server'
+    )
 
     verbose = argparse.ArgumentParser(add_help=False)
     verbose.add_argument(
@@ -122,6 +155,11 @@ def buildCommandLineParser(config):
         connection_overrides=connection_overrides
     )
 
+    # the sub command is found with the options of the root parser alone,
+    # so the root parser is only built once
+    if command is None and argv is not None:
+        command = selectCommand(connection_overrides, argv)
+
     # SUB COMMANDS
     subparsers = parsers.main.add_subparsers(
         dest='command',
@@ -131,86 +169,100 @@ def buildCommandLineParser(config):
         )
     )
 
-    # CONFIG COMMANDS
-    parsers.config = canvas.cli.commands.argparsers.config.build(
-        subparsers,
+    shared = {
+        'connection_overrides': connection_overrides,
+        'dry_run': dry_run,
+        'output': output,
+        'template': template,
+        'verbose': verbose,
+    }
 
-    )
+    for (name, summary, parents) in COMMANDS:
+        if name == command:
+            module = importlib.import_module('canvas.cli.commands.argparsers.{0}'.format(name))
+            setattr(parsers, name, module.build(subparsers, **{p: shared[p] for p in parents}))
 
-    # TEMPLATE COMMANDS
-    parsers.template = canvas.cli.commands.argparsers.template.build(
-        subparsers,
-        output=output,
-        dry_run=dry_run,
-        verbose=verbose,
-        template=template,
-        connection_overrides=connection_overrides
-    )
+        else:
+            subparsers.add_parser(name, help=summary, add_help=False)
 
-    # STORE COMMANDS
-    parsers.store = canvas.cli.commands.argparsers.store.build(
-        subparsers,
-        dry_run=dry_run,
-        verbose=verbose,
-        template=template,
-        connection_overrides=connection_overrides
-    )
+    return parsers
 
-    # OBJECT COMMANDS
-    parsers.object = canvas.cli.commands.argparsers.object.build(
-        subparsers,
-        output=output,
-        dry_run=dry_run,
-        verbose=verbose,
-        template=template,
-        connection_overrides=connection_overrides
-    )
 
-    # PACKAGE COMMANDS
-    parsers.package = canvas.cli.commands.argparsers.package.build(
-        subparsers,
-        output=output,
-        dry_run=dry_run,
-        verbose=verbose,
-        template=template,
-        connection_overrides=connection_overrides
-    )
+def selectCommand(parser, words):
+    """
+    Find the sub command in the command line words, skipping the options of
+    the main parser and their values. Options are parsed as argparse does,
+    so abbreviated options and attached values (ie. --host=URL or -Uname)
+    are understood.
 
-    # REPO COMMANDS
-    parsers.repo = canvas.cli.commands.argparsers.repo.build(
-        subparsers,
-        output=output,
-        dry_run=dry_run,
-        verbose=verbose,
-        template=template,
-        connection_overrides=connection_overrides
-    )
+    Args:
+      parser: parser of the main options, excluding help and version.
+      words: command line words, excluding the program name.
 
-    # MACHINE COMMANDS
-    parsers.machine = canvas.cli.commands.argparsers.machine.build(
-        subparsers,
-        output=output,
-        dry_run=dry_run,
-        verbose=verbose,
-        template=template,
-        connection_overrides=connection_overrides
-    )
+    Returns:
+      Name of the sub command, or None if there isn't one or the main
+      options are invalid.
+    """
+    selector = SelectionParser(add_help=False, parents=[parser])
 
-    return parsers
+    try:
+        (args, words) = selector.parse_known_args(words)
+
+    except ValueError:
+        return None
+
+    for word in words:
+        if word != '--' and not word.startswith('-'):
+            return word
+
+    return None
+
+
+def parseCommandLine(config, argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    # when invoked by shell completion only the words before the cursor
+    # matter, and argcomplete exits once completions are written
+    completing = '_ARGCOMPLETE' in os.environ
+
+    if completing:
+        line = os.environ.get('COMP_LINE', '')
+        line = line[:int(os.environ.get('COMP_POINT', len(line)))]
+
+        try:
+            argv = shlex.split(line)[1:]
+
+        except ValueError:
+            argv = line.split()[1:]
 
+    parsers = buildCommandLineParser(config, argv=argv)
 
-def parseCommandLine(config):
-    parsers = buildCommandLineParser(config)
+    if completing:
+        import argcomplete
 
-    args = None
-    args_extra = None
+        argcomplete.autocomplete(parsers.main)
 
-    argcomplete.autocomplete(parsers.main)
-    args, args_extra = parsers.main.parse_known_args()
+    args, args_extra = parsers.main.parse_known_args(argv)
 
     return (parsers, args, args_extra)
 
 
+def loadCommand(name):
+    """
+    Import the implementation of a sub command.
+
+    Args:
+      name: name of the sub command.
+
+    Returns:
+      Instance of the sub command's Command class.
+    """
+    module = importlib.import_module('canvas.cli.commands.{0}'.format(name))
+
+    return getattr(module, '{0}Command'.format(name.capitalize()))()
+
+
 def general_usage(prog_name='canvas'):
     return
     print("Usage: {0} [--version] [--help] [--verbose] <command> [<args>]\n"
@@ -222,16 +274,47 @@ def general_usage(prog_name='canvas'):
           "  store     Find, add and remove stores in templates\n"
           "  object    Find, add and remove objects in templates\n"
           "  machine   List, create or delete machines\n"
+          "  cache     Inspect and trim the local object cache\n"
+          "  batch     Run canvas commands read from a file or stdin\n"
           "  config    Get and set configuration elements\n".format(prog_name))
 
 
 class Command(object):
+    # services shared by all commands run in the process, keyed by their
+    # connection settings
+    _services = {}
+
     def __init__(self, prog_name='canvas'):
         self.prog_name = prog_name
 
     def configure(self, config, args, args_extra):
         pass
 
+    def connect(self, config, args):
+        """
+        Return the canvas service object for the command, applying any
+        connection settings from the config. Commands run in the same
+        process (ie. by batch) with the same settings share the service, and
+        so its session and connections.
+        """
+        from canvas.service import Service
+
+        settings = dict(
+            host=args.host,
+            username=args.username,
+            timeout=float(config.get('core', 'timeout', 60)),
+            connect_timeout=float(config.get('core', 'connect_timeout', 10)),
+            offline=args.offline,
+            compact=config.get('core', 'compact_packages', 'false').lower() in ('1', 'true', 'yes')
+        )
+
+        key = tuple(sorted(settings.items()))
+
+        if key not in Command._services:
+            Command._services[key] = Service(**settings)
+
+        return Command._services[key]
+
     def help(self):
         pass
 
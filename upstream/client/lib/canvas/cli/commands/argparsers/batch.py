@@ -0,0 +1,50 @@
+#
+# Copyright (C) 2013-2016   Ian Firns   <firnsy@kororaproject.org>
+#                           Chris Smart <csmart@kororaproject.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+def build(subparsers, **kwargs):
+    batch_parser = subparsers.add_parser(
+        'batch',
+        description=(
+            'Run canvas commands read from a file or stdin in a single '
+            'process, sharing one session with the canvas server. Commands '
+            'are given one per line, or as a json list of command lines or '
+            'argument lists.'
+        ),
+        help='Run canvas commands read from a file or stdin.'
+    )
+
+    batch_parser.add_argument(
+        'file',
+        nargs='?',
+        default='-',
+        metavar='FILE',
+        help='file to read commands from, defaults to stdin'
+    )
+    batch_parser.add_argument(
+        '--format',
+        choices=['auto', 'lines', 'json'],
+        default='auto',
+        help='format of the commands, detected from the content by default'
+    )
+    batch_parser.add_argument(
+        '-x', '--stop-on-error',
+        action='store_true',
+        help='stop at the first command that fails'
+    )
+
+    return batch_parser
@@ -0,0 +1,63 @@
+#
+# Copyright (C) 2013-2016   Ian Firns   <firnsy@kororaproject.org>
+#                           Chris Smart <csmart@kororaproject.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+def build(subparsers, **kwargs):
+    cache_parser = subparsers.add_parser(
+        'cache',
+        description='Inspect and trim the local object cache.',
+        help='Inspect and trim the local object cache.'
+    )
+
+    subparsers_cache = cache_parser.add_subparsers(
+        dest='action',
+        description='Inspect and trim the object cache.'
+    )
+
+    #
+    # GC ARGUMENTS
+    #
+    cache_gc_parser = subparsers_cache.add_parser(
+        'gc',
+        description=(
+            'Remove stale partial downloads and evict the least recently '
+            'used objects not used by the applied template.'
+        ),
+        parents=[
+            kwargs["dry_run"],
+        ],
+        help='trim the object cache'
+    )
+    cache_gc_parser.add_argument(
+        '--max-size',
+        metavar='SIZE',
+        help=(
+            'evict objects until the cache is within SIZE (eg. 512M, 10G), '
+            'defaults to the cache.max_size config option'
+        )
+    )
+
+    #
+    # STATS ARGUMENTS
+    #
+    cache_stats_parser = subparsers_cache.add_parser(
+        'stats',
+        description='Show the size and usage of the object cache.',
+        help='show object cache usage'
+    )
+
+    return cache_parser
@@ -83,6 +83,12 @@ def build(subparsers, **kwargs):
         action='append',
         help='TODO'
     )
+    object_add_parser.add_argument(
+        '--after',
+        metavar='OBJECT',
+        action='append',
+        help='apply the object after the named object, may be specified multiple times'
+    )
 
     #
     # UPDATE ARGUMENTS
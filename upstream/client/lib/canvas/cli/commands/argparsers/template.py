@@ -157,6 +157,58 @@ def build(subparsers, **kwargs):
         help='do not resolve any template includes'
     )
 
+    #
+    # IMPORT ARGUMENTS
+    #
+    template_import_parser = subparsers_template.add_parser(
+        'import',
+        description=(
+            'Create or update a template from each kickstart, and from the '
+            'kickstarts they include. Includes of a kickstart become includes '
+            'of its template. Templates whose content is unchanged are '
+            'skipped.'
+        ),
+        parents=[
+            kwargs["dry_run"],
+            kwargs["connection_overrides"]
+        ],
+        help='import templates from kickstart files'
+    )
+    template_import_parser.add_argument(
+        'paths',
+        nargs='+',
+        metavar='PATH',
+        help='kickstart file, or directory of kickstart files'
+    )
+    template_import_parser.add_argument(
+        '--match',
+        metavar='GLOB',
+        default='*.ks',
+        help='only import the kickstarts of directories matching GLOB (defaults to *.ks)'
+    )
+    template_import_parser.add_argument(
+        '--version',
+        help='VERSION of the imported templates'
+    )
+    template_import_parser.add_argument(
+        '--rename',
+        metavar='KICKSTART=NAME',
+        action='append',
+        default=[],
+        help='name the template of KICKSTART (without .ks) NAME'
+    )
+    template_import_parser.add_argument(
+        '--public',
+        choices=['0', '1', 'false', 'true'],
+        help='marks imported templates as public if set to true'
+    )
+    template_import_parser.add_argument(
+        '--workers',
+        type=int,
+        default=4,
+        help='number of templates pushed concurrently (defaults to 4)'
+    )
+
     # ISO ARGUMENTS
     template_iso_parser = subparsers_template.add_parser(
         'iso',
@@ -269,6 +321,15 @@ def build(subparsers, **kwargs):
         dest='pull_clean',
         help='remove local packages and repos not in the template'
     )
+    template_pull_parser.add_argument(
+        '--plan',
+        dest='pull_plan',
+        metavar='FILE',
+        help=(
+            'apply the transaction plan in FILE if it still matches the '
+            'system, with --dry-run save the transaction plan to FILE'
+        )
+    )
 
     #
     # PUSH ARGUMENTS
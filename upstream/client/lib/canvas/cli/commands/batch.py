@@ -0,0 +1,170 @@
+#
+# Copyright (C) 2013-2016   Ian Firns   <firnsy@kororaproject.org>
+#                           Chris Smart <csmart@kororaproject.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import json
+import logging
+import shlex
+import sys
+import time
+
+from canvas.cli.commands import Command, loadCommand, parseCommandLine
+from canvas.texttable import TextTable
+
+logger = logging.getLogger('canvas')
+
+
+def parse_batch(data, format='auto'):
+    """
+    Parse the commands of a batch. Commands are either given one per line,
+    ignoring blank lines and comments, or as a json list of command lines or
+    argument lists. A leading 'canvas' is optional.
+
+    Args:
+      data: batch content.
+      format: 'lines', 'json' or 'auto' to detect the format from the content.
+
+    Returns:
+      List of the arguments of each command.
+
+    Raises:
+      ValueError: The batch could not be parsed.
+    """
+    if format == 'auto':
+        format = 'json' if data.lstrip().startswith('[') else 'lines'
+
+    if format == 'json':
+        commands = json.loads(data)
+
+        if not isinstance(commands, list):
+            raise ValueError('json batch must be a list of commands')
+
+    else:
+        commands = [l for l in data.splitlines() if l.strip() and not l.strip().startswith('#')]
+
+    batch = []
+
+    for c in commands:
+        if isinstance(c, str):
+            argv = shlex.split(c, comments=True)
+
+        elif isinstance(c, list):
+            argv = [str(a) for a in c]
+
+        else:
+            raise ValueError('invalid batch command: {0}'.format(c))
+
+        if argv and argv[0] == 'canvas':
+            argv = argv[1:]
+
+        if argv:
+            batch.append(argv)
+
+    return batch
+
+
+class BatchCommand(Command):
+    def configure(self, config, args, args_extra, parsers):
+        # store loaded config
+        self.config = config
+
+        # store args for additional processing
+        self.args = args
+
+    def _read(self):
+        if self.args.file == '-':
+            return sys.stdin.read()
+
+        with open(self.args.file, 'r') as f:
+            return f.read()
+
+    def _run_command(self, argv):
+        """
+        Run a single command of the batch.
+
+        Returns:
+          Exit status of the command.
+        """
+        args = None
+
+        try:
+            (parsers, args, args_extra) = parseCommandLine(self.config, argv)
+
+            if args.command is None or args.command == 'batch':
+                print('error: batch commands must be one of the canvas commands', file=sys.stderr)
+                return 1
+
+            cli = loadCommand(args.command)
+            cli.configure(self.config, args, args_extra, parsers)
+
+            status = cli.run()
+
+        # argument errors and commands bailing out exit
+        except SystemExit as e:
+            status = e.code
+
+        except NotImplementedError:
+            print("error: action '{0}' not implemented yet".format(getattr(args, 'action', None)), file=sys.stderr)
+            return 1
+
+        except Exception as e:
+            logging.exception(e)
+            return 1
+
+        if status is None:
+            return 0
+
+        return status if isinstance(status, int) else 1
+
+    def run(self):
+        try:
+            commands = parse_batch(self._read(), self.args.format)
+
+        except (IOError, ValueError) as e:
+            print('error: unable to read batch: {0}'.format(e), file=sys.stderr)
+            return 1
+
+        results = []
+
+        for (i, argv) in enumerate(commands, 1):
+            line = ' '.join(shlex.quote(a) for a in argv)
+
+            logging.info('[{0}/{1}] {2}'.format(i, len(commands), line))
+
+            start = time.time()
+            status = self._run_command(argv)
+
+            results.append([str(i), line, 'ok' if status == 0 else 'failed ({0})'.format(status),
+                           '{0:.2f}s'.format(time.time() - start)])
+
+            if status != 0 and self.args.stop_on_error:
+                break
+
+        l = TextTable(header=['#', 'COMMAND', 'STATUS', 'TIME'])
+
+        for r in results:
+            l.add_row(r)
+
+        print(l)
+
+        failed = len([r for r in results if r[2] != 'ok'])
+
+        if failed or len(results) < len(commands):
+            logging.error('{0} of {1} command(s) failed, {2} not run.'.format(failed, len(commands), len(commands) - len(results)))
+            return 1
+
+        return 0
@@ -0,0 +1,138 @@
+#
+# Copyright (C) 2013-2016   Ian Firns   <firnsy@kororaproject.org>
+#                           Chris Smart <csmart@kororaproject.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import logging
+import sys
+import time
+
+from canvas.cache import ObjectStore, object_cache_dir, parse_size
+from canvas.cli.commands import Command
+from canvas.texttable import TextTable
+
+logger = logging.getLogger('canvas')
+
+
+def format_size(size):
+    for unit in ['B', 'K', 'M', 'G']:
+        if size < 1024:
+            break
+
+        size /= 1024.0
+
+    else:
+        unit = 'T'
+
+    return '{0:.1f}{1}'.format(size, unit) if unit != 'B' else '{0}B'.format(size)
+
+
+def cache_max_size(config, value=None):
+    """
+    Return the object cache size budget in bytes from value, or the
+    cache.max_size config option if value is None. Returns None if no budget
+    is defined.
+
+    Raises:
+      ValueError: The size is not valid.
+    """
+    if value is None:
+        value = config.get('cache', 'max_size')
+
+    if value is None:
+        return None
+
+    return parse_size(value)
+
+
+class CacheCommand(Command):
+    def configure(self, config, args, args_extra, parsers):
+        if args.action == None:
+            parsers.cache.print_help()
+            sys.exit(1)
+
+        # store loaded config
+        self.config = config
+
+        # store args for additional processing
+        self.args = args
+
+        self.store = ObjectStore()
+
+    def run(self):
+        command = None
+        # search for our function based on the specified action
+        try:
+            command = getattr(self, 'run_{0}'.format(self.args.action))
+
+        except:
+            self.help()
+            return 1
+
+        if not command:
+            print('error: action is not reachable.')
+            return
+
+        return command()
+
+    def run_gc(self):
+        try:
+            max_size = cache_max_size(self.config, self.args.max_size)
+
+        except ValueError as e:
+            print('error: {0}'.format(e))
+            return 1
+
+        if self.args.dry_run:
+            stats = self.store.stats()
+
+            print('Object cache is {0} ({1} pinned), budget is {2}.'.format(
+                format_size(stats['size']),
+                format_size(stats['pinned_size']),
+                format_size(max_size) if max_size is not None else 'unlimited'
+            ))
+
+            logging.info('No action peformed during this dry-run.')
+            return 0
+
+        (removed, removed_size) = self.store.gc(max_size)
+
+        print('Removed {0} file(s), {1} freed.'.format(removed, format_size(removed_size)))
+
+        return 0
+
+    def run_stats(self):
+        stats = self.store.stats()
+
+        try:
+            max_size = cache_max_size(self.config)
+
+        except ValueError:
+            max_size = None
+
+        l = TextTable(header=['CACHE', 'VALUE'])
+        l.add_row(['path', object_cache_dir()])
+        l.add_row(['objects', '{0} ({1})'.format(stats['objects'], format_size(stats['size']))])
+        l.add_row(['pinned', '{0} ({1})'.format(stats['pinned'], format_size(stats['pinned_size']))])
+        l.add_row(['partial', '{0} ({1})'.format(stats['partial'], format_size(stats['partial_size']))])
+        l.add_row(['budget', format_size(max_size) if max_size is not None else 'unlimited'])
+
+        if stats['oldest'] is not None:
+            l.add_row(['least recently used', time.strftime('%Y-%m-%d %H:%M', time.localtime(stats['oldest']))])
+
+        print(l)
+
+        return 0
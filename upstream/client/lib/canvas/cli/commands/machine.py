@@ -16,17 +16,15 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-import dnf
 import json
 import logging
-import yaml
 import sys
 
 from canvas.cli.commands import Command
 from canvas.machine import Machine
 from canvas.package import Package
 from canvas.repository import Repository
-from canvas.service import Service, ServiceException
+from canvas.service import ServiceException
 from canvas.template import Template
 from canvas.texttable import TextTable
 
@@ -43,7 +41,7 @@ class MachineCommand(Command):
         self.config = config
 
         # create our canvas service object
-        self.cs = Service(host=args.host, username=args.username)
+        self.cs = self.connect(config, args)
 
         # store args for additional processing
         self.args = args
@@ -21,7 +21,7 @@ import logging
 
 from canvas.cli.commands import Command
 from canvas.object import Object, ErrorInvalidObject
-from canvas.service import Service, ServiceException
+from canvas.service import ServiceException
 from canvas.template import Template
 from canvas.texttable import TextTable
 
@@ -38,7 +38,7 @@ class ObjectCommand(Command):
         self.config = config
 
         # create our canvas service object
-        self.cs = Service(host=args.host, username=args.username)
+        self.cs = self.connect(config, args)
 
         # store args for additional processing
         self.args = args
@@ -92,7 +92,7 @@ class ObjectCommand(Command):
             return 1
 
         try:
-            obj = Object(name=self.args.object, data=self.args.data, data_file=self.args.data_file, source=self.args.source, xsum=self.args.xsum, actions=self.args.actions)
+            obj = Object(name=self.args.object, data=self.args.data, data_file=self.args.data_file, source=self.args.source, xsum=self.args.xsum, actions=self.args.actions, after=self.args.after)
         except ErrorInvalidObject as e:
             print (e)
             return 1
@@ -21,7 +21,7 @@ import sys
 
 from canvas.cli.commands import Command
 from canvas.package import Package
-from canvas.service import Service, ServiceException
+from canvas.service import ServiceException
 from canvas.template import Template
 from canvas.texttable import TextTable
 
@@ -38,7 +38,7 @@ class PackageCommand(Command):
         self.config = config
 
         # create our canvas service object
-        self.cs = Service(host=args.host, username=args.username)
+        self.cs = self.connect(config, args)
 
         # store args for additional processing
         self.args = args
@@ -21,7 +21,7 @@ import sys
 
 from canvas.cli.commands import Command
 from canvas.repository import Repository
-from canvas.service import Service, ServiceException
+from canvas.service import ServiceException
 from canvas.template import Template
 from canvas.texttable import TextTable
 
@@ -38,7 +38,7 @@ class RepoCommand(Command):
         self.config = config
 
         # create our canvas service object
-        self.cs = Service(host=args.host, username=args.username)
+        self.cs = self.connect(config, args)
 
         # eval enabled
         try:
@@ -16,7 +16,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-import dnf
+import concurrent.futures
 import getpass
 import json
 import logging
@@ -25,14 +25,18 @@ import sys
 import random
 import string
 import subprocess
-import yaml
 
 from functools import reduce
 
+from canvas.cache import ObjectStore
 from canvas.cli.commands import Command
+from canvas.cli.commands.cache import cache_max_size
+from canvas.dnfcontext import REPOS_SYSTEM, dnf_context
+from canvas.kickstart import include_graph, include_order, kickstart_paths
 from canvas.package import Package
+from canvas.plan import TransactionPlan
 from canvas.repository import Repository
-from canvas.service import Service, ServiceException
+from canvas.service import ServiceException
 from canvas.template import Template
 from canvas.texttable import TextTable
 
@@ -49,7 +53,7 @@ class TemplateCommand(Command):
         self.config = config
 
         # create our canvas service object
-        self.cs = Service(host=args.host, username=args.username)
+        self.cs = self.connect(config, args)
 
         try:
             # expand includes
@@ -193,6 +197,8 @@ class TemplateCommand(Command):
             return 0
 
         elif self.args.yaml:
+            import yaml
+
             print(yaml.dump(t.to_object(resolved=not self.args.no_resolve_includes), indent=4))
             return 0
 
@@ -276,6 +282,120 @@ class TemplateCommand(Command):
 
         return 0
 
+    def _import_kickstart(self, path, unv, includes):
+        """
+        Create or update a template from a kickstart, without the content of
+        the kickstarts it includes, which are instead the template includes.
+
+        Returns:
+          The import status, ie. 'created', 'updated', 'unchanged' or
+          'failed'.
+        """
+        try:
+            t = self.cs.template_get(Template(unv), resolve_includes=False)
+            origin = t.fingerprint()
+            t.clear()
+
+        except ServiceException:
+            t = Template(unv)
+            origin = None
+
+        if not t.from_kickstart(path, includes=False):
+            return 'failed'
+
+        t.includes = includes
+
+        if t.title is None:
+            t.title = os.path.basename(path)
+
+        if self.args.public is not None:
+            t.public = self.args.public
+
+        if t.fingerprint() == origin:
+            return 'unchanged'
+
+        status = 'created' if origin is None else 'updated'
+
+        if self.args.dry_run:
+            return 'would be ' + status
+
+        try:
+            if origin is None:
+                self.cs.template_create(t)
+
+            else:
+                self.cs.template_update(t)
+
+        except ServiceException as e:
+            logging.error('Unable to import {0}: {1}'.format(unv, e))
+            return 'failed'
+
+        return status
+
+    def run_import(self):
+        renames = dict(r.split('=', 1) for r in self.args.rename if '=' in r)
+
+        # the include graph is read once up front, templates are imported
+        # after the templates they include
+        try:
+            graph = include_graph(kickstart_paths(self.args.paths, self.args.match))
+            levels = include_order(graph)
+
+        except (IOError, ValueError) as e:
+            logging.error('Unable to read kickstarts: {0}'.format(e))
+            return 1
+
+        names = {}
+
+        for path in graph:
+            name = os.path.basename(path)
+
+            if name.endswith('.ks'):
+                name = name[:-3]
+
+            names[path] = '{0}:{1}'.format(self.args.username, renames.get(name, name))
+
+            if self.args.version is not None:
+                names[path] += '@{0}'.format(self.args.version)
+
+        status = {}
+
+        # templates only including imported templates are independent, so
+        # are pushed concurrently
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.args.workers) as pool:
+            for level in levels:
+                futures = {}
+
+                for path in level:
+                    if any(status[i] in ['failed', 'skipped'] for i in graph[path]):
+                        logging.error('Skipping {0} as an included template failed to import'.format(names[path]))
+                        status[path] = 'skipped'
+                        continue
+
+                    logging.info('Importing {0} ...'.format(names[path]))
+
+                    f = pool.submit(self._import_kickstart, path, names[path], [names[i] for i in graph[path]])
+                    futures[f] = path
+
+                for f in concurrent.futures.as_completed(futures):
+                    status[futures[f]] = f.result()
+
+        l = TextTable(header=['TEMPLATE', 'KICKSTART', 'STATUS'])
+
+        for level in levels:
+            for path in level:
+                l.add_row([names[path], path, status[path]])
+
+        print(l)
+
+        if self.args.dry_run:
+            logging.info('No action peformed during this dry-run.')
+
+        if any(s in ['failed', 'skipped'] for s in status.values()):
+            return 1
+
+        return 0
+
     def run_iso(self):
 
         t = Template(self.args.template, user=self.args.username)
@@ -319,6 +439,8 @@ class TemplateCommand(Command):
         if self.args.releasever is None:
             if t.version is None or t.version is '':
                 # default to release ver of installed system at /
+                import dnf.rpm
+
                 self.args.releasever = dnf.rpm.detect_releasever('/')
 
             else:
@@ -495,10 +617,29 @@ class TemplateCommand(Command):
             logging.exception(e)
             return 1
 
-        t.system_prepare(clean=self.args.pull_clean)
+        plan = None
+
+        if self.args.pull_plan is not None and not self.args.dry_run:
+            try:
+                plan = TransactionPlan.load(self.args.pull_plan)
+
+            except (IOError, OSError, ValueError) as e:
+                logging.error('Unable to load transaction plan: {0}'.format(e))
+                return 1
+
+        t.system_prepare(clean=self.args.pull_clean, plan=plan)
 
         # describe process for dry runs
         if self.args.dry_run:
+            if self.args.pull_plan is not None:
+                try:
+                    t.system_plan().save(self.args.pull_plan)
+                    logging.info('Transaction plan saved to {0}'.format(self.args.pull_plan))
+
+                except (IOError, OSError) as e:
+                    logging.error('Unable to save transaction plan: {0}'.format(e))
+                    return 1
+
             tx = t.system_transaction()
             packages_install = list(tx.install_set)
             packages_install.sort(key=lambda x: x.name)
@@ -534,6 +675,17 @@ class TemplateCommand(Command):
 
         t.system_apply()
 
+        # keep the object cache within its budget
+        try:
+            max_size = cache_max_size(self.config)
+
+        except ValueError as e:
+            logging.warning('Ignoring cache.max_size: {0}'.format(e))
+            max_size = None
+
+        if max_size is not None:
+            ObjectStore().gc(max_size)
+
     def run_push(self):
         t = Template(self.args.template, user=self.args.username)
 
@@ -555,15 +707,7 @@ class TemplateCommand(Command):
         else:
             # prepare dnf
             logging.info('Analysing system ...')
-            db = dnf.Base()
-            db.read_all_repos()
-            db.read_comps()
-
-            try:
-                db.fill_sack()
-
-            except OSError as e:
-                pass
+            db = dnf_context().fill(REPOS_SYSTEM)
 
             db_list = db.iter_userinstalled()
 
@@ -0,0 +1,176 @@
+#
+# Copyright (C) 2013-2016   Ian Firns   <firnsy@kororaproject.org>
+#                           Chris Smart <csmart@kororaproject.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import logging
+import sys
+import threading
+
+# dnf (and hawkey) are only imported once packages are actually queried, as
+# importing them dominates the startup time of every command
+
+# repo sources the sack can be filled from
+REPOS_INSTALLED = 'installed'  # installed packages only
+REPOS_SYSTEM    = 'system'     # all system repos and comps
+
+
+class DnfContext(object):
+    """
+    A lazily built dnf.Base shared by all package, store and template
+    operations of the process.
+
+    The sack is filled on first use and reused until the repos it is filled
+    from change or it is invalidated, ie. after a transaction modifies the
+    rpmdb.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._base = None
+        self._key = None      # repos the sack is filled from, None if unfilled
+        self._used = False    # whether the base needs a reset before refilling
+        self._substitutions = None
+
+    @property
+    def base(self):
+        """ The shared dnf.Base, created on first use. """
+        with self._lock:
+            if self._base is None:
+                import dnf
+
+                self._base = dnf.Base()
+
+            return self._base
+
+    def fill(self, repos=REPOS_INSTALLED):
+        """
+        Return the shared dnf.Base with its sack filled from the specified
+        repos, reusing the existing sack if already filled from them.
+
+        Args:
+          repos: REPOS_INSTALLED, REPOS_SYSTEM or a list of Repository
+                 objects (ie. the repos of a template).
+
+        Returns:
+          The shared dnf.Base.
+        """
+        if isinstance(repos, str):
+            key = repos
+
+        else:
+            key = tuple(r.to_json() for r in repos)
+
+        with self._lock:
+            db = self.base
+
+            if self._key == key:
+                return db
+
+            if self._used:
+                db.reset(goal=True, repos=True, sack=True)
+
+            self._used = True
+
+            if key == REPOS_SYSTEM:
+                db.read_all_repos()
+                db.read_comps()
+
+            elif key != REPOS_INSTALLED:
+                import dnf.cli.progress
+
+                for r in repos:
+                    dr = r.to_repo(conf=db.conf)
+                    dr.set_progress_bar(dnf.cli.progress.MultiFileProgressMeter())
+                    db.repos.add(dr)
+
+                db.read_comps()
+
+            logging.debug('Filling sack from {0} repos'.format(key if isinstance(key, str) else len(key)))
+
+            try:
+                db.fill_sack()
+
+            except OSError as e:
+                pass
+
+            self._key = key
+
+            return db
+
+    def installed(self):
+        """
+        Return the shared dnf.Base with a sack suitable for querying installed
+        packages, reusing the sack regardless of the repos it was filled from.
+        """
+        with self._lock:
+            if self._key is not None:
+                return self._base
+
+            return self.fill(REPOS_INSTALLED)
+
+    def substitutions(self):
+        """
+        Return the dnf variable substitutions (ie. releasever, basearch),
+        read from the shared dnf.Base configuration once per process.
+        """
+        with self._lock:
+            if self._substitutions is None:
+                self._substitutions = dict(self.base.conf.substitutions)
+
+            return self._substitutions
+
+    def invalidate(self):
+        """
+        Mark the sack as stale so it's refilled on next use. Must be called
+        after a transaction modifies the rpmdb.
+        """
+        with self._lock:
+            self._key = None
+
+
+def dnf_isinstance(obj, name):
+    """
+    Check if obj is an instance of the named dnf or hawkey class without
+    importing dnf. An instance can only exist once its module is imported, so
+    if the module isn't loaded obj can't be an instance.
+
+    Args:
+      obj: object to check.
+      name: qualified class name, ie. 'dnf.Base' or 'hawkey.Package'.
+
+    Returns:
+      True if obj is an instance of the class.
+    """
+    (module, cls) = name.rsplit('.', 1)
+    m = sys.modules.get(module)
+
+    return m is not None and isinstance(obj, getattr(m, cls))
+
+
+_context = None
+_context_lock = threading.Lock()
+
+
+def dnf_context():
+    """ Return the process wide DnfContext. """
+    global _context
+
+    with _context_lock:
+        if _context is None:
+            _context = DnfContext()
+
+        return _context
@@ -0,0 +1,299 @@
+#
+# Copyright (C) 2013-2016   Ian Firns   <firnsy@kororaproject.org>
+#                           Chris Smart <csmart@kororaproject.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import concurrent.futures
+import hashlib
+import http.client
+import json
+import logging
+import os
+import re
+import urllib.error
+import urllib.request
+
+from canvas.cache import ObjectStore
+
+# size of the chunks objects are streamed in
+CHUNK_SIZE = 1024 * 1024
+
+# bytes first-last/length
+RE_CONTENT_RANGE = re.compile(r'^bytes\s+(\d+)-(\d+)/(\d+|\*)$')
+
+
+class DownloadException(Exception):
+    def __init__(self, reason, code=0):
+        self.reason = reason.lower()
+        self.code = code
+
+    def __repr__(self):
+        return str(self)
+
+    def __str__(self):
+        return 'error: {0}'.format(str(self.reason))
+
+
+class Downloader(object):
+    """
+    Downloads template objects into an ObjectStore using a bounded pool of
+    workers.
+
+    Objects are hashed as they are streamed and verified against their
+    checksum before being stored. Objects with the same content (or the same
+    source when their checksum is unknown) are only fetched once, and
+    interrupted downloads are resumed where they left off.
+    """
+
+    def __init__(self, store=None, workers=4, timeout=60):
+        if store is None:
+            store = ObjectStore()
+
+        self._store = store
+        self._workers = workers
+        self._timeout = timeout
+
+    def _discard(self, part_path):
+        for path in (part_path, part_path + '.json'):
+            try:
+                os.unlink(path)
+
+            except (IOError, OSError):
+                pass
+
+    def _fetch(self, source, xsum, force=False):
+        """
+        Stream source into the store, verifying its content against xsum if
+        specified.
+
+        A partial download left by an earlier attempt is resumed with a
+        Range request, conditional on the source being unchanged (If-Range).
+        Sources without a checksum are revalidated (If-None-Match and
+        If-Modified-Since) against the content last downloaded from them.
+
+        Returns:
+          The sha256 of the fetched content.
+
+        Raises:
+          DownloadException: The source could not be fetched or its content
+                             does not match the checksum.
+        """
+        part_path = self._store.part_path(source, xsum)
+
+        if force:
+            self._discard(part_path)
+
+        known = None
+
+        if xsum is None and not force:
+            known = self._store.source_get(source)
+
+        # validators of the source the partial download was started from
+        validators = {}
+        offset = 0
+        h = hashlib.sha256()
+
+        try:
+            with open(part_path + '.json', 'r') as f:
+                validators = json.load(f)
+
+            with open(part_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    h.update(chunk)
+                    offset += len(chunk)
+
+        except (IOError, OSError, ValueError):
+            validators = {}
+            offset = 0
+            h = hashlib.sha256()
+
+        # without a checksum or validator there's no telling whether the
+        # partial download still belongs to the source
+        if offset and xsum is None and not (validators.get('etag') or validators.get('last_modified')):
+            offset = 0
+            h = hashlib.sha256()
+
+        r = urllib.request.Request(source)
+
+        if offset:
+            logging.info('Resuming: {0} ({1} bytes)'.format(source, offset))
+            r.add_header('Range', 'bytes={0}-'.format(offset))
+
+            if validators.get('etag') or validators.get('last_modified'):
+                r.add_header('If-Range', validators.get('etag') or validators.get('last_modified'))
+
+        else:
+            logging.info('Downloading: {0}'.format(source))
+
+            if known is not None:
+                if known.get('etag'):
+                    r.add_header('If-None-Match', known['etag'])
+
+                if known.get('last_modified'):
+                    r.add_header('If-Modified-Since', known['last_modified'])
+
+        try:
+            res = urllib.request.urlopen(r, timeout=self._timeout)
+
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and known is not None:
+                logging.debug('Not modified: {0}'.format(source))
+                return known['xsum']
+
+            # the partial download is no longer valid for the source
+            if e.code == 416 and offset:
+                self._discard(part_path)
+                return self._fetch(source, xsum)
+
+            raise DownloadException('unable to download {0}: {1}'.format(source, e))
+
+        except (IOError, OSError, ValueError) as e:
+            raise DownloadException('unable to download {0}: {1}'.format(source, e))
+
+        # a range other than the one requested (or several ranges) can't be
+        # appended to the partial download, so start over
+        if offset and getattr(res, 'status', None) == 206:
+            m = RE_CONTENT_RANGE.match(res.headers.get('Content-Range', '').strip())
+
+            if m is None or int(m.group(1)) != offset:
+                logging.debug('Unexpected range from {0}: {1}'.format(source, res.headers.get('Content-Range')))
+                res.close()
+
+                self._discard(part_path)
+                return self._fetch(source, xsum)
+
+        try:
+            with res:
+                # the range was ignored or the source has changed
+                if offset and getattr(res, 'status', None) != 206:
+                    offset = 0
+                    h = hashlib.sha256()
+
+                if not offset:
+                    validators = {
+                        'etag':          res.headers.get('ETag'),
+                        'last_modified': res.headers.get('Last-Modified'),
+                    }
+
+                    with open(part_path + '.json', 'w') as f:
+                        json.dump(validators, f)
+
+                length = res.headers.get('Content-Length')
+                received = 0
+
+                with open(part_path, 'ab' if offset else 'wb') as f:
+                    for chunk in iter(lambda: res.read(CHUNK_SIZE), b''):
+                        h.update(chunk)
+                        f.write(chunk)
+                        received += len(chunk)
+
+                # a dropped connection can look like the end of the content
+                if length is not None and received != int(length):
+                    raise http.client.IncompleteRead(b'', int(length) - received)
+
+        except (IOError, OSError, ValueError, http.client.HTTPException) as e:
+            # keep the partial download to resume later
+            raise DownloadException('unable to download {0}: {1}'.format(source, e))
+
+        digest = h.hexdigest()
+
+        if xsum is not None and digest != xsum.lower():
+            self._discard(part_path)
+            raise DownloadException('checksum mismatch for {0}, expected {1} but got {2}'.format(source, xsum, digest))
+
+        try:
+            self._store.add(part_path, digest)
+
+        except (IOError, OSError) as e:
+            raise DownloadException('unable to store {0}: {1}'.format(source, e))
+
+        self._discard(part_path)
+
+        if xsum is None:
+            self._store.source_set(source, digest, validators.get('etag'), validators.get('last_modified'))
+
+        return digest
+
+    def download(self, objects, force=False, on_complete=None):
+        """
+        Download the objects not already in the store. Objects are never
+        modified, the store records the checksum of the content downloaded
+        for objects without one.
+
+        Args:
+          objects: list of Objects to download, raw objects are skipped.
+          force: download objects even if they are already stored.
+          on_complete: callable invoked with each object as soon as it's
+                       available in the store, including objects already
+                       stored.
+
+        Returns:
+          Dictionary of the checksum of the stored content of each source.
+
+        Raises:
+          DownloadException: An object could not be downloaded. All other
+                             objects are still downloaded.
+        """
+        jobs = {}
+        digests = {}
+
+        for o in objects:
+            if o.source in (None, 'raw'):
+                continue
+
+            if o.xsum and not force and self._store.has(o.xsum):
+                self._store.touch(o.xsum)
+                digests[o.source] = o.xsum
+
+                if on_complete is not None:
+                    on_complete(o)
+
+                continue
+
+            key = ('sha256', o.xsum.lower()) if o.xsum else ('source', o.source)
+            jobs.setdefault(key, (o.source, o.xsum, []))[2].append(o)
+
+        if not jobs:
+            return digests
+
+        errors = []
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self._workers) as pool:
+            pending = {pool.submit(self._fetch, source, xsum, force): objs for (source, xsum, objs) in jobs.values()}
+
+            for f in concurrent.futures.as_completed(pending):
+                try:
+                    digest = f.result()
+
+                except DownloadException as e:
+                    logging.error(e.reason)
+                    errors.append(e)
+                    continue
+
+                for o in pending[f]:
+                    digests[o.source] = digest
+
+                # revalidated content is used again
+                self._store.touch(digest)
+
+                if on_complete is not None:
+                    for o in pending[f]:
+                        on_complete(o)
+
+        if errors:
+            raise errors[0]
+
+        return digests
@@ -0,0 +1,201 @@
+#
+# Copyright (C) 2013-2016   Ian Firns   <firnsy@kororaproject.org>
+#                           Chris Smart <csmart@kororaproject.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import fnmatch
+import hashlib
+import json
+import os
+import re
+
+# %include path
+RE_INCLUDE = re.compile(r'^%include\s+(\S+)')
+
+# bumped whenever the parsed form of kickstarts changes, invalidating the
+# kickstart cache
+PARSE_VERSION = 1
+
+
+def kickstart_includes(path, data=None):
+    """
+    Return the paths of the kickstarts included by a kickstart, relative
+    includes being relative to the directory of the kickstart. The kickstart
+    is read unless its content is given as data.
+
+    Raises:
+      IOError: An error occurred reading the kickstart.
+    """
+    if data is None:
+        with open(path, 'rb') as f:
+            data = f.read()
+
+    includes = []
+
+    for line in data.decode('utf-8', 'replace').splitlines():
+        m = RE_INCLUDE.match(line)
+
+        if m:
+            includes.append(os.path.normpath(os.path.join(os.path.dirname(path), m.group(1))))
+
+    return includes
+
+
+def kickstart_key(path, follow_includes=True):
+    """
+    Return the key a parsed kickstart is cached under, the sha256 of the
+    kickstart content, the content of every kickstart it includes (when
+    followed) and the pykickstart version parsing them.
+
+    Returns:
+      The hex digest of the key, or None if the pykickstart version is not
+      known and so parsed kickstarts can't be cached.
+
+    Raises:
+      IOError: An error occurred reading the kickstart.
+    """
+    version = pykickstart_version()
+
+    if version is None:
+        return None
+
+    h = hashlib.sha256(json.dumps([PARSE_VERSION, version, follow_includes]).encode('utf-8'))
+
+    seen = set()
+    pending = [path]
+
+    while pending:
+        p = pending.pop(0)
+
+        if p in seen:
+            continue
+
+        seen.add(p)
+
+        try:
+            with open(p, 'rb') as f:
+                data = f.read()
+
+        except IOError:
+            # only the kickstart itself must exist, pykickstart reports
+            # missing includes when parsing
+            if p == path:
+                raise
+
+            h.update('\0missing\0{0}\0'.format(p).encode('utf-8'))
+            continue
+
+        # includes are keyed by path too, as they are resolved relative to
+        # the kickstart including them
+        h.update('\0{0}\0{1}\0'.format(p if p != path else '', hashlib.sha256(data).hexdigest()).encode('utf-8'))
+
+        if follow_includes:
+            pending.extend(kickstart_includes(p, data))
+
+    return h.hexdigest()
+
+
+def pykickstart_version():
+    """ Return the installed pykickstart version or None if not known. """
+    try:
+        from importlib.metadata import version
+
+        return version('pykickstart')
+
+    except Exception:
+        return None
+
+
+def kickstart_paths(paths, match='*.ks'):
+    """
+    Return the kickstart files given by paths, where directories are
+    expanded to the files within them whose name matches the glob match.
+    """
+    kickstarts = []
+
+    for path in paths:
+        if os.path.isdir(path):
+            kickstarts.extend(sorted(
+                os.path.join(path, f) for f in os.listdir(path)
+                if fnmatch.fnmatch(f, match) and os.path.isfile(os.path.join(path, f))
+            ))
+
+        else:
+            kickstarts.append(path)
+
+    return [os.path.normpath(k) for k in kickstarts]
+
+
+def include_graph(paths):
+    """
+    Build the include graph of the kickstarts, following includes so every
+    included kickstart is also part of the graph. Each kickstart is read
+    once.
+
+    Args:
+      paths: kickstart paths.
+
+    Returns:
+      Dictionary of the included kickstart paths of each kickstart path.
+
+    Raises:
+      IOError: An error occurred reading a kickstart.
+    """
+    graph = {}
+    pending = list(paths)
+
+    while pending:
+        path = pending.pop()
+
+        if path in graph:
+            continue
+
+        graph[path] = kickstart_includes(path)
+        pending.extend(graph[path])
+
+    return graph
+
+
+def include_order(graph):
+    """
+    Order the kickstarts of an include graph so every kickstart follows all
+    the kickstarts it includes.
+
+    Args:
+      graph: include graph, as returned by include_graph().
+
+    Returns:
+      List of levels, each a sorted list of kickstarts that only include
+      kickstarts of earlier levels and so can be processed concurrently.
+
+    Raises:
+      ValueError: The includes form a cycle.
+    """
+    levels = []
+    done = set()
+    remaining = set(graph)
+
+    while remaining:
+        level = sorted(p for p in remaining if done.issuperset(graph[p]))
+
+        if not level:
+            raise ValueError('include cycle detected between: {0}'.format(', '.join(sorted(remaining))))
+
+        levels.append(level)
+        done.update(level)
+        remaining.difference_update(level)
+
+    return levels
@@ -18,7 +18,6 @@
 
 import json
 import re
-import yaml
 
 RE_MACHINE = re.compile("(?:(?P<user>[\w\.\-]*):)?(?P<name>[\w\.\-]+)(?!.*:)(?:@(?P<version>[\w\.\-]+))?")
 
@@ -146,6 +145,15 @@ class Machine(object):
     def title(self, value):
         self._title = value
 
+    @property
+    def unv(self):
+        if self._user and self._name and self._version:
+            return "{0}:{1}@{2}".format(self._user, self._name, self._version)
+        elif self._user and self._name:
+            return "{0}:{1}".format(self._user, self._name)
+
+        return None
+
     @property
     def user(self):
         return self._user
@@ -190,4 +198,6 @@ class Machine(object):
         }
 
     def to_yaml(self):
+        import yaml
+
         return yaml.dump(self.to_object())
@@ -19,14 +19,12 @@
 import hashlib
 import json
 import os
-import urllib.request
-
-from pykickstart.base import KickstartCommand
-from pykickstart.parser import Script
-import pykickstart.constants
+import urllib.parse
 
 import canvas.utilities
 
+from canvas.cache import ObjectStore, object_cache_dir
+from canvas.download import Downloader
 from canvas.set import CanvasSet
 
 class ErrorInvalidObject(Exception):
@@ -50,18 +48,13 @@ class Object(object):
 
     ACTIONS_KS_ONLY = ['ks-command', 'ks-post', 'ks-pre', 'ks-pre-install', 'ks-traceback']
 
+    # script types are named by their pykickstart constant, which are only
+    # resolved on kickstart conversion to avoid importing pykickstart
     MAP_OBJ_STRING_TO_SCRIPT_TYPE = {
-        'ks-post':          pykickstart.constants.KS_SCRIPT_POST,
-        'ks-pre':           pykickstart.constants.KS_SCRIPT_PRE,
-        'ks-pre-install':   pykickstart.constants.KS_SCRIPT_PREINSTALL,
-        'ks-traceback':     pykickstart.constants.KS_SCRIPT_TRACEBACK
-    }
-
-    MAP_SCRIPT_TYPE_TO_OBJ_STRING = {
-        pykickstart.constants.KS_SCRIPT_PRE:        'ks-pre',
-        pykickstart.constants.KS_SCRIPT_POST:       'ks-post',
-        pykickstart.constants.KS_SCRIPT_TRACEBACK:  'ks-traceback',
-        pykickstart.constants.KS_SCRIPT_PREINSTALL: 'ks-pre-install'
+        'ks-post':          'KS_SCRIPT_POST',
+        'ks-pre':           'KS_SCRIPT_PRE',
+        'ks-pre-install':   'KS_SCRIPT_PREINSTALL',
+        'ks-traceback':     'KS_SCRIPT_TRACEBACK'
     }
 
     def __init__(self, *args, **kwargs):
@@ -70,8 +63,9 @@ class Object(object):
         self._source = None
         self._data = None
         self._actions = []
+        self._after = []
 
-        self._cache_dir = os.getenv('CANVAS_CACHE_DIR', '/var/cache/canvas')
+        self._cache_dir = object_cache_dir()
 
         if kwargs:
             self._name     = kwargs.get('name', self._name)
@@ -79,6 +73,7 @@ class Object(object):
             self._source   = kwargs.get('source', self._source)
             self._data     = kwargs.get('data', self._data)
             self._actions  = kwargs.get('actions', self._actions)
+            self._after    = kwargs.get('after', self._after)
             self._template = kwargs.get('template', None)
 
             # check if we've got a data_file to read data from
@@ -99,22 +94,27 @@ class Object(object):
             if len(args) > 1:
                 raise ErrorInvalidObject('too many positional arguments')
 
-            elif (isinstance(args[0], Script)):
-                self._from_ks_script(args[0])
-
-            elif (isinstance(args[0], KickstartCommand)):
-                self._from_ks_command(args[0])
-
             # parse the dict form, the most common form and directly
             # relates to the json structures returned by canvas server
             elif (isinstance(args[0], dict)):
                 self._name     = args[0].get('name', self._name)
                 self._xsum     = args[0].get('checksum', {}).get('sha256', None)
                 self._actions  = args[0].get('actions', self._actions)
+                self._after    = args[0].get('after', self._after)
                 self._source   = args[0].get('source', self._source)
                 self._data     = args[0].get('data', self._data)
                 self._template = args[0].get('template', None)
 
+            else:
+                from pykickstart.base import KickstartCommand
+                from pykickstart.parser import Script
+
+                if (isinstance(args[0], Script)):
+                    self._from_ks_script(args[0])
+
+                elif (isinstance(args[0], KickstartCommand)):
+                    self._from_ks_command(args[0])
+
         # calculate checksum if not defined
         if self._xsum is None:
             if (self._data is None and self._source == 'raw'):
@@ -122,6 +122,12 @@ class Object(object):
             elif self._data:
                 self._xsum = hashlib.sha256(self._data.encode('utf-8')).hexdigest()
 
+        # names of the objects this object is applied after
+        if isinstance(self._after, str):
+            self._after = [self._after]
+
+        self._after = list(self._after or [])
+
         # process actions
         actions = []
         for a in self._actions:
@@ -178,8 +184,21 @@ class Object(object):
         return 'Object: {0} (xsum: {1}, actions: {2})'.format(self._name, xsum, len(self._actions))
 
     def _cached_object_path(self):
-        filename = '{0}-{1}'.format(self._name, os.path.basename(self._source))
-        return os.path.join(self._cache_dir, filename)
+        # objects are stored by content, the store records the checksum of
+        # the content downloaded for objects without one
+        store = ObjectStore(self._cache_dir)
+        xsum = self._xsum
+
+        if xsum is None and self._source not in (None, 'raw'):
+            known = store.source_get(self._source)
+            xsum = known and known['xsum']
+
+        return store.path(xsum) if xsum else None
+
+    def _source_name(self):
+        # stored objects are named by checksum, so use the source file name
+        # (sans query) wherever the original name matters
+        return os.path.basename(urllib.parse.urlparse(self._source).path)
 
     def _from_ks_command(self, command):
         self._data = str(command)
@@ -199,7 +218,14 @@ class Object(object):
         self._xsum = hashlib.sha256(self._data.encode('utf-8')).hexdigest()
         self._name = "ks-script-{0}".format(self._xsum[0:7])
 
-        type = self.MAP_SCRIPT_TYPE_TO_OBJ_STRING[script.type]
+        import pykickstart.constants
+
+        for (type, constant) in self.MAP_OBJ_STRING_TO_SCRIPT_TYPE.items():
+            if script.type == getattr(pykickstart.constants, constant):
+                break
+
+        else:
+            raise ErrorInvalidObject('unsupported kickstart script type')
 
         action = {
             'type':          type,
@@ -217,6 +243,10 @@ class Object(object):
     def actions(self):
         return self._actions
 
+    @property
+    def after(self):
+        return self._after
+
     @property
     def data(self):
         return self._data
@@ -265,7 +295,7 @@ class Object(object):
         for a in nonks_actions:
             if a['type'] == 'copy':
                 print('object copying ...')
-                canvas.utilities.copy_file(self._cached_object_path(), a['path'])
+                canvas.utilities.copy_file(self._cached_object_path(), a['path'], name=self._source_name())
 
             elif a['type'] == 'execute':
                 print('object executing ...')
@@ -277,21 +307,13 @@ class Object(object):
 
             elif a['type'] == 'extract':
                 print('object extracting ...')
-                canvas.utilities.extract_file(self._cached_object_path(), a['path'])
+                canvas.utilities.extract_file(self._cached_object_path(), a['path'], name=self._source_name())
 
     def download(self, force=False):
         if self._source == 'raw':
             return
 
-        cached_object_path = self._cached_object_path()
-
-        if os.path.exists(cached_object_path):
-            return
-
-        elif not os.path.exists(self._cache_dir):
-            os.mkdir(self._cache_dir)
-
-        urllib.request.urlretrieve(self._source, cached_object_path)
+        Downloader(ObjectStore(self._cache_dir)).download([self], force=force)
 
     def get_ks_command(self):
         if len(self._actions) != 1:
@@ -309,7 +331,9 @@ class Object(object):
 
     def is_downloaded(self):
         if self._source != 'raw':
-            return os.path.exists(self._cached_object_path)
+            path = self._cached_object_path()
+
+            return path is not None and os.path.exists(path)
 
         else:
             return True
@@ -394,16 +418,19 @@ class Object(object):
         if type not in self.MAP_OBJ_STRING_TO_SCRIPT_TYPE.keys():
             return None
 
+        import pykickstart.constants
+        import pykickstart.parser
+
         return pykickstart.parser.Script(self._data,
             errorOnFail = action.get('error_on_fail', None),
             interp      = action.get('interp', None),
             inChroot    = action.get('in_chroot', None),
-            type        = self.MAP_OBJ_STRING_TO_SCRIPT_TYPE[type]
+            type        = getattr(pykickstart.constants, self.MAP_OBJ_STRING_TO_SCRIPT_TYPE[type])
         )
 
 
     def to_object(self):
-        return {
+        obj = {
             'name': self._name,
             'source': self._source,
             'data': self._data,
@@ -413,9 +440,52 @@ class Object(object):
             'actions': self._actions
         }
 
+        # only include ordering constraints when defined
+        if self._after:
+            obj['after'] = self._after
+
+        return obj
+
     def to_json(self):
         return json.dumps(self.to_object(), separators=(',', ':'), sort_keys=True)
 
 class ObjectSet(CanvasSet):
     def __init__(self, initvalue=()):
+        self._xsums = {}    # checksum to slot
+
         CanvasSet.__init__(self, initvalue)
+
+    def _find(self, item):
+        # objects are equal on checksum when both define one, otherwise they
+        # are equal on name
+        if item.xsum:
+            slot = self._xsums.get(item.xsum)
+
+            if slot is not None:
+                return slot
+
+        for slot in self._index.get(item.name, ()):
+            if not (item.xsum and self._set[slot].xsum):
+                return slot
+
+        return None
+
+    def _index_add(self, item, slot):
+        if item.xsum:
+            self._xsums[item.xsum] = slot
+
+        self._index.setdefault(item.name, []).append(slot)
+
+    def _index_clear(self):
+        self._index = {}
+        self._xsums = {}
+
+    def _index_remove(self, item, slot):
+        if item.xsum:
+            del self._xsums[item.xsum]
+
+        slots = self._index[item.name]
+        slots.remove(slot)
+
+        if not slots:
+            del self._index[item.name]
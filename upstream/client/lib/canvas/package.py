@@ -16,11 +16,11 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-import hawkey
+import fnmatch
 import json
 import re
-import dnf
 
+from canvas.dnfcontext import dnf_context, dnf_isinstance
 from canvas.set import CanvasSet
 
 #
@@ -32,6 +32,7 @@ class Package(object):
     # name[[#epoch]@version-release][:arch]
     RE_PACKAGE = re.compile(r"^([+~!])?([^#@:\s]+)(?:(?:#(\d+))?@([^\s-]+)-([^:\s-]+))?(?::(\w+))?$")
     RE_GROUP = re.compile(r"^([+~!])?(@[\w ]+)$")
+    RE_GLOB = re.compile(r"[*?\[]")
 
     # CONSTANTS
     ACTION_PIN              = 0x80
@@ -47,10 +48,11 @@ class Package(object):
     #    F    |    T
     #    F    |    F
 
+    # fields of the compact columnar encoding of a list of packages
+    COLUMNS = ('n', 'e', 'v', 'r', 'a', 'z')
 
     def __init__(self, package, evr=True, template=None):
-        if isinstance(package, dnf.package.Package) or \
-                isinstance(package, hawkey.Package):
+        if dnf_isinstance(package, 'hawkey.Package'):
             package = Package.parse_dnf(package, template=template)
         elif isinstance(package, str):
             package = Package.parse_str(package, template=template)
@@ -99,13 +101,10 @@ class Package(object):
             return False
 
     def __hash__(self):
-        # package uniqueness is based on name and arch
-        # this allows packages with different archs to be
-        # specified in a template
-        if self.arch is None:
-            return hash(self.name)
-
-        return hash('{0}.{1}'.format(self.name, self.arch))
+        # package uniqueness is based on name and arch, however a package
+        # without an arch is equal to all archs of the same name so we can
+        # only hash on name to remain consistent with __eq__
+        return hash(self.name)
 
     def __ne__(self, other):
         return not self.__eq__(other)
@@ -134,6 +133,40 @@ class Package(object):
     def is_group(self):
         return self.name[0] == '@'
 
+    @classmethod
+    def from_columns(cls, columns, template=None):
+        """
+        Return a list of packages from the compact columnar encoding, a
+        dictionary of parallel lists for each package field.
+
+        Raises:
+            ValueError: If the columns are not lists of the same length
+        """
+        names = columns.get('n', [])
+        fields = [(k, columns[k]) for k in cls.COLUMNS if columns.get(k)]
+
+        for k, v in [('n', names)] + fields:
+            if not isinstance(v, list) or len(v) != len(names):
+                raise ValueError("Package column '{0}' does not match the package names".format(k))
+
+        return [
+            cls({k: v[i] for k, v in fields if v[i] is not None}, template=template)
+            for i in range(len(names))
+        ]
+
+    @classmethod
+    def to_columns(cls, packages):
+        """ Return the compact columnar encoding of a list of packages """
+        columns = {k: [] for k in cls.COLUMNS}
+
+        for p in packages:
+            obj = p.to_object()
+
+            for k in cls.COLUMNS:
+                columns[k].append(obj.get(k))
+
+        return columns
+
     @classmethod
     def parse_dnf(cls, pkg, template=None):
         """ Generate a Package dictionary from a dnf package
@@ -151,8 +184,7 @@ class Package(object):
             TypeError: If package is not a dnf or hawkey package
 
         """
-        if not (isinstance(pkg, dnf.package.Package) or \
-                isinstance(pkg, hawkey.Package)):
+        if not dnf_isinstance(pkg, 'hawkey.Package'):
             raise TypeError("Pkg needs to be a DNF or hawkey package object")
 
         return {
@@ -222,6 +254,40 @@ class Package(object):
 
         return {'n': name, 'z': action, 't': template}
 
+    def matches_pkg(self, pkg):
+        """ Check if a DNF package satisfies this package.
+
+        The name may be a glob. Unspecified fields (ie. arch or evr) match
+        any value. A release matches with or without the dist tag appended
+        by to_pkg_spec.
+
+        Args:
+            pkg: DNF or hawkey package
+        Returns:
+            True if the package satisfies this package, False otherwise
+
+        """
+        if self.name != pkg.name and \
+            not (self.RE_GLOB.search(self.name) and fnmatch.fnmatchcase(pkg.name, self.name)):
+            return False
+
+        if self.arch is not None and self.arch != pkg.arch:
+            return False
+
+        if self.epoch is not None and str(self.epoch) != str(pkg.epoch):
+            return False
+
+        if self.version is not None and self.version != pkg.version:
+            return False
+
+        if self.release is not None and self.release != pkg.release:
+            releasever = dnf_context().substitutions()['releasever']
+
+            if '{0}.fc{1}'.format(self.release, releasever) != pkg.release:
+                return False
+
+        return True
+
     @property
     def pinned(self):
         """ Is the package pinned to its version """
@@ -269,9 +335,8 @@ class Package(object):
             evr = self.epoch + ':'
 
         if self.version is not None and self.release is not None:
-            db = dnf.Base()
-            conf = db.conf.substitutions
-            evr += '{0}-{1}.fc{2}'.format(self.version, self.release, conf['releasever'])
+            subs = dnf_context().substitutions()
+            evr += '{0}-{1}.fc{2}'.format(self.version, self.release, subs['releasever'])
         # NOTE: This is valid according to DNF docs,
         # however current str form makes this impossible
         #elif self.version is not None:
@@ -290,7 +355,7 @@ class Package(object):
     def to_pkg(self, db=None):
         """ Convert this package into a DNF Package object.
         Args:
-            db: A DNF Base object
+            db: A DNF Base object, defaults to the shared DNF context
         Returns:
             The DNF package object
         Raises:
@@ -298,13 +363,8 @@ class Package(object):
 
         """
 
-        if not isinstance(db, dnf.Base):
-            db = dnf.Base()
-            try:
-                db.fill_sack()
-
-            except OSError as e:
-                pass
+        if not dnf_isinstance(db, 'dnf.Base'):
+            db = dnf_context().installed()
 
         p_list = db.sack.query().installed().filter(name=self.name)
 
@@ -315,16 +375,56 @@ class Package(object):
 
 
 class PackageSet(CanvasSet):
+    """ An ordered set of packages indexed by name then arch.
+
+    The index maps each package name to a dictionary of arch (None when not
+    specified) to slot. As a package without an arch is equal to all archs of
+    the same name, a name either has a single arch-less entry or one entry
+    per explicit arch.
+    """
+
     def __init__(self, initvalue=()):
         CanvasSet.__init__(self, initvalue)
 
+    def _find(self, item):
+        archs = self._index.get(item.name)
+
+        if not archs:
+            return None
+
+        # an arch-less package matches the first package seen of that name
+        if item.arch is None:
+            return min(archs.values())
+
+        slot = archs.get(item.arch)
+
+        if slot is None:
+            slot = archs.get(None)
+
+        return slot
+
+    def _index_add(self, item, slot):
+        self._index.setdefault(item.name, {})[item.arch] = slot
+
+    def _index_remove(self, item, slot):
+        archs = self._index[item.name]
+        del archs[item.arch]
+
+        if not archs:
+            del self._index[item.name]
+
     def add(self, item):
-        if item not in self._set:
-            self._set.append(item)
+        slot = self._find(item)
+
+        if slot is None:
+            self._insert(item)
 
         # add if new package has more explicit arch definition than existing
-        elif item.arch is not None:
-            for i, x in enumerate(self._set):
-                if x.name == item.name and x.arch is None:
-                    self._set[i] = item
+        elif item.arch is not None and self._set[slot].arch is None:
+            self._replace(slot, item)
+
+    def find(self, name):
+        """ Return all packages of the specified name in insertion order """
+        archs = self._index.get(name, {})
 
+        return [self._set[slot] for slot in sorted(archs.values())]
@@ -0,0 +1,219 @@
+#
+# Copyright (C) 2013-2016   Ian Firns   <firnsy@kororaproject.org>
+#                           Chris Smart <csmart@kororaproject.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import hashlib
+import json
+import logging
+import os
+
+from canvas.cache import write_atomic
+
+
+def pkg_nevra(pkg):
+    """ Return the full name-epoch:version-release.arch of a DNF package. """
+    return '{0}-{1}:{2}-{3}.{4}'.format(pkg.name, pkg.epoch, pkg.version, pkg.release, pkg.arch)
+
+
+def repo_checksum(repo):
+    """
+    Return the sha256 of the loaded repomd.xml of a DNF repo, or None if the
+    repo metadata can't be read.
+    """
+    paths = []
+
+    metadata = getattr(repo, 'metadata', None)
+
+    if getattr(metadata, 'repomd_fn', None):
+        paths.append(metadata.repomd_fn)
+
+    cachedir = getattr(repo, 'cachedir', None)
+
+    if cachedir:
+        paths.append(os.path.join(cachedir, 'repodata', 'repomd.xml'))
+
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                return hashlib.sha256(f.read()).hexdigest()
+
+        except (IOError, OSError):
+            pass
+
+    return None
+
+
+def rpmdb_checksum(db):
+    """ Return a checksum of the packages installed on the system. """
+    nevras = sorted(pkg_nevra(p) for p in db.sack.query().installed())
+
+    return hashlib.sha256('\n'.join(nevras).encode('utf-8')).hexdigest()
+
+
+def template_fingerprint(template):
+    """
+    Return a checksum of the template content that determines the package
+    transaction, ie. its resolved packages and repos.
+    """
+    content = {
+        'packages': sorted([p.to_object() for p in template.packages_all], key=lambda p: json.dumps(p, sort_keys=True)),
+        'repos':    sorted([r.to_object() for r in template.repos_all], key=lambda r: json.dumps(r, sort_keys=True)),
+    }
+
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class TransactionPlan(object):
+    """
+    A resolved package transaction that can be saved and applied later, or
+    on another identical machine, without resolving it again.
+
+    A plan is keyed by the template fingerprint, the checksums of the repo
+    metadata and the state of the rpmdb it was resolved against, and is only
+    applied when all of them still match.
+    """
+
+    VERSION = 1
+
+    def __init__(self, fingerprint, repos, rpmdb, install=None, remove=None):
+        self.fingerprint = fingerprint
+        self.repos = repos
+        self.rpmdb = rpmdb
+        self.install = install or []
+        self.remove = remove or []
+
+    @classmethod
+    def from_transaction(cls, template, db):
+        """
+        Create the plan of the transaction resolved for the template.
+
+        Args:
+          template: Template the transaction was prepared for.
+          db: dnf.Base holding the resolved transaction.
+
+        Returns:
+          TransactionPlan
+        """
+        tx = db.transaction
+
+        return cls(
+            template_fingerprint(template),
+            {r.id: repo_checksum(r) for r in db.repos.iter_enabled()},
+            rpmdb_checksum(db),
+            sorted(pkg_nevra(p) for p in tx.install_set) if tx is not None else [],
+            sorted(pkg_nevra(p) for p in tx.remove_set) if tx is not None else []
+        )
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a plan from file.
+
+        Raises:
+          IOError: An error occurred reading the file.
+          ValueError: The file is not a valid plan.
+        """
+        with open(path, 'r') as f:
+            obj = json.load(f)
+
+        if not isinstance(obj, dict) or obj.get('version') != cls.VERSION:
+            raise ValueError('unsupported transaction plan')
+
+        try:
+            return cls(obj['fingerprint'], obj['repos'], obj['rpmdb'], obj['install'], obj['remove'])
+
+        except KeyError as e:
+            raise ValueError('transaction plan is missing {0}'.format(e))
+
+    def save(self, path):
+        """ Save the plan to file. """
+        write_atomic(path, (json.dumps(self.to_object(), indent=2, sort_keys=True) + '\n').encode('utf-8'))
+
+    def to_object(self):
+        return {
+            'version':     self.VERSION,
+            'fingerprint': self.fingerprint,
+            'repos':       self.repos,
+            'rpmdb':       self.rpmdb,
+            'install':     self.install,
+            'remove':      self.remove,
+        }
+
+    def matches(self, template, db):
+        """
+        Check the plan was resolved for the template against the repo
+        metadata and rpmdb state of the filled dnf.Base.
+
+        Returns:
+          True if the plan can be applied, False otherwise.
+        """
+        if self.fingerprint != template_fingerprint(template):
+            logging.debug('Transaction plan is for different template content.')
+            return False
+
+        repos = {r.id: repo_checksum(r) for r in db.repos.iter_enabled()}
+
+        if None in repos.values() or repos != self.repos:
+            logging.debug('Transaction plan is for different repo metadata.')
+            return False
+
+        if self.rpmdb != rpmdb_checksum(db):
+            logging.debug('Transaction plan is for a different rpmdb state.')
+            return False
+
+        return True
+
+    def apply(self, template, db):
+        """
+        Mark the planned installs and removals on the filled dnf.Base if the
+        plan matches the system. The goal is left untouched otherwise.
+
+        Returns:
+          True if the plan was applied, False otherwise.
+        """
+        if not self.matches(template, db):
+            return False
+
+        install = self._find(db.sack.query().available(), self.install)
+        remove = self._find(db.sack.query().installed(), self.remove)
+
+        if install is None or remove is None:
+            logging.debug('Transaction plan packages are no longer available.')
+            return False
+
+        for p in install:
+            db.package_install(p)
+
+        for p in remove:
+            db.package_remove(p)
+
+        return True
+
+    def _find(self, query, nevras):
+        """ Return the packages of the query matching nevras exactly, or None
+        if any are missing. """
+        if not len(nevras):
+            return []
+
+        names = list(set(n.rsplit('-', 2)[0] for n in nevras))
+        found = {pkg_nevra(p): p for p in query.filter(name=names)}
+
+        try:
+            return [found[n] for n in nevras]
+
+        except KeyError:
+            return None
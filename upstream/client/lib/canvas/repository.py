@@ -16,9 +16,9 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-import dnf
 import json
 
+from canvas.dnfcontext import dnf_context, dnf_isinstance
 from canvas.set import CanvasSet
 
 class Repository(object):
@@ -33,7 +33,7 @@ class Repository(object):
         if isinstance(repository, str):
             repository = Repository.parse_str(repository, template=template)
 
-        elif isinstance(repository, dnf.repo.Repo):
+        elif dnf_isinstance(repository, 'dnf.repo.Repo'):
             repository = Repository.parse_dnf(repository, template=template)
 
         if not isinstance(repository, dict):
@@ -196,7 +196,7 @@ class Repository(object):
     @classmethod
     def parse_dnf(cls, repository, template=None):
 
-        if not isinstance(repository, dnf.repo.Repo):
+        if not dnf_isinstance(repository, 'dnf.repo.Repo'):
             raise TypeError("Repository must be a dnf.repo.Repo")
 
 
@@ -405,18 +405,23 @@ class Repository(object):
         return {k: v for k, v in o.items() if v != None}
 
     def to_repo(self, conf=None):
+        import dnf.repo
+
         if conf is None:
-            db = dnf.Base()
-            conf = db.conf
-            conf.cachedir = '/var/tmp'
+            cachedir = '/var/tmp'
+            subs = dnf_context().substitutions()
+
+        else:
+            cachedir = conf.cachedir
+            subs = conf.substitutions
 
-        def _varSub(option, subs=conf.substitutions):
+        def _varSub(option, subs=subs):
             for (k, v) in subs.items():
                 option = option.replace('${0}'.format(k), v)
 
             return option
 
-        r = dnf.repo.Repo('canvas-{0}'.format(self._stub), conf.cachedir)
+        r = dnf.repo.Repo('canvas-{0}'.format(self._stub), cachedir)
 
         if self._name is not None:
             r.name = self._name
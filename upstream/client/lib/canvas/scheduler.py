@@ -0,0 +1,222 @@
+#
+# Copyright (C) 2013-2016   Ian Firns   <firnsy@kororaproject.org>
+#                           Chris Smart <csmart@kororaproject.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import concurrent.futures
+import logging
+import os
+import queue
+import threading
+
+from canvas.download import Downloader, DownloadException
+from canvas.object import Object
+
+
+def paths_overlap(a, b):
+    """ Check if either path is the same as, or within, the other. """
+    a = os.path.normpath(a).rstrip('/') + '/'
+    b = os.path.normpath(b).rstrip('/') + '/'
+
+    return a.startswith(b) or b.startswith(a)
+
+
+class ObjectScheduler(object):
+    """
+    Applies the actions of template objects concurrently, starting each
+    object as soon as it's available (ie. downloaded and verified) whilst
+    preserving the ordering between dependent objects.
+
+    An object is applied after an earlier object (in template order) if
+    either has execute actions, as their effects are unknown, or if the
+    paths their copy and extract actions write to overlap. An object is also
+    applied after any objects named in its after field.
+    """
+
+    ACTIONS_EXECUTE = ['execute', 'execute-command']
+    ACTIONS_PATH = ['copy', 'extract']
+
+    def __init__(self, objects, workers=4):
+        self._objects = list(objects)
+        self._workers = workers
+
+        self._deps = self._dependencies()
+
+    def _dependencies(self):
+        """
+        Return a list of the set of objects (as indices) each object must be
+        applied after.
+
+        Raises:
+          ValueError: The after fields of the objects form a cycle.
+        """
+        names = {}
+        barriers = []
+        paths = []
+
+        for (i, o) in enumerate(self._objects):
+            names.setdefault(o.name, []).append(i)
+
+            actions = [a for a in o.actions if a['type'] not in Object.ACTIONS_KS_ONLY]
+
+            barriers.append(any(a['type'] in self.ACTIONS_EXECUTE for a in actions))
+            paths.append([a['path'] for a in actions if a['type'] in self.ACTIONS_PATH and a.get('path')])
+
+        deps = []
+
+        for (i, o) in enumerate(self._objects):
+            d = set()
+
+            for j in range(i):
+                if barriers[i] or barriers[j] or \
+                    any(paths_overlap(p, q) for p in paths[i] for q in paths[j]):
+                    d.add(j)
+
+            for name in o.after:
+                if name not in names:
+                    logging.warning('Object {0} is applied after unknown object {1}'.format(o.name, name))
+                    continue
+
+                d.update(j for j in names[name] if j != i)
+
+            deps.append(d)
+
+        # explicit ordering may contradict the implicit ordering
+        resolved = set()
+        remaining = set(range(len(deps)))
+
+        while remaining:
+            ready = set(i for i in remaining if deps[i] <= resolved)
+
+            if not ready:
+                cycle = ', '.join(sorted(set(self._objects[i].name for i in remaining)))
+                raise ValueError('object ordering cycle detected between: {0}'.format(cycle))
+
+            resolved |= ready
+            remaining -= ready
+
+        return deps
+
+    def _apply(self, i, events):
+        o = self._objects[i]
+
+        try:
+            logging.info('Applying: {0}'.format(o.name))
+            o.apply_actions()
+
+        except Exception as e:
+            events.put(('applied', i, e))
+            return
+
+        events.put(('applied', i, None))
+
+    def dependencies(self, i):
+        """ Return the set of objects (as indices) object i is applied after. """
+        return set(self._deps[i])
+
+    def run(self, downloader=None):
+        """
+        Download and apply all objects. Objects depending on an object that
+        fails to download or apply are skipped, all others are applied.
+
+        Args:
+          downloader: Downloader used to fetch objects.
+
+        Raises:
+          DownloadException: An object could not be downloaded.
+          Exception: The first error raised applying an object.
+        """
+        if downloader is None:
+            downloader = Downloader()
+
+        events = queue.Queue()
+        index = {id(o): i for (i, o) in enumerate(self._objects)}
+
+        external = [o for o in self._objects if o.source != 'raw']
+        available = set(i for (i, o) in enumerate(self._objects) if o.source == 'raw')
+
+        started = set()
+        finished = set()
+        failed = set()
+        errors = []
+
+        def download():
+            try:
+                downloader.download(external, on_complete=lambda o: events.put(('available', index[id(o)], None)))
+
+            except DownloadException as e:
+                events.put(('downloaded', None, e))
+                return
+
+            events.put(('downloaded', None, None))
+
+        def schedule(pool):
+            # skip everything depending on a failed object
+            changed = True
+
+            while changed:
+                changed = False
+
+                for i in range(len(self._objects)):
+                    if i not in failed and i not in started and self._deps[i] & failed:
+                        logging.error('Skipping {0} as an object it depends on failed'.format(self._objects[i].name))
+                        failed.add(i)
+                        changed = True
+
+            for i in range(len(self._objects)):
+                if i in available and i not in started and i not in failed and self._deps[i] <= finished:
+                    started.add(i)
+                    pool.submit(self._apply, i, events)
+
+        thread = threading.Thread(target=download)
+        thread.daemon = True
+        thread.start()
+
+        downloading = True
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self._workers) as pool:
+            schedule(pool)
+
+            while downloading or (started - finished - failed):
+                (event, i, error) = events.get()
+
+                if event == 'available':
+                    available.add(i)
+
+                elif event == 'downloaded':
+                    downloading = False
+
+                    if error is not None:
+                        errors.append(error)
+
+                    # objects that never became available failed to download
+                    failed.update(j for j in range(len(self._objects)) if j not in available)
+
+                elif event == 'applied':
+                    if error is None:
+                        finished.add(i)
+
+                    else:
+                        logging.error('Unable to apply {0}: {1}'.format(self._objects[i].name, error))
+                        failed.add(i)
+                        errors.append(error)
+
+                schedule(pool)
+
+        thread.join()
+
+        if errors:
+            raise errors[0]
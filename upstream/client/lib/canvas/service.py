@@ -16,15 +16,22 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 import codecs
+import concurrent.futures
 import getpass
+import gzip
 import hmac
 import http.cookiejar
 import json
 import logging
+import os
+import threading
+import time
 import urllib.request, urllib.parse, urllib.error
 
+from canvas.cache import TemplateCache, UUIDCache, host_cache_dir, write_atomic
 from canvas.template import Template
 from canvas.machine import Machine
+from canvas.transport import ConnectionPool, build_opener
 
 
 class ServiceException(Exception):
@@ -39,100 +46,115 @@ class ServiceException(Exception):
         return 'error: {0}'.format(str(self.reason))
 
 
-class Service(object):
-    def __init__(self, host='https://canvas.kororaproject.org', username=None):
-        self._host = host
-        self._urlbase = host
+class FeatureProcessor(urllib.request.BaseHandler):
+    """ Records the optional wire features advertised by the canvas server. """
 
-        self._username = username
+    def __init__(self, features):
+        self._features = features
 
-        self._cookiejar = http.cookiejar.LWPCookieJar('/tmp/.canvas-session')
-        self._opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self._cookiejar))
+    def http_response(self, req, response):
+        advertised = response.headers.get('X-Canvas-Features')
 
-        self._authenticated = False
+        if advertised is not None:
+            self._features.update(advertised.split())
 
-    def _template_data_get(self, template):
-        if not isinstance(template, Template):
-            TypeError('template is not of type Template')
+        return response
 
-        query = {
-            'user':    template.user,
-            'name':    template.name,
-            'version': template.version
-        }
-
-        query = {k: v for k, v in query.items() if v != None}
+    https_response = http_response
 
-        r = urllib.request.Request('%s/api/templates.json?%s' % (self._urlbase, urllib.parse.urlencode(query)))
 
-        logging.debug('Fetching template from {0}'.format(r.full_url))
+class Service(object):
+    def __init__(self, host='https://canvas.kororaproject.org', username=None, include_workers=8,
+            timeout=60, connect_timeout=10, connections_per_host=4, cache_dir=None, uuid_ttl=86400,
+            offline=False, session_path='/tmp/.canvas-session', session_ttl=3600, compact=False):
+        self._host = host
+        self._urlbase = host
 
-        try:
-            u = self._opener.open(r)
-            template_summary = json.loads(u.read().decode('utf-8'))
+        self._username = username
 
-            # nothing returned, so authenticate and retry
-            if len(template_summary) == 0 and not self._authenticated:
-                self.authenticate()
+        # offline services only read previously fetched templates from cache
+        self._offline = offline
 
-                u = self._opener.open(r)
-                template_summary = json.loads(u.read().decode('utf-8'))
+        # per host cache of user:name[@version] to uuid lookups
+        self._cache_dir = host_cache_dir(host, cache_dir)
+        self._uuids = UUIDCache(os.path.join(self._cache_dir, 'uuids.json'), ttl=uuid_ttl)
 
-            if len(template_summary):
-                # we only have one returned since template names are unique per account
-                r = urllib.request.Request('{0}/api/template/{1}.json'.format(self._urlbase,
-                        template_summary[0]['uuid']))
-                u = self._opener.open(r)
-                data = json.loads(u.read().decode('utf-8'))
+        # per host cache of raw template json revalidated on each fetch
+        self._templates = TemplateCache(os.path.join(self._cache_dir, 'templates'))
 
-                return Template(template=data)
+        # all requests share a pool of keep-alive connections
+        self._pool = ConnectionPool(
+            connections_per_host=connections_per_host,
+            connect_timeout=connect_timeout,
+            timeout=timeout
+        )
 
-            raise ServiceException('unable to get template')
+        self._cookiejar = http.cookiejar.LWPCookieJar(session_path)
+        self._cookies_loaded = False
 
-        except urllib.error.URLError as e:
-            # TODO: clean up error message
-            logging.debug(e)
-            raise ServiceException('unknown service response')
+        # optional features (ie. gzip request bodies) are only used once the
+        # server has advertised them
+        self._features = set()
+        self._compact = compact
 
-        except urllib.error.HTTPError as e:
-            # TODO: clean up error message
-            logging.debug(e)
-            raise ServiceException('unknown service response')
+        self._opener = build_opener(
+            self._pool,
+            urllib.request.HTTPCookieProcessor(self._cookiejar),
+            FeatureProcessor(self._features)
+        )
 
-    def _template_resolve_includes(self, template_src):
-        if not template_src.includes:
-            return template_src
+        # session expiry is saved alongside the cookie, the ttl applies when
+        # the session cookie has no expiry of its own
+        self._session_expiry_path = session_path + '.expires'
+        self._session_ttl = session_ttl
 
-        for i in template_src.includes:
-            data = self._template_data_get(Template(i))
-            data_resolv = self._template_resolve_includes(data)
+        self._authenticated = False
+        self._auth_expires = 0
+        self._auth_verified = False
+        self._auth_lock = threading.RLock()
 
-            data_resolv._flatten()
+        # etag of each template fetched, keyed by uuid
+        self._etags = {}
 
-            template_src._includes_resolved.append(data_resolv)
+        # maximum concurrent fetches when resolving template includes
+        self._include_workers = include_workers
 
-        template_src._flatten()
-        return template_src
+    def _authenticate(self, username=None, password=None, prompt=None, force=False):
+        if self._authenticated and not force and time.time() < self._auth_expires:
+            return self._authenticated
 
-    def authenticate(self, username=None, password=None, prompt=None, force=False):
         logging.debug('Authenticating to {0}'.format(self._urlbase))
 
-        if self._authenticated and not force:
-            return self._authenticated
-
         # load any saved cookies
-        try:
-            self._cookiejar.load()
+        if not self._cookies_loaded:
+            try:
+                self._cookiejar.load()
 
-        except Exception as e:
-            pass
+            except Exception as e:
+                pass
+
+            self._cookies_loaded = True
+
+        # trust a saved session until it expires, a rejected request will
+        # force re-authentication
+        if not force:
+            expires = self._session_load_expiry()
+
+            if expires > time.time():
+                logging.debug('Using saved session valid until {0}'.format(time.ctime(expires)))
+
+                self._authenticated = True
+                self._auth_expires = expires
+                self._auth_verified = False
+
+                return self._authenticated
 
         # detect if we've got a valid session cookie
         try:
             r = urllib.request.Request('{0}/authorised.json'.format(self._urlbase))
             u = self._opener.open(r)
 
-            self._authenticated = True
+            self._session_save()
 
             return self._authenticated
 
@@ -141,7 +163,7 @@ class Service(object):
         except urllib.error.HTTPError as e:
             pass
 
-        self._authenticated = False
+        self._session_clear()
 
         # set default user
         if username is None:
@@ -159,8 +181,7 @@ class Service(object):
             r = urllib.request.Request('{0}/authenticate.json'.format(self._urlbase), auth)
             u = self._opener.open(r)
 
-            self._cookiejar.save()
-            self._authenticated = True
+            self._session_save()
 
             return self._authenticated
 
@@ -171,8 +192,438 @@ class Service(object):
 
         raise ServiceException('unable to authenticate')
 
+    def _offline_get(self, kind, obj):
+        """
+        Retrieves a previously fetched template from the cache without
+        contacting the server.
+
+        Args:
+          kind: either 'template' or 'machine'.
+          obj: Template or Machine to retrieve.
+
+        Returns:
+          The decoded JSON of the cached template.
+
+        Raises:
+          ServiceException: The object is not available offline.
+        """
+        if kind != 'template':
+            raise ServiceException('{0}s are not available in offline mode'.format(kind))
+
+        uuid = self._uuids.get(kind, obj.unv, expire=False)
+        cached = self._templates.get(uuid) if uuid is not None else None
+
+        if cached is None:
+            raise ServiceException('template {0} has not been fetched for offline use'.format(obj.unv))
+
+        return json.loads(cached[0].decode('utf-8'))
+
+    def _open(self, r):
+        """
+        Opens a request, re-authenticating and retrying once if the server
+        rejects our session.
+
+        A 403 is only retried when the session was assumed valid from the
+        saved session expiry, otherwise it indicates insufficient privileges.
+        """
+        try:
+            return self._opener.open(r)
+
+        except urllib.error.HTTPError as e:
+            if not (e.code == 401 or (e.code == 403 and self._authenticated and not self._auth_verified)):
+                raise
+
+            logging.debug('Session rejected ({0}), re-authenticating'.format(e.code))
+
+        self.authenticate(force=True)
+
+        # drop the rejected session cookie so the new one is sent
+        r.remove_header('Cookie')
+
+        return self._opener.open(r)
+
+    def _session_clear(self):
+        """ Forgets the current session, both in memory and on disk. """
+        self._authenticated = False
+        self._auth_expires = 0
+        self._auth_verified = False
+
+        expiry = self._session_read_expiry()
+
+        if expiry.pop(self._urlbase, None) is not None:
+            self._session_write_expiry(expiry)
+
+    def _session_load_expiry(self):
+        """ Returns the saved session expiry for the host, or 0 if unknown. """
+        return self._session_read_expiry().get(self._urlbase, 0)
+
+    def _session_read_expiry(self):
+        try:
+            with open(self._session_expiry_path, 'r') as f:
+                return json.load(f)
+
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _session_save(self):
+        """
+        Records a verified session, saving the session cookie along with the
+        time it expires so later invocations can skip verifying it.
+        """
+        now = time.time()
+
+        # expire with the earliest expiring cookie, allowing some slack for
+        # requests in flight
+        expires = [c.expires for c in self._cookiejar if c.expires is not None]
+        expires = min(expires) - 60 if expires else now + self._session_ttl
+
+        self._authenticated = True
+        self._auth_expires = expires
+        self._auth_verified = True
+
+        try:
+            self._cookiejar.save()
+
+        except (IOError, OSError) as e:
+            logging.debug('Unable to save session: {0}'.format(e))
+            return
+
+        expiry = self._session_read_expiry()
+        expiry[self._urlbase] = expires
+
+        self._session_write_expiry(expiry)
+
+    def _session_write_expiry(self, expiry):
+        try:
+            write_atomic(self._session_expiry_path, json.dumps(expiry).encode('utf-8'))
+
+        except (IOError, OSError) as e:
+            logging.debug('Unable to save session expiry: {0}'.format(e))
+
+    def _summary_uuid(self, kind, obj):
+        """
+        Searches for the UUID of a template or machine, caching the result.
+
+        Args:
+          kind: either 'template' or 'machine'.
+          obj: Template or Machine to search for.
+
+        Returns:
+          The UUID or None if no match was found.
+
+        Raises:
+          urllib.error.URLError: The search request failed.
+        """
+        query = {
+            'user':    obj.user,
+            'name':    obj.name,
+            'version': obj.version
+        }
+
+        query = {k: v for k, v in query.items() if v != None}
+
+        r = urllib.request.Request('{0}/api/{1}s.json?{2}'.format(self._urlbase, kind, urllib.parse.urlencode(query)))
+
+        logging.debug('Searching for {0} at {1}'.format(kind, r.full_url))
+
+        u = self._open(r)
+        summary = json.loads(u.read().decode('utf-8'))
+
+        # nothing returned, so authenticate and retry
+        if len(summary) == 0 and not self._authenticated:
+            self.authenticate()
+
+            u = self._open(r)
+            summary = json.loads(u.read().decode('utf-8'))
+
+        if not len(summary):
+            return None
+
+        # we only have one returned since names are unique per account
+        uuid = summary[0]['uuid']
+        self._uuids.set(kind, obj.unv, uuid)
+
+        return uuid
+
+    def _uuid_request(self, kind, obj, method='GET'):
+        """
+        Performs a request against a template or machine by UUID, using the
+        cached UUID where available and falling back to a search when the
+        cached UUID is unknown to the server.
+
+        Args:
+          kind: either 'template' or 'machine'.
+          obj: Template or Machine to request.
+          method: HTTP method of the request.
+
+        Returns:
+          The decoded JSON response or None if no match was found.
+
+        Raises:
+          ServiceException: The request is not possible in offline mode.
+          urllib.error.URLError: The request failed.
+        """
+        if self._offline:
+            if method != 'GET':
+                raise ServiceException('unable to modify {0}s in offline mode'.format(kind))
+
+            return self._offline_get(kind, obj)
+
+        def request(uuid):
+            r = urllib.request.Request('{0}/api/{1}/{2}.json'.format(self._urlbase, kind, uuid))
+            r.get_method = lambda: method
+
+            if kind == 'template' and method == 'GET':
+                return json.loads(self._template_cached_request(r, uuid).decode('utf-8'))
+
+            u = self._open(r)
+
+            if method == 'DELETE':
+                self._uuids.discard(kind, obj.unv)
+
+                if kind == 'template':
+                    self._templates.discard(uuid)
+
+            return json.loads(u.read().decode('utf-8'))
+
+        uuid = self._uuids.get(kind, obj.unv)
+
+        if uuid is not None:
+            try:
+                return request(uuid)
+
+            except urllib.error.HTTPError as e:
+                logging.debug('Cached {0} uuid {1} failed: {2}'.format(kind, uuid, e))
+
+                if e.code == 404:
+                    self._uuids.discard(kind, obj.unv)
+
+        uuid = self._summary_uuid(kind, obj)
+
+        if uuid is None:
+            return None
+
+        return request(uuid)
+
+    def _template_cached_request(self, r, uuid):
+        """
+        Performs a template GET request, revalidating any cached copy of the
+        template with a conditional request.
+
+        Args:
+          r: urllib.request.Request for the template.
+          uuid: UUID of the template.
+
+        Returns:
+          The raw template JSON, either fresh from the server or from the
+          cache if the server indicates it is unchanged.
+
+        Raises:
+          urllib.error.URLError: The request failed.
+        """
+        if self._compact:
+            r.add_header('X-Canvas-Packages', 'columnar')
+
+        cached = self._templates.get(uuid)
+
+        if cached is not None:
+            (data, validators) = cached
+
+            if validators.get('etag'):
+                r.add_header('If-None-Match', validators['etag'])
+
+            if validators.get('last_modified'):
+                r.add_header('If-Modified-Since', validators['last_modified'])
+
+        try:
+            u = self._open(r)
+
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and cached is not None:
+                logging.debug('Template {0} unchanged, using cached copy'.format(uuid))
+
+                self._etags[uuid] = validators.get('etag')
+
+                return data
+
+            raise
+
+        data = u.read()
+        self._templates.set(uuid, data, etag=u.headers.get('ETag'), last_modified=u.headers.get('Last-Modified'))
+
+        # remember the version fetched to guard later updates
+        self._etags[uuid] = u.headers.get('ETag')
+
+        return data
+
+    def _template_request(self, url, obj, method='POST'):
+        """
+        Builds a request uploading a template (or template delta), using gzip
+        compression where supported by the server.
+        """
+        data = json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+        r = urllib.request.Request(url)
+        r.get_method = lambda: method
+
+        if 'gzip' in self._features and len(data) > 1024:
+            data = gzip.compress(data)
+            r.add_header('Content-Encoding', 'gzip')
+
+        r.add_header('Content-Type', 'application/json')
+        r.data = data
+
+        return r
+
+    @property
+    def _upload_compact(self):
+        """ Whether uploads use the compact columnar package encoding. """
+        return self._compact and 'packages-columnar' in self._features
+
+    def _template_data_get(self, template):
+        if not isinstance(template, Template):
+            TypeError('template is not of type Template')
+
+        try:
+            data = self._uuid_request('template', template)
+
+            if data is not None:
+                return Template(template=data)
+
+            raise ServiceException('unable to get template')
+
+        except urllib.error.URLError as e:
+            # TODO: clean up error message
+            logging.debug(e)
+            raise ServiceException('unknown service response')
+
+        except urllib.error.HTTPError as e:
+            # TODO: clean up error message
+            logging.debug(e)
+            raise ServiceException('unknown service response')
+
+        except ValueError as e:
+            logging.debug(e)
+            raise ServiceException('invalid template response')
+
+    def _template_fetch_includes(self, template_src):
+        """
+        Fetches the include graph of a template. Each distinct include is
+        fetched once, with independent includes fetched concurrently.
+
+        Args:
+          template_src: Template whose includes are to be fetched.
+
+        Returns:
+          Dictionary of normalised include UNV to the fetched (unresolved)
+          Template.
+
+        Raises:
+          ServiceException: An include could not be fetched.
+        """
+        templates = {}
+
+        if template_src.unv is not None:
+            templates[template_src.unv] = template_src
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self._include_workers) as pool:
+            pending = {}
+
+            def fetch(owner):
+                for i in owner.includes:
+                    unv = self._template_include_unv(owner, i)
+
+                    if unv not in templates and unv not in pending.values():
+                        pending[pool.submit(self._template_data_get, Template(unv))] = unv
+
+            fetch(template_src)
+
+            while pending:
+                done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+
+                for f in done:
+                    unv = pending.pop(f)
+                    t = f.result()
+
+                    templates[unv] = t
+                    fetch(t)
+
+        return templates
+
+    def _template_include_unv(self, owner, include):
+        """
+        Returns the include as a user:name[@version] UNV, where includes
+        without a user belong to the user of the including template. The
+        same include is therefore always known by the same UNV.
+        """
+        return Template(include, user=owner.user).unv
+
+    def _template_resolve_includes(self, template_src):
+        """
+        Resolves all includes of a template, flattening each include once in
+        topological order (ie. an include is flattened before any template
+        that includes it).
+
+        Args:
+          template_src: Template whose includes are to be resolved.
+
+        Returns:
+          The supplied template with all includes resolved and flattened.
+
+        Raises:
+          ServiceException: An include could not be fetched or an include
+                            cycle was detected.
+        """
+        if not template_src.includes:
+            return template_src
+
+        templates = self._template_fetch_includes(template_src)
+
+        resolved = set()
+        visiting = []
+
+        def resolve(t, unv):
+            if unv in resolved:
+                return
+
+            if unv in visiting:
+                cycle = visiting[visiting.index(unv):] + [unv]
+                raise ServiceException('template include cycle detected: {0}'.format(' -> '.join(cycle)))
+
+            visiting.append(unv)
+
+            includes = [self._template_include_unv(t, i) for i in t.includes]
+
+            for i in includes:
+                resolve(templates[i], i)
+
+            visiting.pop()
+
+            t._includes_resolved = [templates[i] for i in includes]
+            t._flatten()
+
+            resolved.add(unv)
+
+        resolve(template_src, template_src.unv)
+
+        return template_src
+
+    def authenticate(self, username=None, password=None, prompt=None, force=False):
+        if self._offline:
+            raise ServiceException('unable to authenticate in offline mode')
+
+        # serialise authentication as includes are fetched concurrently
+        with self._auth_lock:
+            return self._authenticate(username, password, prompt, force)
+
+    def close(self):
+        """
+        Closes all idle connections to the canvas server.
+        """
+        self._pool.close()
+
     def deauthenticate(self, username='', password='', force=False):
-        if not self._authenticated and not force:
+        if self._offline or (not self._authenticated and not force):
             return self._authenticated
 
         try:
@@ -184,8 +635,7 @@ class Service(object):
         except urllib.error.HTTPError as e:
             logging.debug(e)
 
-        #
-        self._authenticated = False
+        self._session_clear()
 
         return self._authenticated
 
@@ -200,7 +650,7 @@ class Service(object):
 
         try:
             r = urllib.request.Request('{0}/api/machines.json'.format(self._urlbase), machine.to_json().encode('utf-8'))
-            u = self._opener.open(r)
+            u = self._open(r)
             res = json.loads(u.read().decode('utf-8'))
 
             return res
@@ -219,23 +669,13 @@ class Service(object):
         if not isinstance(machine, Machine):
             TypeError('machine is not of type Machine')
 
-        query = {'user': machine.user, 'name': machine.name}
-
         # always auth
         self.authenticate()
 
         try:
-            r = urllib.request.Request('{0}/api/machines.json?{1}'.format(self._urlbase, urllib.parse.urlencode(query)))
-            u = self._opener.open(r)
-
-            machine_summary = json.loads(u.read().decode('utf-8'))
-
-            if len(machine_summary):
-                r = urllib.request.Request('{0}/api/machine/{1}.json'.format(self._urlbase, machine_summary[0]['uuid']))
-                r.get_method = lambda: 'DELETE'
-                u = self._opener.open(r)
-                res = json.loads(u.read().decode('utf-8'))
+            res = self._uuid_request('machine', machine, method='DELETE')
 
+            if res is not None:
                 return res
 
         except urllib.error.URLError as e:
@@ -252,33 +692,10 @@ class Service(object):
         if not isinstance(machine, Machine):
             TypeError('machine is not of type Machine')
 
-        query = {
-            'user':    machine.user,
-            'name':    machine.name,
-            'version': machine.version
-        }
-
-        query = {k: v for k, v in query.items() if v != None}
-
-        r = urllib.request.Request('{0}/api/machines.json?{1}'.format(self._urlbase, urllib.parse.urlencode(query)))
-
         try:
-            u = self._opener.open(r)
-            machine_summary = json.loads(u.read().decode('utf-8'))
-
-            # nothing returned, so authenticate and retry
-            if len(machine_summary) == 0 and not self._authenticated:
-                self.authenticate()
-
-                u = self._opener.open(r)
-                machine_summary = json.loads(u.read().decode('utf-8'))
-
-            if len(machine_summary):
-                # we only have one returned since machine names are unique per account
-                r = urllib.request.Request('{0}/api/machine/{1}.json'.format(self._urlbase, machine_summary[0]['uuid']))
-                u = self._opener.open(r)
-                data = json.loads(u.read().decode('utf-8'))
+            data = self._uuid_request('machine', machine)
 
+            if data is not None:
                 return Machine(machine=data)
 
             raise ServiceException('unable to get machine')
@@ -305,7 +722,7 @@ class Service(object):
 
         try:
             r = urllib.request.Request('{0}/api/machines.json?{1}'.format(self._urlbase, params))
-            u = self._opener.open(r)
+            u = self._open(r)
 
             res = json.loads(u.read().decode('utf-8'))
 
@@ -343,7 +760,7 @@ class Service(object):
             elif isinstance(template, str):
                 r.add_header('x-canvas-template', template)
 
-            u = self._opener.open(r)
+            u = self._open(r)
             res = json.loads(u.read().decode('utf-8'))
 
             return res
@@ -368,7 +785,7 @@ class Service(object):
         try:
             r = urllib.request.Request('{0}/api/machine/{1}.json'.format(self._urlbase, machine.uuid), machine.to_json().encode('utf-8'))
             r.get_method = lambda: 'PUT'
-            u = self._opener.open(r)
+            u = self._open(r)
             res = json.loads(u.read().decode('utf-8'))
 
             return res
@@ -393,8 +810,8 @@ class Service(object):
         self.authenticate()
 
         try:
-            r = urllib.request.Request('{0}/api/templates.json'.format(self._urlbase), template.to_json().encode('utf-8'))
-            u = self._opener.open(r)
+            r = self._template_request('{0}/api/templates.json'.format(self._urlbase), template.to_object(compact=self._upload_compact))
+            u = self._open(r)
             res = json.loads(u.read().decode('utf-8'))
 
             return res
@@ -416,19 +833,10 @@ class Service(object):
         # always auth
         self.authenticate()
 
-        query = {'user': template.user, 'name': template.name}
-        r = urllib.request.Request('%s/api/templates.json?%s' % (self._urlbase, urllib.parse.urlencode(query)))
-
         try:
-            u = self._opener.open(r)
-            template_summary = json.loads(u.read().decode('utf-8'))
-
-            if len(template_summary):
-                r = urllib.request.Request('%s/api/template/%s.json' % (self._urlbase, template_summary[0]['uuid']))
-                r.get_method = lambda: 'DELETE'
-                u = self._opener.open(r)
-                res = json.loads(u.read().decode('utf-8'))
+            res = self._uuid_request('template', template, method='DELETE')
 
+            if res is not None:
                 return res
 
         except urllib.error.URLError as e:
@@ -446,7 +854,7 @@ class Service(object):
             TypeError('template is not of type Template')
 
         # check of force auth
-        if auth:
+        if auth and not self._offline:
             self.authenticate()
 
         template = self._template_data_get(template)
@@ -464,6 +872,9 @@ class Service(object):
             'description': description
         }
 
+        if self._offline:
+            raise ServiceException('unable to list templates in offline mode')
+
         # Public templates do not require authentication
         if not public:
             self.authenticate()
@@ -472,7 +883,7 @@ class Service(object):
 
         try:
             r = urllib.request.Request('{0}/api/templates.json?{1}'.format(self._urlbase, params))
-            u = self._opener.open(r)
+            u = self._open(r)
 
             res = json.loads(u.read().decode('utf-8'))
 
@@ -495,15 +906,42 @@ class Service(object):
         # always auth
         self.authenticate()
 
+        url = '{0}/api/template/{1}.json'.format(self._urlbase, template.uuid)
+
+        # only send the changes when the server supports it and we know the
+        # version of the template they apply to
+        etag = self._etags.get(template.uuid)
+        delta = None
+
+        if etag is not None and 'template-patch' in self._features:
+            delta = template.to_delta(compact=self._upload_compact)
+
         try:
-            r = urllib.request.Request('{0}/api/template/{1}.json'.format(self._urlbase, template.uuid), template.to_json().encode('utf-8'))
-            r.get_method = lambda: 'PUT'
-            u = self._opener.open(r)
+            if delta is not None:
+                r = self._template_request(url, delta, method='PATCH')
+
+            else:
+                r = self._template_request(url, template.to_object(compact=self._upload_compact), method='PUT')
+
+            # refuse to overwrite changes made since the template was fetched
+            if etag is not None:
+                r.add_header('If-Match', etag)
+
+            u = self._open(r)
             res = json.loads(u.read().decode('utf-8'))
 
+            # later changes apply to the template as now stored
+            template._origin = template.to_object()
+
+            self._etags.pop(template.uuid, None)
+            self._templates.discard(template.uuid)
+
             return res
 
         except urllib.error.URLError as e:
+            if getattr(e, 'code', None) == 412:
+                raise ServiceException('template has been modified since it was fetched', code=412)
+
             res = json.loads(e.fp.read().decode('utf-8'))
             raise ServiceException('{0}'.format(res.get('error', 'unknown')))
 
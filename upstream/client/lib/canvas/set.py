@@ -16,42 +16,98 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-import collections
+import collections.abc
+
+class CanvasSet(collections.abc.MutableSet):
+    """ An insertion ordered set with constant time membership.
+
+    Items are kept in a list of slots to preserve insertion order while a hash
+    index maps each item to its slot. Discarded items leave an empty slot
+    behind which is compacted lazily on the next positional access.
+
+    Subclasses whose items have a looser notion of equality than their hash
+    override the _find and _index_* methods to maintain their own indexes.
+    """
 
-class CanvasSet(collections.MutableSet):
     def __init__(self, initvalue=()):
-        self._set = []
+        self._set = []      # item slots in insertion order, None if discarded
+        self._index = {}    # item key to slot
+        self._discarded = 0
 
         for value in initvalue:
             self.add(value)
 
     def __contains__(self, item):
-        return item in self._set
+        return self._find(item) is not None
 
     def __getitem__(self, index):
+        self._compact()
+
         return self._set[index]
 
     def __iter__(self):
-        return iter(self._set)
+        return (x for x in self._set if x is not None)
 
     def __len__(self):
-        return len(self._set)
+        return len(self._set) - self._discarded
 
     def __repr__(self):
-        return "%s(%r)" % (type(self).__name__, self._set)
+        return "%s(%r)" % (type(self).__name__, self.as_list())
+
+    def _compact(self):
+        if not self._discarded:
+            return
+
+        items = [x for x in self._set if x is not None]
+
+        self._set = []
+        self._discarded = 0
+        self._index_clear()
+
+        for x in items:
+            self._insert(x)
+
+    def _find(self, item):
+        """ Return the slot of the stored item equal to item, or None. """
+        return self._index.get(self._key(item))
+
+    def _index_add(self, item, slot):
+        self._index[self._key(item)] = slot
+
+    def _index_clear(self):
+        self._index = {}
+
+    def _index_remove(self, item, slot):
+        del self._index[self._key(item)]
+
+    def _insert(self, item):
+        self._set.append(item)
+        self._index_add(item, len(self._set) - 1)
+
+    def _key(self, item):
+        return item
+
+    def _replace(self, slot, item):
+        self._index_remove(self._set[slot], slot)
+        self._set[slot] = item
+        self._index_add(item, slot)
 
     def add(self, item):
-        if item not in self._set:
-            self._set.append(item)
+        if self._find(item) is None:
+            self._insert(item)
 
     def as_list(self):
-        return list(self._set)
+        return list(self)
 
     def discard(self, item):
-        if item not in self._set:
+        slot = self._find(item)
+
+        if slot is None:
             raise ValueError("item not in set")
 
-        self._set.remove(item)
+        self._index_remove(self._set[slot], slot)
+        self._set[slot] = None
+        self._discarded += 1
 
     def difference(self, other):
         if not isinstance(other, CanvasSet):
@@ -61,13 +117,13 @@ class CanvasSet(collections.MutableSet):
         uniq_other = self.__class__()
 
         # find unique items to self
-        for x in self._set:
+        for x in self:
             if x not in other:
                 uniq_self.add(x)
 
         # find unique items to other
         for x in other:
-            if x not in self._set:
+            if x not in self:
                 uniq_other.add(x)
 
         return (uniq_self, uniq_other)
@@ -76,7 +132,7 @@ class CanvasSet(collections.MutableSet):
         if len(args) == 0:
             raise Exception('No CanvasSets defined for union.')
 
-        u = self.__class__(self._set)
+        u = self.__class__(self)
 
         for o in args:
             if not isinstance(o, CanvasSet):
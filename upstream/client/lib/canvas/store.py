@@ -16,11 +16,10 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-import dnf
-import hawkey
 import json
 import re
 
+from canvas.dnfcontext import dnf_context, dnf_isinstance
 from canvas.set import CanvasSet
 
 # name[[#epoch]@version-release][:arch]
@@ -105,7 +104,7 @@ class Store(object):
         return self.action & (self.ACTION_INCLUDE) == self.ACTION_INCLUDE
 
     def parse(self, data):
-        if isinstance(data, dnf.package.Store):
+        if dnf_isinstance(data, 'hawkey.Package'):
             self.name    = data.name
             self.epoch   = data.epoch
             self.version = data.version
@@ -183,9 +182,8 @@ class Store(object):
             evr = self.epoch + ':'
 
         if self.version is not None and self.release is not None:
-            db = dnf.Base()
-            conf = db.conf.substitutions
-            evr += '{0}-{1}.fc{2}'.format(self.version, self.release, conf['releasever'])
+            subs = dnf_context().substitutions()
+            evr += '{0}-{1}.fc{2}'.format(self.version, self.release, subs['releasever'])
 
         elif self.version is not None:
             evr += self.version
@@ -201,13 +199,8 @@ class Store(object):
         return f
 
     def to_pkg(self, db=None):
-        if not isinstance(db, dnf.Base):
-            db = dnf.Base()
-            try:
-                db.fill_sack()
-
-            except OSError as e:
-                pass
+        if not dnf_isinstance(db, 'dnf.Base'):
+            db = dnf_context().installed()
 
         p_list = db.sack.query().installed().filter(name=self.name)
 
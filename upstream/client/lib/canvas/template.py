@@ -16,25 +16,22 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-import dnf
+import fnmatch
 import hashlib
 import json
 import logging
 import re
 import sys
-import yaml
 
+from canvas.cache import KickstartCache, ObjectStore
+from canvas.dnfcontext import REPOS_SYSTEM, dnf_context, dnf_isinstance
+from canvas.download import Downloader
+from canvas.kickstart import kickstart_key
 from canvas.object import Object, ObjectSet
 from canvas.package import Package, PackageSet
+from canvas.plan import TransactionPlan
 from canvas.repository import Repository, RepoSet
-
-import pykickstart
-import pykickstart.constants
-import pykickstart.parser
-from pykickstart.i18n import _
-from pykickstart.version import DEVEL, makeVersion
-
-from dnf.cli.progress import MultiFileProgressMeter
+from canvas.scheduler import ObjectScheduler
 
 # [user:]name[@version]
 RE_TEMPLATE = re.compile("(?:(?P<user>[\w\.\-]*):)?(?P<name>[\w\.\-]+)(?!.*:)(?:@(?P<version>[\w\.\-]+))?")
@@ -73,11 +70,24 @@ class Template(object):
 
         self._db = None
 
+        self._revision = 0            # bumped on change to invalidate views
+        self._views = {}              # cached views keyed by name
+
+        self._origin = None           # template as last fetched from or stored to canvas
+
         self._parse_template(template)
 
     def __str__(self):
         return 'Template: %s (owner: %s) - R: %d, P: %d' % (self._name, self._user, len(self.repos_all), len(self.packages_all))
 
+    def _changed(self):
+        """
+        Marks the template as changed, invalidating all cached views. Must be
+        called after any modification of the underlying repo, package or
+        object sets.
+        """
+        self._revision += 1
+
     def _flatten(self):
         # iterate the includes in reverse order for packages and repos due to
         # higher level templates prioritising lower levels
@@ -89,7 +99,76 @@ class Template(object):
         for t in reversed(self._includes_resolved):
             self._includes_objects.update(t.objects_all)
 
-    def _parse_kickstart(self, path):
+        self._changed()
+
+    def _packages_reconcile(self, installed):
+        """
+        Classify all template packages against the installed packages in a
+        single pass. Packages are matched on their name, arch and evr where
+        specified.
+
+        Args:
+          installed: iterable of installed DNF packages.
+
+        Returns:
+          Tuple of the list of template packages to install and list of
+          installed DNF packages to remove.
+        """
+
+        # index installed packages by name then arch
+        index = {}
+
+        for pi in installed:
+            index.setdefault(pi.name, {}).setdefault(pi.arch, []).append(pi)
+
+        matches = []
+        globs = []
+
+        for p in self.packages_all:
+            if p.is_group() or not (p.included or p.excluded):
+                continue
+
+            # globs are matched in a separate batch below
+            if Package.RE_GLOB.search(p.name):
+                globs.append((p, []))
+                continue
+
+            archs = index.get(p.name, {})
+
+            if p.arch is None:
+                candidates = [pi for pl in archs.values() for pi in pl]
+
+            else:
+                candidates = archs.get(p.arch, [])
+
+            matches.append((p, [pi for pi in candidates if p.matches_pkg(pi)]))
+
+        # match each installed name once against the compiled globs
+        if len(globs):
+            patterns = [re.compile(fnmatch.translate(p.name)) for (p, _) in globs]
+
+            for (name, archs) in index.items():
+                for (i, pattern) in enumerate(patterns):
+                    if pattern.match(name):
+                        (p, p_installed) = globs[i]
+                        p_installed.extend(pi for pl in archs.values() for pi in pl if p.matches_pkg(pi))
+
+            matches.extend(globs)
+
+        install = []
+        remove = {}
+
+        for (p, p_installed) in matches:
+            if p.included and len(p_installed) == 0:
+                install.append(p)
+
+            elif p.excluded:
+                for pi in p_installed:
+                    remove[pi] = True
+
+        return (install, list(remove))
+
+    def _parse_kickstart(self, path, follow_includes=True):
         """
         Loads the template with information from the supplied kickstart path.
 
@@ -114,33 +193,93 @@ class Template(object):
         Currently scripts are converted to canvas objects, repo commands are converted to canvas
         repos and packages are converted to canvas packages.
 
+        The parsed content is cached, keyed by the content of the kickstart and
+        the kickstarts it includes, so unchanged kickstarts are loaded without
+        being parsed again.
+
         Args:
           path: Path to existing kickstart file.
+          follow_includes: whether the content of %include'd kickstarts is
+                           also loaded.
 
         Returns:
-          Nothing.
+          True if the kickstart was loaded, False if it could not be read or
+          parsed.
 
         Raises:
           IOError: An error occurred accessing the kickstart file.
         """
 
+        try:
+            key = kickstart_key(path, follow_includes)
+
+        except IOError as msg:
+            logging.error("Failed to read kickstart file '{0}' : {1}".format(path, msg))
+            return False
+
+        cache = KickstartCache()
+        content = cache.get(key) if key is not None else None
+
+        if content is None:
+            content = self._read_kickstart(path, follow_includes)
+
+            if content is None:
+                return False
+
+            if key is not None:
+                cache.set(key, content)
+
+        else:
+            logging.debug("Loaded kickstart file '{0}' from cache".format(path))
+
+        for r in content['repos']:
+            self.add_repo(Repository(r))
+
+        for o in content['objects']:
+            self.add_object(Object(o))
+
+        for p in Package.from_columns(content['packages'], template=self.unv):
+            self.add_package(p)
+
+        self._meta['kickstart'] = content['meta']
+
+        return True
+
+    def _read_kickstart(self, path, follow_includes=True):
+        """
+        Parses a kickstart into the compact form of the template content it
+        defines.
+
+        Returns:
+          Dictionary of the kickstart meta, repo lines, objects and packages
+          (in the columnar encoding), or None if the kickstart could not be read
+          or parsed.
+        """
+        import pykickstart.constants
+        import pykickstart.errors
+        import pykickstart.parser
+        from pykickstart.version import DEVEL, makeVersion, versionToString
+
         ksversion = makeVersion(DEVEL)
-        ksparser = pykickstart.parser.KickstartParser(ksversion)
+        ksparser = pykickstart.parser.KickstartParser(ksversion, followIncludes=follow_includes)
 
         try:
             ksparser.readKickstart(path)
 
         except IOError as msg:
             logging.error("Failed to read kickstart file '{0}' : {1}".format(path, msg))
-            return
+            return None
 
         except pykickstart.errors.KickstartError as e:
-            logging.error("Failed to parse kickstart file '{0}' : {1}".format(path, msg))
-            return
+            logging.error("Failed to parse kickstart file '{0}' : {1}".format(path, e))
+            return None
 
         handler = ksparser.handler
 
         meta = {}
+        repos = []
+        objects = []
+        pkgs = []
 
         if handler.platform:
             meta['platform'] = handler.platform
@@ -162,16 +301,17 @@ class Template(object):
                         if len(r.strip()) == 0:
                             continue
 
-                        self.add_repo(Repository(r))
+                        # kept as repo lines, which keep every repo option
+                        repos.append(r.strip())
 
                 # otherwise store commands as canvas objects
                 else:
-                    self.add_object(Object(c))
+                    objects.append(Object(c).to_object())
 
         # convert scripts into canvas objects
         # sort on line number seen
         for s in sorted(handler.scripts, key=lambda x:x.lineno):
-            self.add_object(Object(s))
+            objects.append(Object(s).to_object())
 
         # parse pykickstart packages
         packages = handler.packages
@@ -188,29 +328,19 @@ class Template(object):
 
         if not packages.default:
             if packages.environment:
-                meta['package']['environment'] = "@^{0}".format(packages.environment)
-
-            grps = packages.groupList
-            grps.sort()
-            for g in grps:
-                self.add_package(Package({'n': g.__str__(), 'z': 1}, template=self.unv))
-
-            pkgs = packages.packageList
-            pkgs.sort()
-            for p in pkgs:
-                self.add_package(Package({'n': p.__str__(), 'z': 1}, template=self.unv))
+                meta['packages']['environment'] = "@^{0}".format(packages.environment)
 
-            grps = packages.excludedGroupList
-            grps.sort()
-            for g in grps:
-                self.add_package(Package({'n': g.__str__(), 'z': 0}, template=self.unv))
+            for (names, action) in [(packages.groupList, 1), (packages.packageList, 1),
+                                    (packages.excludedGroupList, 0), (packages.excludedList, 0)]:
+                for n in sorted(str(n) for n in names):
+                    pkgs.append(Package({'n': n, 'z': action}))
 
-            pkgs = packages.excludedList
-            pkgs.sort()
-            for p in pkgs:
-                self.add_package(Package({'n': p.__str__(), 'z': 0}, template=self.unv))
-
-        self._meta['kickstart'] = meta
+        return {
+            'meta':     meta,
+            'repos':    repos,
+            'objects':  objects,
+            'packages': Package.to_columns(pkgs),
+        }
 
     def _parse_template(self, template):
         # parse the string short form
@@ -245,13 +375,59 @@ class Template(object):
             self._includes = template.get('includes', [])
 
             self._repos    = RepoSet(Repository(r, template=self.unv) for r in template.get('repos', []))
-            self._packages = PackageSet(Package(p, template=self.unv) for p in template.get('packages', []))
+            packages = template.get('packages', [])
+
+            # packages may be in the compact columnar encoding
+            if isinstance(packages, dict):
+                self._packages = PackageSet(Package.from_columns(packages, template=self.unv))
+
+            else:
+                self._packages = PackageSet(Package(p, template=self.unv) for p in packages)
 
             self._stores   = template.get('stores', [])
             self._objects  = ObjectSet(Object(o) for o in template.get('objects', []))
 
             self._meta = template.get('meta', {})
 
+            self._origin = template
+
+            self._changed()
+
+    def _items_delta(self, origin, current, fields):
+        """
+        Calculates the items to add (or replace) and remove to turn the origin
+        list of item objects into the current list, where items are keyed by
+        the specified fields.
+
+        Returns:
+          Dictionary of the items to add and the key fields of the items to
+          remove, or None if the items aren't uniquely keyed.
+        """
+        def key(o):
+            return tuple(o.get(f) for f in fields)
+
+        origin = {key(o): o for o in origin}
+        keys = set()
+        add = []
+
+        for o in current:
+            k = key(o)
+
+            if k in keys:
+                return None
+
+            keys.add(k)
+
+            if origin.get(k) != o:
+                add.append(o)
+
+        remove = [
+            {f: v for f, v in zip(fields, k) if v is not None}
+            for k in origin if k not in keys
+        ]
+
+        return {'add': add, 'remove': remove}
+
     def _parse_unv(self, value):
         if isinstance(value, str):
             m = RE_TEMPLATE.match(value.strip())
@@ -261,6 +437,21 @@ class Template(object):
 
         return (None, None, None)
 
+    def _view(self, name, build):
+        """
+        Returns the cached view of the specified name, rebuilding it if the
+        template has changed since it was last built.
+
+        Views are shared, callers must not modify the returned set.
+        """
+        view = self._views.get(name)
+
+        if view is None or view[0] != self._revision:
+            view = (self._revision, build())
+            self._views[name] = view
+
+        return view[1]
+
     def _unv_to_str(self, value):
         if isinstance(value, str):
             m = RE_TEMPLATE.match(value.strip())
@@ -327,7 +518,7 @@ class Template(object):
         if len(includes_resolved):
             self._includes_resolved = includes_resolved
 
-        # flatten template
+        # flatten template (also invalidates views)
         self._flatten()
 
     @property
@@ -336,12 +527,12 @@ class Template(object):
 
     @property
     def objects(self):
-        return self._objects.union(self._delta_objects)
+        return self._view('objects', lambda: self._objects.union(self._delta_objects))
 
     @property
     def objects_all(self):
         # order is important
-        return self._includes_objects.union(self._objects, self._delta_objects)
+        return self._view('objects_all', lambda: self._includes_objects.union(self._objects, self._delta_objects))
 
     @property
     def objects_delta(self):
@@ -349,11 +540,11 @@ class Template(object):
 
     @property
     def packages(self):
-        return self._packages.union(self._delta_packages)
+        return self._view('packages', lambda: self._packages.union(self._delta_packages))
 
     @property
     def packages_all(self):
-        return self._packages.union(self._delta_packages, self._includes_packages)
+        return self._view('packages_all', lambda: self._packages.union(self._delta_packages, self._includes_packages))
 
     @property
     def packages_delta(self):
@@ -373,11 +564,11 @@ class Template(object):
 
     @property
     def repos(self):
-        return self._repos.union(self._delta_repos)
+        return self._view('repos', lambda: self._repos.union(self._delta_repos))
 
     @property
     def repos_all(self):
-        return self._repos.union(self._delta_repos, self._includes_repos)
+        return self._view('repos_all', lambda: self._repos.union(self._delta_repos, self._includes_repos))
 
     @property
     def repos_delta(self):
@@ -427,10 +618,12 @@ class Template(object):
 
         if object not in self.objects:
             self._delta_objects.add(object)
+            self._changed()
 
     def add_package(self, package):
         if package not in self.packages:
             self._delta_packages.add(package)
+            self._changed()
 
     def add_repo(self, repo):
         if not isinstance(repo, Repository):
@@ -438,6 +631,7 @@ class Template(object):
 
         if repo not in self.repos:
             self._delta_repos.add(repo)
+            self._changed()
 
     def clear(self):
         """
@@ -470,25 +664,46 @@ class Template(object):
         if 'kickstart' in self._meta:
             del self._meta['kickstart']
 
+        self._changed()
 
     def find_package(self, name):
-        return [p for p in self.packages if p.name == name]
+        return self.packages.find(name)
 
     def find_repo(self, repo_id):
         return [r for r in self.repos if r.stub == repo_id]
 
-    def from_kickstart(self, path):
-        self._parse_kickstart(path)
+    def fingerprint(self):
+        """
+        Checksum of the content defined by the template itself, ie. its
+        title, description, visibility, includes, kickstart meta, packages,
+        repos, stores and objects. Fields assigned by the server and the
+        content of includes are not part of it. Templates without a title
+        are titled by name, as when parsed from the server.
+
+        Returns:
+          The sha256 hex digest of the content.
+        """
+        content = {
+            'title':       self._title or self._name,
+            'description': self._description,
+            'public':      self.public,
+            'includes':    self._includes,
+            'kickstart':   self._meta.get('kickstart'),
+            'stores':      self._stores,
+            'packages':    sorted([p.to_object() for p in self.packages], key=lambda p: json.dumps(p, sort_keys=True)),
+            'repos':       sorted([r.to_object() for r in self.repos], key=lambda r: json.dumps(r, sort_keys=True)),
+            'objects':     [o.to_object() for o in self.objects],
+        }
+
+        return hashlib.sha256(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def from_kickstart(self, path, includes=True):
+        return self._parse_kickstart(path, follow_includes=includes)
 
     @classmethod
     def from_system(cls, all=False):
         system_template = cls('local:system')
-        db = dnf.Base()
-        try:
-            db.fill_sack()
-
-        except OSError as e:
-            pass
+        db = dnf_context().installed()
 
         if all:
             p_list = db.sack.query().installed()
@@ -513,6 +728,9 @@ class Template(object):
         return self.repos_all.difference(repos)
 
     def repos_to_repodict(self, cache_dir=None):
+        import dnf.conf
+        import dnf.repodict
+
         rd = dnf.repodict.RepoDict()
 
         if cache_dir is None:
@@ -535,11 +753,13 @@ class Template(object):
             raise TypeError('Not an Object object')
 
         if object in self._delta_objects:
-            self._objects.discard(object)
+            self._delta_objects.discard(object)
+            self._changed()
             return True
 
         elif object in self._objects:
             self._objects.discard(object)
+            self._changed()
             return True
 
         return False
@@ -549,11 +769,13 @@ class Template(object):
             raise TypeError('Not a Package object')
 
         if package in self._delta_packages:
-            self._packages.discard(package)
+            self._delta_packages.discard(package)
+            self._changed()
             return True
 
         elif package in self._packages:
             self._packages.discard(package)
+            self._changed()
             return True
 
         return False
@@ -564,10 +786,12 @@ class Template(object):
 
         if repo in self._delta_repos:
             self._delta_repos.remove(repo)
+            self._changed()
             return True
 
         elif repo in self._repos:
             self._repos.remove(repo)
+            self._changed()
             return True
 
         return False
@@ -577,93 +801,133 @@ class Template(object):
         Applies the transaction (configured by prepare) to the system.
 
         Args:
-          db: dnf.Base object to use for preparation.
           clean: specify wheter system packages not defined in the template are removed.
 
         Returns:
           Nothing.
         """
 
-        if not isinstance(self._db, dnf.Base):
+        if not dnf_isinstance(self._db, 'dnf.Base'):
             return
 
         db = self._db
 
         if db.transaction is not None and \
             (len(db.transaction.install_set) or len(db.transaction.remove_set)):
+            from dnf.cli.progress import MultiFileProgressMeter
+
             logging.info('Downloading packages ...')
             db.download_packages(list(db.transaction.install_set), progress=MultiFileProgressMeter())
 
             logging.info('Performing package transaction ...')
             db.do_transaction()
 
+            # the rpmdb has changed underneath the sack
+            if db is dnf_context().base:
+                dnf_context().invalidate()
+
         if len(self.packages_all):
             logging.info('Syncing history ...')
 
+            # all lookups share a single (re)filled sack
+            if db is dnf_context().base:
+                db = dnf_context().installed()
+
             for p in self.packages_all:
                 if p.included:
-                    pkg = p.to_pkg();
+                    pkg = p.to_pkg(db)
                     if pkg is not None:
                         db.yumdb.get_package(pkg).reason = 'user'
 
-        # check all non-ks objects
-        if len(self.objects_all):
-            # find all non local object sources and fetch
-            external_sources = [o for o in self.objects_all if o.source != 'raw']
+        store = ObjectStore()
+
+        # find all non local object sources
+        external_sources = [o for o in self.objects_all if o.source != 'raw']
 
+        # fetch and apply non-ks actions of all objects, each object is
+        # applied as soon as it's fetched and the objects it depends on are
+        if len(self.objects_all):
             if len(external_sources):
                 logging.info('Downloading objects ...')
 
-            for o in external_sources:
-                logging.info('Downloading: {0}'.format(o.source))
-                o.download()
+            ObjectScheduler(self.objects_all).run(Downloader(store))
 
+        # keep the objects of the applied template when trimming the cache,
+        # objects without a checksum by the content last downloaded for them
+        xsums = [o.xsum or (store.source_get(o.source) or {}).get('xsum') for o in external_sources]
+        store.pin([x for x in xsums if x])
 
-            # apply non-ks actions only
-            for o in self.objects_all:
-                logging.info('Applying: {0}'.format(o.source))
-                o.apply_actions()
+    def system_plan(self):
+        """
+        Plan of the transaction prepared for the system, which can be saved
+        and applied later without resolving it again.
 
-    def system_prepare(self, clean=False, db=dnf.Base()):
+        Returns:
+          TransactionPlan or None if the system hasn't been prepared.
+        """
+
+        if dnf_isinstance(self._db, 'dnf.Base'):
+            return TransactionPlan.from_transaction(self, self._db)
+
+        return None
+
+    def system_prepare(self, clean=False, db=None, plan=None):
         """
         Prepares the system for applying template configuration.
 
         Args:
-          db: dnf.Base object to use for preparation.
           clean: specify wheter system packages not defined in the template are removed.
+          db: dnf.Base object to use for preparation, defaults to the shared
+              DNF context.
+          plan: TransactionPlan previously resolved for the template, used
+                instead of resolving the package actions when it still
+                matches the system.
 
         Returns:
           Nothing.
         """
 
-        if not isinstance(self._db, dnf.Base):
-            self._db = db
-
-        else:
-            self._db.reset(goal=True, repos=True)
+        import dnf.cli.progress
+        import dnf.exceptions
 
         # prepare dnf
         logging.info('Analysing system ...')
 
         # install repos from template
         if len(self.repos_all):
-            for r in self.repos_all:
-                dr = r.to_repo(conf=self._db.conf)
-                dr.set_progress_bar(dnf.cli.progress.MultiFileProgressMeter())
-                db.repos.add(dr)
+            repos = list(self.repos_all)
 
         # indicate we're using sytem repos if we're mangling packages
         elif len(self.packages_all):
             logging.info('No template repos specified, using available system repos.')
-            db.read_all_repos()
+            repos = REPOS_SYSTEM
 
-        db.read_comps()
+        else:
+            repos = []
 
-        try:
-            db.fill_sack()
+        if db is None:
+            db = dnf_context().fill(repos)
+            db.reset(goal=True)
 
-        except OSError as e:
-            pass
+        else:
+            if repos == REPOS_SYSTEM:
+                db.read_all_repos()
+
+            else:
+                for r in repos:
+                    dr = r.to_repo(conf=db.conf)
+                    dr.set_progress_bar(dnf.cli.progress.MultiFileProgressMeter())
+                    db.repos.add(dr)
+
+            db.read_comps()
+
+            try:
+                db.fill_sack()
+
+            except OSError as e:
+                pass
+
+        self._db = db
 
         q_installed = db.sack.query().installed()
 
@@ -674,49 +938,49 @@ class Template(object):
         multilib_policy = db.conf.multilib_policy
         clean_deps = db.conf.clean_requirements_on_remove
 
+        if plan is not None:
+            if plan.apply(self, db):
+                logging.info('Applying package actions from transaction plan ...')
+                db.resolve(allow_erasing=True)
+                return
+
+            logging.warning('Transaction plan does not match the system, ignoring.')
+
         logging.info('Preparing package transaction ...')
-        # process all packages in template
+        # process all package groups in template
         for p in self.packages_all:
-            # handle package groups
-            if p.is_group:
-                if p.included:
-                    try:
-                        db.group_install(p.name, 'default')
+            if not p.is_group():
+                continue
 
-                    except:
-                        logging.error('Package group does not exist {0}'.format(str(p)))
+            if p.included:
+                try:
+                    db.group_install(p.name, 'default')
 
-                elif p.excluded:
-                    try:
-                        db.group_remove(p.name)
+                except:
+                    logging.error('Package group does not exist {0}'.format(str(p)))
 
-                    except:
-                        logging.debug('Package not installed: {0}'.format(str(p)))
+            elif p.excluded:
+                try:
+                    db.group_remove(p.name)
 
-            # handle packages
-            else:
-                p_spec = p.to_pkg_spec()
-
-                # TODO: improve matching on all p_spec params (not just name)
-                p_installed = list(q_installed.filter(name__glob=p_spec))
+                except:
+                    logging.debug('Package not installed: {0}'.format(str(p)))
 
-                if p.included and len(p_installed) == 0:
-                    try:
-                        db.install(p_spec)
+        # process all packages in template against the installed set at once
+        (install, remove) = self._packages_reconcile(q_installed)
 
-                    except:
-                        logging.error('Package does not exist {0}'.format(str(p)))
+        if len(install):
+            specs = [p.to_pkg_spec() for p in install]
 
-                elif p.excluded and len(p_installed) > 0:
-                    try:
-                        for pi in p_installed:
-                            db.remove(pi)
+            try:
+                db.install_specs(specs)
 
-                    except:
-                        logging.debug('Package not installed: {0}'.format(str(p)))
+            except dnf.exceptions.MarkingErrors as e:
+                for spec in e.no_match_pkg_specs:
+                    logging.error('Package does not exist {0}'.format(spec))
 
-                else:
-                    pass
+        for pi in remove:
+            db.package_remove(pi)
 
         logging.info('Resolving package actions ...')
         db.resolve(allow_erasing=True)
@@ -735,13 +999,60 @@ class Template(object):
           IOError: An error occurred accessing the kickstart file.
         """
 
-        if isinstance(self._db, dnf.Base):
+        if dnf_isinstance(self._db, 'dnf.Base'):
             return self._db.transaction
 
         return None
 
-    def to_json(self, resolved=False):
-        return json.dumps(self.to_object(resolved=resolved), separators=(',', ':'))
+    def to_delta(self, compact=False):
+        """
+        Represent the changes made to the template since it was fetched from
+        (or last stored to) canvas. Only the packages, repos and objects to
+        add (or replace) and remove are included, alongside the remaining
+        template fields.
+
+        Args:
+          compact: use the compact columnar encoding for packages to add.
+
+        Returns:
+          Dictionary of the changes or None if the template has no origin or
+          the changes can't be represented as a delta.
+        """
+        if self._origin is None:
+            return None
+
+        packages = self._origin.get('packages', [])
+
+        if isinstance(packages, dict):
+            packages = Package.from_columns(packages)
+
+        else:
+            packages = [Package(p) for p in packages]
+
+        # normalise the origin through the same objects as the current state
+        origin = {
+            'packages': [p.to_object() for p in packages],
+            'repos':    [Repository(r).to_object() for r in self._origin.get('repos', [])],
+            'objects':  [Object(o).to_object() for o in self._origin.get('objects', [])]
+        }
+
+        current = self.to_object()
+
+        delta = {k: v for k, v in current.items() if k not in origin}
+
+        for (k, fields) in (('packages', ('n', 'a')), ('repos', ('s',)), ('objects', ('name',))):
+            delta[k] = self._items_delta(origin[k], current[k], fields)
+
+            if delta[k] is None:
+                return None
+
+        if compact:
+            delta['packages']['add'] = Package.to_columns(Package(p) for p in delta['packages']['add'])
+
+        return delta
+
+    def to_json(self, resolved=False, compact=False):
+        return json.dumps(self.to_object(resolved=resolved, compact=compact), separators=(',', ':'))
 
     def to_kickstart(self, resolved=False):
         """
@@ -848,7 +1159,7 @@ class Template(object):
 
         return template
 
-    def to_object(self, resolved=False):
+    def to_object(self, resolved=False, compact=False):
         if resolved:
             _packages = list(self.packages_all)
             _repos    = list(self.repos_all)
@@ -865,6 +1176,12 @@ class Template(object):
 
         # we don't sort objects as insertion order is important
 
+        if compact:
+            _packages = Package.to_columns(_packages)
+
+        else:
+            _packages = [p.to_object() for p in _packages]
+
         return {
             'uuid':        self._uuid,
             'name':        self._name,
@@ -873,7 +1190,7 @@ class Template(object):
             'title':       self._title,
             'description': self._description,
             'includes':    self._includes,
-            'packages':    [p.to_object() for p in _packages],
+            'packages':    _packages,
             'repos':       [r.to_object() for r in _repos],
             'stores':      self._stores,
             'objects':     [o.to_object() for o in _objects],
@@ -881,6 +1198,8 @@ class Template(object):
         }
 
     def to_yaml(self, resolved=False):
+        import yaml
+
         return yaml.dump(self.to_object(resolved=resolved))
 
     def update_package(self, package):
@@ -888,11 +1207,15 @@ class Template(object):
             raise TypeError('Not a Package object')
 
         if package in self._delta_packages:
-            self._delta_packages.update(package)
+            self._delta_packages.discard(package)
+            self._delta_packages.add(package)
+            self._changed()
             return True
 
         elif package in self._packages:
-            self._packages.update(package)
+            self._packages.discard(package)
+            self._packages.add(package)
+            self._changed()
             return True
 
         return False
@@ -904,11 +1227,13 @@ class Template(object):
         if repo in self._delta_repos:
             self._delta_repos.remove(repo)
             self._delta_repos.add(repo)
+            self._changed()
             return True
 
         elif repo in self._repos:
             self._repos.remove(repo)
             self._repos.add(repo)
+            self._changed()
             return True
 
         return False
@@ -928,3 +1253,5 @@ class Template(object):
 
         self._repos.update(template.repos)
         self._packages.update(template.packages)
+
+        self._changed()
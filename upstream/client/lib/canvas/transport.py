@@ -0,0 +1,225 @@
+#
+# Copyright (C) 2013-2016   Ian Firns   <firnsy@kororaproject.org>
+#                           Chris Smart <csmart@kororaproject.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import gzip
+import http.client
+import io
+import logging
+import threading
+import urllib.error
+import urllib.request
+import urllib.response
+
+# methods that are safe to send again should the response be lost
+IDEMPOTENT_METHODS = ['GET', 'HEAD', 'OPTIONS']
+
+
+class ConnectionPool(object):
+    """
+    A pool of persistent HTTP(S) connections keyed on scheme and host.
+
+    Idle connections are kept for reuse (keep-alive) and the number of
+    connections open to any single host is bounded.
+    """
+
+    def __init__(self, connections_per_host=4, connect_timeout=10, timeout=60):
+        self._connections_per_host = connections_per_host
+        self._connect_timeout = connect_timeout
+        self._timeout = timeout
+
+        self._lock = threading.Lock()
+        self._idle = {}     # key to list of idle connections
+        self._limits = {}   # key to semaphore bounding open connections
+
+    def _limit(self, key):
+        with self._lock:
+            if key not in self._limits:
+                self._limits[key] = threading.BoundedSemaphore(self._connections_per_host)
+
+            return self._limits[key]
+
+    def acquire(self, key, factory):
+        """
+        Acquire a connection for the specified key, blocking if the host is at
+        its connection limit.
+
+        Args:
+          key: tuple of scheme and host identifying the connection.
+          factory: callable accepting a timeout that returns a new connection.
+
+        Returns:
+          Tuple of connection and whether the connection was reused.
+        """
+        self._limit(key).acquire()
+
+        with self._lock:
+            idle = self._idle.get(key, [])
+
+            if idle:
+                return (idle.pop(), True)
+
+        conn = factory(self._connect_timeout)
+
+        try:
+            conn.connect()
+            conn.sock.settimeout(self._timeout)
+
+        except:
+            conn.close()
+            self._limit(key).release()
+            raise
+
+        return (conn, False)
+
+    def close(self):
+        """ Close all idle connections. """
+        with self._lock:
+            for idle in self._idle.values():
+                for conn in idle:
+                    conn.close()
+
+            self._idle = {}
+
+    def release(self, key, conn, reuse=True):
+        """
+        Release a connection back to the pool. Connections are closed instead
+        if they can't be reused.
+        """
+        if reuse:
+            with self._lock:
+                self._idle.setdefault(key, []).append(conn)
+
+        else:
+            conn.close()
+
+        self._limit(key).release()
+
+
+class KeepAliveMixin(object):
+    """
+    Services urllib requests over pooled keep-alive connections, accepting
+    gzip encoded responses.
+    """
+
+    def _pooled_open(self, req, connection_class, **kwargs):
+        host = req.host
+
+        if not host:
+            raise urllib.error.URLError('no host given')
+
+        tunnel_host = getattr(req, '_tunnel_host', None)
+        key = (req.type, host, tunnel_host)
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update({k: v for k, v in req.headers.items() if k not in headers})
+        headers = {name.title(): val for name, val in headers.items()}
+
+        # responses are transparently decompressed
+        headers.setdefault('Accept-Encoding', 'gzip')
+
+        # proxy authorisation is sent when establishing the tunnel only
+        tunnel_headers = {}
+
+        if tunnel_host and 'Proxy-Authorization' in headers:
+            tunnel_headers['Proxy-Authorization'] = headers.pop('Proxy-Authorization')
+
+        def factory(timeout):
+            conn = connection_class(host, timeout=timeout, **kwargs)
+
+            if tunnel_host:
+                conn.set_tunnel(tunnel_host, headers=tunnel_headers)
+
+            return conn
+
+        method = req.get_method()
+
+        # a reused connection may have been closed by the server whilst idle,
+        # so retry until we're on a fresh connection. once the request has
+        # been sent the server may have acted on it, so only idempotent
+        # requests are sent again
+        while True:
+            (conn, reused) = self._pool.acquire(key, factory)
+            sent = False
+
+            try:
+                conn.request(method, req.selector, req.data, headers)
+                sent = True
+
+                r = conn.getresponse()
+                body = r.read()
+
+            except (OSError, http.client.HTTPException) as e:
+                self._pool.release(key, conn, reuse=False)
+
+                if reused and isinstance(e, (ConnectionError, http.client.BadStatusLine)) and \
+                   (not sent or method in IDEMPOTENT_METHODS):
+                    logging.debug('Stale connection to {0}, reconnecting'.format(host))
+                    continue
+
+                raise urllib.error.URLError(e)
+
+            break
+
+        self._pool.release(key, conn, reuse=not r.will_close)
+
+        if r.msg.get('Content-Encoding', '').lower() == 'gzip':
+            try:
+                body = gzip.decompress(body)
+
+            except (OSError, EOFError) as e:
+                raise urllib.error.URLError(e)
+
+            del r.msg['Content-Encoding']
+            del r.msg['Content-Length']
+            r.msg['Content-Length'] = str(len(body))
+
+        res = urllib.response.addinfourl(io.BytesIO(body), r.msg, req.get_full_url(), r.status)
+        res.msg = r.reason
+
+        return res
+
+
+class KeepAliveHTTPHandler(KeepAliveMixin, urllib.request.HTTPHandler):
+    def __init__(self, pool):
+        urllib.request.HTTPHandler.__init__(self)
+        self._pool = pool
+
+    def http_open(self, req):
+        return self._pooled_open(req, http.client.HTTPConnection)
+
+
+class KeepAliveHTTPSHandler(KeepAliveMixin, urllib.request.HTTPSHandler):
+    def __init__(self, pool, context=None):
+        urllib.request.HTTPSHandler.__init__(self, context=context)
+        self._pool = pool
+        self._ssl_context = context
+
+    def https_open(self, req):
+        return self._pooled_open(req, http.client.HTTPSConnection, context=self._ssl_context)
+
+
+def build_opener(pool, *handlers):
+    """
+    Build a urllib opener that services HTTP and HTTPS requests over the
+    connections of the supplied pool.
+    """
+    return urllib.request.build_opener(
+        KeepAliveHTTPHandler(pool),
+        KeepAliveHTTPSHandler(pool),
+        *handlers
+    )
@@ -0,0 +1,157 @@
+
+#
+# TESTS
+#
+
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+import zipfile
+
+from unittest import TestCase
+
+from canvas.archive import archive_format, extract
+
+try:
+    import zstandard
+
+except ImportError:
+    zstandard = None
+
+
+class Stream(object):
+    """ A non-seekable stream, as returned by a download. """
+
+    def __init__(self, data):
+        self._f = io.BytesIO(data)
+
+    def read(self, size=-1):
+        return self._f.read(size)
+
+
+class ArchiveTestCase(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.dest = os.path.join(self.path, 'dest')
+
+        self.files = {
+            'etc/motd':           b'hello\n',
+            'usr/bin/tool':       b'#!/bin/sh\necho tool\n',
+            'usr/share/doc/big':  os.urandom(256 * 1024),
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _tar(self, mode, members=None):
+        f = io.BytesIO()
+
+        with tarfile.open(fileobj=f, mode=mode) as tar:
+            for (name, data) in (members or self.files).items():
+                # links are supplied as complete members
+                if isinstance(data, tarfile.TarInfo):
+                    tar.addfile(data)
+                    continue
+
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+
+                tar.addfile(info, io.BytesIO(data))
+
+        return f.getvalue()
+
+    def _zip(self, members=None):
+        f = io.BytesIO()
+
+        with zipfile.ZipFile(f, 'w') as z:
+            for (name, data) in (members or self.files).items():
+                z.writestr(name, data)
+
+        return f.getvalue()
+
+    def _write(self, name, data):
+        path = os.path.join(self.path, name)
+
+        with open(path, 'wb') as f:
+            f.write(data)
+
+        return path
+
+    def _assertExtracted(self):
+        for (name, data) in self.files.items():
+            with open(os.path.join(self.dest, name), 'rb') as f:
+                self.assertEqual(data, f.read())
+
+    def test_archive_format(self):
+        self.assertEqual('gz', archive_format(self._tar('w:gz')))
+        self.assertEqual('bz2', archive_format(self._tar('w:bz2')))
+        self.assertEqual('xz', archive_format(self._tar('w:xz')))
+        self.assertEqual('tar', archive_format(self._tar('w')))
+        self.assertEqual('zip', archive_format(self._zip()))
+
+        self.assertEqual('zst', archive_format(b'', 'foo.tar.zst'))
+        self.assertEqual(None, archive_format(b'plain text', 'foo.txt'))
+
+    def test_archive_extract_by_content(self):
+        cwd = os.getcwd()
+
+        # stored objects are named by checksum so have no suffix
+        for mode in ['w', 'w:gz', 'w:bz2', 'w:xz']:
+            shutil.rmtree(self.dest, ignore_errors=True)
+
+            extract(self._write('0123abcd', self._tar(mode)), self.dest)
+            self._assertExtracted()
+
+        shutil.rmtree(self.dest)
+
+        extract(self._write('4567abcd', self._zip()), self.dest)
+        self._assertExtracted()
+
+        # the working directory is never changed
+        self.assertEqual(cwd, os.getcwd())
+
+    def test_archive_extract_stream(self):
+        extract(Stream(self._tar('w:xz')), self.dest)
+        self._assertExtracted()
+
+        with self.assertRaises(ValueError):
+            extract(Stream(self._zip()), self.dest)
+
+    @unittest.skipIf(zstandard is None, 'zstandard module is not available')
+    def test_archive_extract_zstd(self):
+        data = zstandard.ZstdCompressor().compress(self._tar('w'))
+
+        extract(Stream(data), self.dest)
+        self._assertExtracted()
+
+    def test_archive_extract_unsafe(self):
+        escape = tarfile.TarInfo('link')
+        escape.type = tarfile.SYMTYPE
+        escape.linkname = '../../outside'
+
+        # a sibling sharing the destination as a prefix is still outside
+        sibling = '../{0}-evil'.format(os.path.basename(self.dest))
+
+        for members in [{'../evil': b'x'}, {'/tmp/evil': b'x'}, {'a/../../evil': b'x'}, {sibling: b'x'}, {'link': escape}]:
+            with self.assertRaises(ValueError):
+                extract(Stream(self._tar('w:gz', members)), self.dest)
+
+        with self.assertRaises(ValueError):
+            extract(self._write('evil.zip', self._zip({'../evil': b'x'})), self.dest)
+
+        self.assertFalse(os.path.exists(os.path.join(self.path, 'evil')))
+        self.assertFalse(os.path.lexists(os.path.join(self.dest, 'link')))
+
+    def test_archive_extract_unknown(self):
+        with self.assertRaises(ValueError):
+            extract(self._write('notes.txt', b'not an archive'), self.dest)
+
+
+if __name__ == "__main__":
+    import unittest
+    suite = unittest.TestLoader().loadTestsFromTestCase(ArchiveTestCase)
+    unittest.TextTestRunner().run(suite)
@@ -0,0 +1,129 @@
+
+#
+# TESTS
+#
+
+import argparse
+import io
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase
+from unittest.mock import patch
+
+from canvas.config import Config
+from canvas.cli.commands import Command
+from canvas.cli.commands.batch import BatchCommand, parse_batch
+
+
+class Service(object):
+    """ Stand-in canvas service. """
+
+    def __init__(self, **kwargs):
+        self.settings = kwargs
+
+
+class BatchTestCase(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.config = Config(path=os.path.join(self.path, 'canvas.conf'))
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _run(self, data, stop_on_error=False):
+        path = os.path.join(self.path, 'batch')
+
+        with open(path, 'w') as f:
+            f.write(data)
+
+        args = argparse.Namespace(file=path, format='auto', stop_on_error=stop_on_error)
+
+        cli = BatchCommand()
+        cli.configure(self.config, args, [], None)
+
+        stdout = io.StringIO()
+
+        with patch('sys.stdout', stdout), patch('sys.stderr', io.StringIO()):
+            status = cli.run()
+
+        return (status, stdout.getvalue())
+
+    def test_batch_parse_lines(self):
+        data = (
+            "template push foo:bar --kickstart '/tmp/a b.ks'\n"
+            "\n"
+            "# a comment\n"
+            "canvas template list  # trailing comment\n"
+        )
+
+        self.assertEqual([
+            ['template', 'push', 'foo:bar', '--kickstart', '/tmp/a b.ks'],
+            ['template', 'list'],
+        ], parse_batch(data))
+
+    def test_batch_parse_json(self):
+        data = '[["template", "add", "foo:bar", "--title", "a b"], "canvas template list"]'
+
+        self.assertEqual([
+            ['template', 'add', 'foo:bar', '--title', 'a b'],
+            ['template', 'list'],
+        ], parse_batch(data))
+
+        # json is only detected from a list
+        self.assertEqual([['{}']], parse_batch('{}'))
+
+        for data in ['{}', '[1]', '[']:
+            with self.assertRaises(ValueError):
+                parse_batch(data, 'json')
+
+    def test_batch_run(self):
+        (status, output) = self._run(
+            "config core.test yes\n"
+            "config core.test\n"
+        )
+
+        self.assertEqual(0, status)
+
+        # commands share the config
+        self.assertTrue(output.startswith('yes\n'))
+
+    def test_batch_failed(self):
+        (status, output) = self._run(
+            "config nosection\n"
+            "bogus\n"
+            "batch\n"
+            "config core.test yes\n"
+        )
+
+        self.assertEqual(1, status)
+        self.assertEqual('yes', self.config.get('core', 'test'))
+
+        (status, output) = self._run(
+            "config nosection\n"
+            "config core.test no\n",
+            stop_on_error=True
+        )
+
+        self.assertEqual(1, status)
+        self.assertEqual('yes', self.config.get('core', 'test'))
+
+    def test_batch_shared_service(self):
+        args = argparse.Namespace(host='http://localhost', username='foo', offline=False)
+
+        with patch('canvas.service.Service', Service), patch.dict(Command._services, clear=True):
+            cs = Command().connect(self.config, args)
+
+            self.assertIs(cs, Command().connect(self.config, args))
+
+            args.username = 'bar'
+
+            self.assertIsNot(cs, Command().connect(self.config, args))
+
+
+if __name__ == "__main__":
+    import unittest
+    suite = unittest.TestLoader().loadTestsFromTestCase(BatchTestCase)
+    unittest.TextTestRunner().run(suite)
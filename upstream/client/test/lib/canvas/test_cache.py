@@ -0,0 +1,115 @@
+
+#
+# TESTS
+#
+
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+from unittest import TestCase
+
+from canvas.cache import ObjectStore, parse_size
+
+
+class ObjectStoreTestCase(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.store = ObjectStore(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _add(self, data, age=0):
+        xsum = hashlib.sha256(data).hexdigest()
+        part_path = self.store.part_path('file:///' + xsum, xsum)
+
+        with open(part_path, 'wb') as f:
+            f.write(data)
+
+        path = self.store.add(part_path, xsum)
+
+        # backdate the last use
+        t = time.time() - age
+        os.utime(path, (t, t))
+
+        return xsum
+
+    def test_parse_size(self):
+        self.assertEqual(512, parse_size('512'))
+        self.assertEqual(2048, parse_size('2K'))
+        self.assertEqual(10 * 1024 ** 3, parse_size('10G'))
+        self.assertEqual(1536 * 1024 ** 2, parse_size('1.5GiB'))
+
+        with self.assertRaises(ValueError):
+            parse_size('lots')
+
+    def test_store_gc_lru(self):
+        old = self._add(b'a' * 1000, age=300)
+        used = self._add(b'b' * 1000, age=200)
+        new = self._add(b'c' * 1000, age=100)
+
+        # using an object makes it the most recently used
+        self.store.touch(used)
+
+        self.assertEqual((0, 0), self.store.gc())
+        self.assertEqual((2, 2000), self.store.gc(max_size=1500))
+
+        self.assertFalse(self.store.has(old))
+        self.assertFalse(self.store.has(new))
+        self.assertTrue(self.store.has(used))
+
+    def test_store_gc_pinned(self):
+        old = self._add(b'a' * 1000, age=300)
+        new = self._add(b'b' * 1000, age=100)
+
+        self.store.pin([old])
+
+        self.assertEqual({old}, self.store.pinned())
+        self.assertEqual((1, 1000), self.store.gc(max_size=0))
+        self.assertTrue(self.store.has(old))
+        self.assertFalse(self.store.has(new))
+
+        # pins are replaced by the next applied template
+        self.store.pin([])
+        self.store.gc(max_size=0)
+
+        self.assertFalse(self.store.has(old))
+
+    def test_store_gc_partial(self):
+        stale = self.store.part_path('http://example.com/stale.tar')
+        fresh = self.store.part_path('http://example.com/fresh.tar')
+
+        for path in (stale, fresh):
+            with open(path, 'wb') as f:
+                f.write(b'x' * 10)
+
+        t = time.time() - ObjectStore.PART_TTL - 60
+        os.utime(stale, (t, t))
+
+        self.assertEqual((1, 10), self.store.gc())
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.exists(fresh))
+
+    def test_store_stats(self):
+        a = self._add(b'a' * 1000)
+        self._add(b'b' * 500)
+
+        self.store.pin([a])
+
+        stats = self.store.stats()
+
+        self.assertEqual(2, stats['objects'])
+        self.assertEqual(1500, stats['size'])
+        self.assertEqual(1, stats['pinned'])
+        self.assertEqual(1000, stats['pinned_size'])
+        self.assertEqual(0, stats['partial'])
+
+
+if __name__ == "__main__":
+    import unittest
+    suite = unittest.TestLoader().loadTestsFromTestCase(ObjectStoreTestCase)
+    unittest.TextTestRunner().run(suite)
@@ -0,0 +1,93 @@
+
+#
+# TESTS
+#
+
+import argparse
+import os
+import tempfile
+
+from unittest import TestCase
+from unittest.mock import patch
+
+import canvas.cli.commands.argparsers.root
+
+from canvas.config import Config
+from canvas.cli.commands import COMMANDS, buildCommandLineParser, parseCommandLine, selectCommand
+
+
+class CommandLineTestCase(TestCase):
+
+    def setUp(self):
+        self.config = Config(path=os.path.join(tempfile.gettempdir(), 'canvas-test-nofile'))
+
+    def test_cli_select_command(self):
+        options = argparse.ArgumentParser(add_help=False)
+        options.add_argument('-U', '--user', dest='username')
+        options.add_argument('-H', '--host')
+        options.add_argument('--offline', action='store_true')
+
+        self.assertEqual('template', selectCommand(options, ['template', 'list']))
+        self.assertEqual('object', selectCommand(options, ['-U', 'template', '--offline', 'object', 'list']))
+        self.assertEqual('repo', selectCommand(options, ['--host=http://localhost', 'repo']))
+        self.assertEqual('repo', selectCommand(options, ['-Ufoo', 'repo']))
+        self.assertEqual('repo', selectCommand(options, ['--ho', 'http://localhost', 'repo']))
+        self.assertEqual('repo', selectCommand(options, ['-V', '--', 'repo']))
+        self.assertEqual(None, selectCommand(options, ['-U', 'foo']))
+        self.assertEqual(None, selectCommand(options, ['template', '-U']))
+        self.assertEqual(None, selectCommand(options, []))
+
+    def test_cli_build_selected(self):
+        parsers = buildCommandLineParser(self.config, 'cache')
+
+        self.assertTrue(hasattr(parsers, 'cache'))
+
+        for (name, summary, parents) in COMMANDS:
+            if name != 'cache':
+                self.assertFalse(hasattr(parsers, name))
+
+        # or the command selected from the command line
+        parsers = buildCommandLineParser(self.config, argv=['-U', 'foo', 'repo', 'list'])
+
+        self.assertTrue(hasattr(parsers, 'repo'))
+        self.assertFalse(hasattr(parsers, 'cache'))
+
+    def test_cli_parse_builds_once(self):
+        with patch('canvas.cli.commands.argparsers.root.build', wraps=canvas.cli.commands.argparsers.root.build) as build:
+            parseCommandLine(self.config, ['cache', 'gc'])
+
+        self.assertEqual(1, build.call_count)
+
+    def test_cli_parse(self):
+        for (name, summary, parents) in COMMANDS:
+            argv = [name, 'core.host'] if name == 'config' else [name]
+            (parsers, args, args_extra) = parseCommandLine(self.config, argv)
+
+            self.assertEqual(name, args.command)
+            self.assertTrue(hasattr(parsers, name))
+
+        # however the root options are given
+        for argv in [['--host', 'http://x', 'template', 'list'], ['--ho', 'http://x', 'template', 'list'],
+                     ['-Hhttp://x', 'template', 'list'], ['--host=http://x', 'template', 'list']]:
+            (parsers, args, args_extra) = parseCommandLine(self.config, argv)
+
+            self.assertEqual('template', args.command)
+            self.assertEqual('list', args.action)
+            self.assertEqual([], args_extra)
+
+        # option values are never taken as the command
+        (parsers, args, args_extra) = parseCommandLine(self.config, ['-U', 'config', 'cache', 'gc', '--max-size', '1G'])
+
+        self.assertEqual('config', args.username)
+        self.assertEqual('cache', args.command)
+        self.assertEqual('gc', args.action)
+
+        with patch('sys.stderr'):
+            with self.assertRaises(SystemExit):
+                parseCommandLine(self.config, ['bogus'])
+
+
+if __name__ == "__main__":
+    import unittest
+    suite = unittest.TestLoader().loadTestsFromTestCase(CommandLineTestCase)
+    unittest.TextTestRunner().run(suite)
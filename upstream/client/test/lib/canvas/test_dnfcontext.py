@@ -0,0 +1,111 @@
+
+#
+# TESTS
+#
+
+from unittest import TestCase
+from unittest.mock import patch
+
+from canvas.dnfcontext import DnfContext, REPOS_INSTALLED, REPOS_SYSTEM
+
+
+class Conf(object):
+    def __init__(self):
+        self.reads = 0
+
+    @property
+    def substitutions(self):
+        self.reads += 1
+        return {'releasever': '24', 'basearch': 'x86_64'}
+
+
+class Base(object):
+    """ Stand-in dnf.Base that counts sack fills and resets. """
+
+    def __init__(self):
+        self.conf = Conf()
+        self.fills = 0
+        self.resets = 0
+        self.system = 0
+
+    def fill_sack(self):
+        self.fills += 1
+
+    def read_all_repos(self):
+        self.system += 1
+
+    def read_comps(self):
+        pass
+
+    def reset(self, **kwargs):
+        self.resets += 1
+
+
+class DnfContextTestCase(TestCase):
+
+    def setUp(self):
+        self.patcher = patch('dnf.Base', Base, create=True)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def test_dnfcontext_lazy(self):
+        c = DnfContext()
+
+        # nothing is created until first use
+        self.assertIsNone(c._base)
+
+        db = c.installed()
+
+        self.assertIsInstance(db, Base)
+        self.assertEqual(1, db.fills)
+
+    def test_dnfcontext_reuse(self):
+        c = DnfContext()
+
+        for i in range(10):
+            db = c.installed()
+
+        self.assertEqual(1, db.fills)
+
+        # a sack filled from system repos also covers installed packages
+        c.fill(REPOS_SYSTEM)
+        c.installed()
+        c.fill(REPOS_SYSTEM)
+
+        self.assertEqual(2, db.fills)
+        self.assertEqual(1, db.resets)
+        self.assertEqual(1, db.system)
+
+    def test_dnfcontext_invalidate(self):
+        c = DnfContext()
+
+        db = c.installed()
+        c.invalidate()
+
+        self.assertIs(db, c.installed())
+        self.assertEqual(2, db.fills)
+        self.assertEqual(1, db.resets)
+
+        c.fill(REPOS_INSTALLED)
+
+        self.assertEqual(2, db.fills)
+
+    def test_dnfcontext_substitutions(self):
+        c = DnfContext()
+
+        for i in range(10):
+            subs = c.substitutions()
+
+        self.assertEqual('24', subs['releasever'])
+        self.assertEqual(1, c.base.conf.reads)
+
+        # substitutions don't need a filled sack
+        self.assertEqual(0, c.base.fills)
+
+
+if __name__ == "__main__":
+    import unittest
+    suite = unittest.TestLoader().loadTestsFromTestCase(DnfContextTestCase)
+    unittest.TextTestRunner().run(suite)
@@ -0,0 +1,314 @@
+
+#
+# TESTS
+#
+
+import hashlib
+import os
+import shutil
+import socketserver
+import tempfile
+import threading
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import TestCase
+from unittest.mock import patch
+
+from canvas.cache import ObjectStore
+from canvas.download import Downloader, DownloadException
+from canvas.object import Object, ObjectSet
+
+
+class ObjectHandler(BaseHTTPRequestHandler):
+    """ Minimal stand-in for a server hosting object sources. """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        body = server.body
+
+        with server.lock:
+            server.requests.append(dict(self.headers))
+
+        if self.headers.get('If-None-Match') == server.etag:
+            self.send_response(304)
+            self.send_header('ETag', server.etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        start = 0
+        r = self.headers.get('Range')
+
+        if r is not None and self.headers.get('If-Range') in (None, server.etag):
+            start = int(r[len('bytes='):].rstrip('-')) + server.range_shift
+
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {0}-{1}/{2}'.format(start, len(body) - 1, len(body)))
+
+        else:
+            self.send_response(200)
+
+        self.send_header('ETag', server.etag)
+        self.send_header('Content-Length', str(len(body) - start))
+        self.end_headers()
+
+        # drop the connection part way through to simulate a flaky link
+        if server.truncate is not None:
+            self.wfile.write(body[start:server.truncate])
+            server.truncate = None
+            self.close_connection = True
+            return
+
+        self.wfile.write(body[start:])
+
+
+class ObjectServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, body):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), ObjectHandler)
+
+        self.lock = threading.Lock()
+        self.requests = []
+
+        self.body = body
+        self.etag = '"v1"'
+        self.truncate = None
+
+        # offset of the served range from the requested range
+        self.range_shift = 0
+
+    @property
+    def url(self):
+        return 'http://{0}:{1}/object.tar'.format(*self.server_address)
+
+
+class DownloadTestCase(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.store = ObjectStore(os.path.join(self.path, 'cache'))
+
+        self.sources = {}
+
+        for name in ['a', 'b', 'c']:
+            data = (name * 100000).encode('utf-8')
+            path = os.path.join(self.path, name + '.bin')
+
+            with open(path, 'wb') as f:
+                f.write(data)
+
+            self.sources[name] = ('file://' + path, hashlib.sha256(data).hexdigest())
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_download_store_layout(self):
+        (source, xsum) = self.sources['a']
+
+        self.assertEqual(
+            os.path.join(self.path, 'cache', 'sha256', xsum[0:2], xsum),
+            self.store.path(xsum)
+        )
+
+    def test_download_verified(self):
+        objects = [Object(name=n, source=s, xsum=x) for (n, (s, x)) in self.sources.items()]
+
+        Downloader(self.store, workers=2).download(objects)
+
+        for (source, xsum) in self.sources.values():
+            self.assertTrue(self.store.has(xsum))
+
+            with open(self.store.path(xsum), 'rb') as f:
+                self.assertEqual(xsum, hashlib.sha256(f.read()).hexdigest())
+
+        # no temporary files remain
+        self.assertEqual([], os.listdir(os.path.join(self.path, 'cache', 'tmp')))
+
+    def test_download_shared(self):
+        (source, xsum) = self.sources['a']
+        fetched = []
+
+        d = Downloader(self.store)
+        fetch = d._fetch
+
+        def counting_fetch(source, xsum, force):
+            fetched.append(source)
+            return fetch(source, xsum, force)
+
+        d._fetch = counting_fetch
+
+        # identical content referenced by multiple objects is fetched once
+        d.download([Object(name='a1', source=source, xsum=xsum), Object(name='a2', source=source, xsum=xsum)])
+        self.assertEqual(1, len(fetched))
+
+        # and not at all once stored
+        d.download([Object(name='a3', source=source, xsum=xsum)])
+        self.assertEqual(1, len(fetched))
+
+    def test_download_unknown_checksum(self):
+        (source, xsum) = self.sources['b']
+
+        with patch.dict(os.environ, {'CANVAS_CACHE_DIR': os.path.join(self.path, 'cache')}):
+            o = Object(name='b', source=source)
+
+        objects = ObjectSet([o])
+
+        self.assertEqual({source: xsum}, Downloader(self.store).download(objects))
+        self.assertTrue(self.store.has(xsum))
+
+        # the object is found by the content downloaded from its source
+        self.assertTrue(o.is_downloaded())
+        self.assertEqual(self.store.path(xsum), o._cached_object_path())
+
+        # objects are left untouched, so remain in their sets
+        self.assertEqual(None, o.xsum)
+
+        objects.remove(o)
+        self.assertEqual(0, len(objects))
+
+    def test_download_checksum_mismatch(self):
+        (source, xsum) = self.sources['a']
+        (_, xsum_c) = self.sources['c']
+
+        objects = [
+            Object(name='a', source=source, xsum=xsum_c),
+            Object(name='c', source=self.sources['c'][0], xsum=xsum_c),
+        ]
+
+        with self.assertRaises(DownloadException):
+            Downloader(self.store).download(objects[0:1])
+
+        self.assertFalse(self.store.has(xsum_c))
+        self.assertFalse(self.store.has(xsum))
+
+        # a failing object does not prevent the others downloading
+        with self.assertRaises(DownloadException):
+            Downloader(self.store).download([Object(name='x', source='file:///nonexistent', xsum=xsum), objects[1]])
+
+        self.assertTrue(self.store.has(xsum_c))
+
+    def _serve(self, body):
+        server = ObjectServer(body)
+
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        return server
+
+    def test_download_resume(self):
+        body = os.urandom(3 * 1024 * 1024 + 17)
+        xsum = hashlib.sha256(body).hexdigest()
+
+        server = self._serve(body)
+        server.truncate = 1024 * 1024 + 5
+
+        o = Object(name='tarball', source=server.url, xsum=xsum)
+
+        with self.assertRaises(DownloadException):
+            Downloader(self.store).download([o])
+
+        self.assertFalse(self.store.has(xsum))
+
+        # the partial download is continued rather than restarted
+        Downloader(self.store).download([o])
+
+        self.assertTrue(self.store.has(xsum))
+        self.assertEqual('bytes={0}-'.format(1024 * 1024 + 5), server.requests[-1].get('Range'))
+        self.assertEqual('"v1"', server.requests[-1].get('If-Range'))
+
+        with open(self.store.path(xsum), 'rb') as f:
+            self.assertEqual(body, f.read())
+
+        self.assertEqual([], os.listdir(os.path.join(self.path, 'cache', 'tmp')))
+
+    def test_download_resume_changed(self):
+        body = os.urandom(2 * 1024 * 1024)
+
+        server = self._serve(body)
+        server.truncate = 1024 * 1024
+
+        o = Object(name='tarball', source=server.url)
+
+        with self.assertRaises(DownloadException):
+            Downloader(self.store).download([o])
+
+        # the source changed so the range is ignored and it starts over
+        server.body = body = os.urandom(2 * 1024 * 1024)
+        server.etag = '"v2"'
+
+        xsum = Downloader(self.store).download([o])[server.url]
+
+        self.assertEqual(hashlib.sha256(body).hexdigest(), xsum)
+
+        with open(self.store.path(xsum), 'rb') as f:
+            self.assertEqual(body, f.read())
+
+    def test_download_resume_mismatched_range(self):
+        body = os.urandom(2 * 1024 * 1024)
+
+        server = self._serve(body)
+        server.truncate = 1024 * 1024
+
+        o = Object(name='tarball', source=server.url)
+
+        with self.assertRaises(DownloadException):
+            Downloader(self.store).download([o])
+
+        # a range other than the one requested is never appended
+        server.range_shift = 100
+
+        xsum = Downloader(self.store).download([o])[server.url]
+
+        self.assertEqual('bytes={0}-'.format(1024 * 1024), server.requests[-2].get('Range'))
+        self.assertEqual(None, server.requests[-1].get('Range'))
+
+        self.assertEqual(hashlib.sha256(body).hexdigest(), xsum)
+
+        with open(self.store.path(xsum), 'rb') as f:
+            self.assertEqual(body, f.read())
+
+    def test_download_revalidate(self):
+        body = os.urandom(1024)
+        server = self._serve(body)
+
+        o1 = Object(name='mutable', source=server.url)
+        xsum1 = Downloader(self.store).download([o1])[server.url]
+
+        # an unchanged source is revalidated rather than downloaded
+        o2 = Object(name='mutable', source=server.url)
+        xsum2 = Downloader(self.store).download([o2])[server.url]
+
+        self.assertEqual('"v1"', server.requests[-1].get('If-None-Match'))
+        self.assertEqual(xsum1, xsum2)
+
+        # a changed source is downloaded again
+        server.body = body = os.urandom(1024)
+        server.etag = '"v2"'
+
+        o3 = Object(name='mutable', source=server.url)
+        xsum3 = Downloader(self.store).download([o3])[server.url]
+
+        self.assertEqual(hashlib.sha256(body).hexdigest(), xsum3)
+        self.assertTrue(self.store.has(xsum3))
+
+
+if __name__ == "__main__":
+    import unittest
+    suite = unittest.TestLoader().loadTestsFromTestCase(DownloadTestCase)
+    unittest.TextTestRunner().run(suite)
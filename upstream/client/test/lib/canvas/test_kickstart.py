@@ -0,0 +1,116 @@
+
+#
+# TESTS
+#
+
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase
+from unittest.mock import patch
+
+from canvas.kickstart import include_graph, include_order, kickstart_includes, kickstart_key, kickstart_paths
+
+
+class KickstartTestCase(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _write(self, name, includes=()):
+        path = os.path.join(self.path, name)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path, 'w') as f:
+            for i in includes:
+                f.write('%include {0}\n'.format(i))
+
+            f.write('lang en_US.UTF-8\n')
+
+        return path
+
+    def test_kickstart_includes(self):
+        path = self._write('spin.ks', ['base.ks', 'common/repo.ks', '/abs/other.ks'])
+
+        self.assertEqual([
+            os.path.join(self.path, 'base.ks'),
+            os.path.join(self.path, 'common/repo.ks'),
+            '/abs/other.ks',
+        ], kickstart_includes(path))
+
+    def test_kickstart_paths(self):
+        self._write('fedora-live-kde.ks')
+        self._write('fedora-live-base.ks')
+        self._write('fedora-repo.ks')
+        self._write('notes.txt')
+
+        self.assertEqual(
+            [os.path.join(self.path, 'fedora-live-base.ks'), os.path.join(self.path, 'fedora-live-kde.ks')],
+            kickstart_paths([self.path], 'fedora-live*')
+        )
+
+        self.assertEqual(3, len(kickstart_paths([self.path])))
+
+    def test_kickstart_include_order(self):
+        repo = self._write('fedora-repo.ks')
+        base = self._write('fedora-live-base.ks', ['fedora-repo.ks'])
+        kde = self._write('fedora-live-kde.ks', ['fedora-live-base.ks'])
+        xfce = self._write('fedora-live-xfce.ks', ['fedora-live-base.ks', 'fedora-repo.ks'])
+
+        # included kickstarts are found without being listed
+        graph = include_graph([kde, xfce])
+
+        self.assertEqual({repo: [], base: [repo], kde: [base], xfce: [base, repo]}, graph)
+        self.assertEqual([[repo], [base], [kde, xfce]], include_order(graph))
+
+    def test_kickstart_include_cycle(self):
+        a = self._write('a.ks', ['b.ks'])
+        self._write('b.ks', ['a.ks'])
+
+        with self.assertRaises(ValueError):
+            include_order(include_graph([a]))
+
+    def test_kickstart_include_missing(self):
+        a = self._write('a.ks', ['missing.ks'])
+
+        with self.assertRaises(IOError):
+            include_graph([a])
+
+    def test_kickstart_key(self):
+        self._write('fedora-repo.ks')
+        base = self._write('fedora-live-base.ks', ['fedora-repo.ks', 'missing.ks'])
+
+        with patch('canvas.kickstart.pykickstart_version', return_value='2.32'):
+            key = kickstart_key(base)
+
+            self.assertEqual(key, kickstart_key(base))
+            self.assertNotEqual(key, kickstart_key(base, follow_includes=False))
+
+            # changing an included kickstart changes the key
+            with open(os.path.join(self.path, 'fedora-repo.ks'), 'a') as f:
+                f.write('repo --name=fedora\n')
+
+            self.assertNotEqual(key, kickstart_key(base))
+
+            key = kickstart_key(base)
+
+            with patch('canvas.kickstart.pykickstart_version', return_value='2.33'):
+                self.assertNotEqual(key, kickstart_key(base))
+
+            with self.assertRaises(IOError):
+                kickstart_key(os.path.join(self.path, 'missing.ks'))
+
+        # parsed kickstarts aren't cached without a known pykickstart
+        with patch('canvas.kickstart.pykickstart_version', return_value=None):
+            self.assertEqual(None, kickstart_key(base))
+
+
+if __name__ == "__main__":
+    import unittest
+    suite = unittest.TestLoader().loadTestsFromTestCase(KickstartTestCase)
+    unittest.TextTestRunner().run(suite)
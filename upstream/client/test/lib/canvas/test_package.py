@@ -284,6 +284,41 @@ class PackageTestCase(TestCase):
         # Not a package
         self.assertNotEqual(p3, 'str')
 
+    def test_package_hash(self):
+        p1 = Package({'n': 'foo'})
+        p2 = Package({'n': 'foo', 'a': 'x86_64'})
+        p3 = Package({'n': 'foo', 'a': 'i686'})
+
+        # equal packages must hash equally
+        self.assertEqual(p1, p2)
+        self.assertEqual(hash(p1), hash(p2))
+
+        self.assertIn(p2, {p1})
+        self.assertIn(p1, {p2, p3})
+
+    def test_package_columns(self):
+        p1 = Package({'n': 'foo', 'a': 'x86_64'})
+        p2 = Package({'n': 'bar', 'e': '1', 'v': '2.0', 'r': '3', 'z': 2})
+
+        columns = Package.to_columns([p1, p2])
+
+        self.assertEqual(['foo', 'bar'], columns['n'])
+        self.assertEqual([None, '1'], columns['e'])
+        self.assertEqual(['x86_64', None], columns['a'])
+        self.assertEqual([1, 2], columns['z'])
+
+        (c1, c2) = Package.from_columns(columns)
+
+        self.assertEqual(p1.to_object(), c1.to_object())
+        self.assertEqual(p2.to_object(), c2.to_object())
+
+        self.assertEqual([], Package.from_columns({}))
+
+        # malformed columns are rejected
+        for bad in [{'n': ['foo', 'bar'], 'a': ['x86_64']}, {'n': 'foo'}, {'n': ['foo'], 'z': 1}]:
+            with self.assertRaises(ValueError):
+                Package.from_columns(bad)
+
 
 #
 # Valid parse_str format
@@ -453,6 +488,35 @@ class PackageTestCase(TestCase):
         l1.add(p3)
         self.assertTrue(len(l1) == 2)
 
+    def test_packageset_multilib(self):
+        p1 = Package({'n': 'foo', 'a': 'x86_64'})
+        p2 = Package({'n': 'foo', 'a': 'i686'})
+        p3 = Package({'n': 'bar'})
+        p4 = Package({'n': 'bar', 'a': 'i686'})
+
+        l1 = PackageSet([p1, p3, p2])
+        self.assertEqual(3, len(l1))
+
+        # explicit arch upgrade retains insertion order
+        l1.add(p4)
+        self.assertEqual([p1, p4, p2], l1.as_list())
+        self.assertEqual('i686', l1[1].arch)
+
+        self.assertEqual([p1, p2], l1.find('foo'))
+        self.assertEqual([], l1.find('baz'))
+
+        # removing an arch leaves the other arch intact
+        l1.discard(Package({'n': 'foo', 'a': 'i686'}))
+        self.assertEqual(2, len(l1))
+        self.assertIn(Package({'n': 'foo', 'a': 'x86_64'}), l1)
+        self.assertNotIn(Package({'n': 'foo', 'a': 'i686'}), l1)
+
+        # an arch-less package matches any remaining arch
+        self.assertIn(Package({'n': 'foo'}), l1)
+        l1.discard(Package({'n': 'foo'}))
+        self.assertNotIn(Package({'n': 'foo'}), l1)
+        self.assertEqual([p4], l1.as_list())
+
     def test_packageset_difference(self):
         p1 = Package({'n': 'foo'})
         p2 = Package({'n': 'foo', 'a': 'x'})
@@ -0,0 +1,173 @@
+
+#
+# TESTS
+#
+
+import os
+import shutil
+import tempfile
+
+from collections import namedtuple
+from unittest import TestCase
+
+from canvas.package import Package
+from canvas.plan import TransactionPlan, pkg_nevra
+from canvas.template import Template
+
+# stand-ins for the dnf objects a plan is resolved against
+Pkg = namedtuple('Pkg', ['name', 'epoch', 'version', 'release', 'arch'])
+Repo = namedtuple('Repo', ['id', 'cachedir'])
+Transaction = namedtuple('Transaction', ['install_set', 'remove_set'])
+
+
+class Query(object):
+    def __init__(self, installed, available):
+        self._installed = installed
+        self._available = available
+        self._pkgs = installed + available
+
+    def __iter__(self):
+        return iter(self._pkgs)
+
+    def available(self):
+        return Query([], self._available)
+
+    def filter(self, name):
+        q = Query(self._installed, self._available)
+        q._pkgs = [p for p in self._pkgs if p.name in name]
+
+        return q
+
+    def installed(self):
+        return Query(self._installed, [])
+
+
+class Sack(object):
+    def __init__(self, installed, available):
+        self.installed = installed
+        self.available = available
+
+    def query(self):
+        return Query(self.installed, self.available)
+
+
+class Repos(object):
+    def __init__(self, repos):
+        self._repos = repos
+
+    def iter_enabled(self):
+        return iter(self._repos)
+
+
+class Base(object):
+    def __init__(self, repos, installed, available, transaction=None):
+        self.repos = Repos(repos)
+        self.sack = Sack(installed, available)
+        self.transaction = transaction
+
+        self.marked_install = []
+        self.marked_remove = []
+
+    def package_install(self, pkg):
+        self.marked_install.append(pkg)
+
+    def package_remove(self, pkg):
+        self.marked_remove.append(pkg)
+
+
+class PlanTestCase(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+        # a repo with fake metadata
+        os.makedirs(os.path.join(self.path, 'repo', 'repodata'))
+
+        with open(os.path.join(self.path, 'repo', 'repodata', 'repomd.xml'), 'w') as f:
+            f.write('<repomd/>')
+
+        self.repos = [Repo('fedora', os.path.join(self.path, 'repo'))]
+
+        self.installed = [
+            Pkg('vim', 2, '7.4', '1.fc24', 'x86_64'),
+            Pkg('nano', 0, '2.5', '1.fc24', 'x86_64'),
+        ]
+
+        self.available = [
+            Pkg('emacs', 1, '25.1', '1.fc24', 'x86_64'),
+            Pkg('emacs', 1, '25.0', '1.fc24', 'x86_64'),
+            Pkg('emacs-common', 1, '25.1', '1.fc24', 'x86_64'),
+        ]
+
+        self.template = Template({})
+        self.template.add_package(Package('emacs'))
+        self.template.add_package(Package('~nano'))
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _plan(self):
+        tx = Transaction([self.available[0], self.available[2]], [self.installed[1]])
+        db = Base(self.repos, self.installed, self.available, transaction=tx)
+
+        return TransactionPlan.from_transaction(self.template, db)
+
+    def test_plan_roundtrip(self):
+        p1 = self._plan()
+        path = os.path.join(self.path, 'tx.plan')
+
+        p1.save(path)
+        p2 = TransactionPlan.load(path)
+
+        self.assertEqual(p1.to_object(), p2.to_object())
+        self.assertEqual(['emacs-1:25.1-1.fc24.x86_64', 'emacs-common-1:25.1-1.fc24.x86_64'], p2.install)
+        self.assertEqual(['nano-0:2.5-1.fc24.x86_64'], p2.remove)
+
+    def test_plan_load_invalid(self):
+        path = os.path.join(self.path, 'tx.plan')
+
+        with open(path, 'w') as f:
+            f.write('{"version": 0}')
+
+        with self.assertRaises(ValueError):
+            TransactionPlan.load(path)
+
+    def test_plan_apply(self):
+        plan = self._plan()
+        db = Base(self.repos, self.installed, self.available)
+
+        self.assertTrue(plan.apply(self.template, db))
+        self.assertEqual(plan.install, [pkg_nevra(p) for p in db.marked_install])
+        self.assertEqual(plan.remove, [pkg_nevra(p) for p in db.marked_remove])
+
+    def test_plan_apply_mismatch(self):
+        plan = self._plan()
+
+        # template content changed
+        self.template.add_package(Package('joe'))
+        db = Base(self.repos, self.installed, self.available)
+
+        self.assertFalse(plan.apply(self.template, db))
+
+        self.template.remove_package(Package('joe'))
+        self.assertTrue(plan.matches(self.template, db))
+
+        # rpmdb changed
+        db = Base(self.repos, self.installed + [Pkg('joe', 0, '4.2', '1.fc24', 'x86_64')], self.available)
+
+        self.assertFalse(plan.apply(self.template, db))
+
+        # repo metadata changed
+        with open(os.path.join(self.path, 'repo', 'repodata', 'repomd.xml'), 'w') as f:
+            f.write('<repomd revision="2"/>')
+
+        db = Base(self.repos, self.installed, self.available)
+
+        self.assertFalse(plan.apply(self.template, db))
+        self.assertEqual([], db.marked_install)
+
+
+if __name__ == "__main__":
+    import unittest
+    suite = unittest.TestLoader().loadTestsFromTestCase(PlanTestCase)
+    unittest.TextTestRunner().run(suite)
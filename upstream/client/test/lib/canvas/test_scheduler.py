@@ -0,0 +1,167 @@
+
+#
+# TESTS
+#
+
+import threading
+import time
+
+from unittest import TestCase
+
+from canvas.download import DownloadException
+from canvas.object import Object
+from canvas.scheduler import ObjectScheduler, paths_overlap
+
+
+class RecordingObject(Object):
+    """ An object recording when its actions are applied. """
+
+    def __init__(self, *args, **kwargs):
+        self.log = kwargs.pop('log', None)
+        self.hook = kwargs.pop('hook', None)
+
+        Object.__init__(self, *args, **kwargs)
+
+    def apply_actions(self):
+        self.log.append(('start', self.name))
+
+        if self.hook is not None:
+            self.hook()
+
+        self.log.append(('end', self.name))
+
+
+class Downloader(object):
+    """ Stand-in downloader making objects available in order. """
+
+    def __init__(self, fail=(), wait=None):
+        self._fail = fail
+        self._wait = wait or {}
+
+    def download(self, objects, force=False, on_complete=None):
+        failed = False
+
+        for o in objects:
+            if o.name in self._wait:
+                if not self._wait[o.name].wait(5):
+                    raise AssertionError('download of {0} never released'.format(o.name))
+
+            if o.name in self._fail:
+                failed = True
+                continue
+
+            on_complete(o)
+
+        if failed:
+            raise DownloadException('unable to download')
+
+
+class SchedulerTestCase(TestCase):
+
+    def setUp(self):
+        self.log = []
+
+    def _object(self, name, actions, **kwargs):
+        return RecordingObject(name=name, source='http://example.com/' + name, xsum=name * 8,
+                               actions=actions, log=self.log, **kwargs)
+
+    def _index(self, event, name):
+        return self.log.index((event, name))
+
+    def test_scheduler_paths_overlap(self):
+        self.assertTrue(paths_overlap('/etc/foo', '/etc/foo'))
+        self.assertTrue(paths_overlap('/etc/foo', '/etc/foo/bar.conf'))
+        self.assertTrue(paths_overlap('/etc/foo/', '/etc/foo/bar.conf'))
+        self.assertTrue(paths_overlap('/', '/opt'))
+        self.assertFalse(paths_overlap('/etc/foo', '/etc/foobar'))
+        self.assertFalse(paths_overlap('/etc', '/opt'))
+
+    def test_scheduler_dependencies(self):
+        objects = [
+            self._object('a', ['copy:/etc/foo']),
+            self._object('b', ['extract:/etc/foo/bar']),
+            self._object('c', ['copy:/opt/c']),
+            self._object('d', ['execute:']),
+            self._object('e', ['copy:/srv']),
+            self._object('f', ['copy:/var/f'], after=['c']),
+            self._object('g', [{'type': 'ks-post'}]),
+        ]
+
+        s = ObjectScheduler(objects)
+
+        self.assertEqual(set(), s.dependencies(0))
+        self.assertEqual({0}, s.dependencies(1))
+        self.assertEqual(set(), s.dependencies(2))
+        self.assertEqual({0, 1, 2}, s.dependencies(3))
+        self.assertEqual({3}, s.dependencies(4))
+        self.assertEqual({2, 3}, s.dependencies(5))
+        self.assertEqual({3}, s.dependencies(6))
+
+    def test_scheduler_cycle(self):
+        objects = [
+            self._object('a', ['copy:/etc/a'], after=['b']),
+            self._object('b', ['copy:/etc/b'], after=['a']),
+        ]
+
+        with self.assertRaises(ValueError):
+            ObjectScheduler(objects)
+
+    def test_scheduler_concurrent(self):
+        barrier = threading.Barrier(2, timeout=5)
+
+        # independent objects are applied at the same time
+        objects = [
+            self._object('a', ['copy:/etc/a'], hook=barrier.wait),
+            self._object('b', ['copy:/etc/b'], hook=barrier.wait),
+            self._object('c', ['copy:/etc/a/c']),
+        ]
+
+        ObjectScheduler(objects).run(Downloader())
+
+        self.assertLess(self._index('end', 'a'), self._index('start', 'c'))
+
+    def test_scheduler_ordered(self):
+        objects = [
+            self._object('a', ['copy:/etc/a'], hook=lambda: time.sleep(0.1)),
+            self._object('b', ['execute:']),
+            self._object('c', ['copy:/opt/c']),
+            self._object('d', ['copy:/opt/d'], after=['c'], hook=lambda: time.sleep(0.05)),
+        ]
+
+        ObjectScheduler(objects).run(Downloader())
+
+        self.assertLess(self._index('end', 'a'), self._index('start', 'b'))
+        self.assertLess(self._index('end', 'b'), self._index('start', 'c'))
+        self.assertLess(self._index('end', 'c'), self._index('start', 'd'))
+
+    def test_scheduler_overlap_download(self):
+        applied = threading.Event()
+
+        # b is only downloaded once a has been applied
+        objects = [
+            self._object('a', ['copy:/etc/a'], hook=applied.set),
+            self._object('b', ['copy:/etc/b']),
+        ]
+
+        ObjectScheduler(objects).run(Downloader(wait={'b': applied}))
+
+        self.assertEqual(4, len(self.log))
+
+    def test_scheduler_failed(self):
+        objects = [
+            self._object('a', ['copy:/etc/a']),
+            self._object('b', ['copy:/etc/a/b']),
+            self._object('c', ['copy:/opt/c']),
+        ]
+
+        with self.assertRaises(DownloadException):
+            ObjectScheduler(objects).run(Downloader(fail=['a']))
+
+        # dependants are skipped, all others applied
+        self.assertEqual([('start', 'c'), ('end', 'c')], self.log)
+
+
+if __name__ == "__main__":
+    import unittest
+    suite = unittest.TestLoader().loadTestsFromTestCase(SchedulerTestCase)
+    unittest.TextTestRunner().run(suite)
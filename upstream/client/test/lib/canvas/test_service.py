@@ -0,0 +1,588 @@
+
+#
+# TESTS
+#
+
+import email.utils
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import TestCase, mock
+
+from canvas.service import Service, ServiceException
+from canvas.package import Package, PackageSet
+from canvas.template import Template
+
+
+class CanvasHandler(BaseHTTPRequestHandler):
+    """ Minimal stand-in for the canvas server template API. """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _authorised(self):
+        return self.headers.get('Cookie') in self.server.sessions
+
+    def _read_json(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+
+        with self.server.lock:
+            self.server.uploaded.append(len(body))
+
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+
+        return json.loads(body.decode('utf-8'))
+
+    def _drop(self):
+        # the request is received but the connection closed without a response
+        self.close_connection = True
+
+    def _send_json(self, data, code=200, etag=None, cookie=None):
+        body = json.dumps(data).encode('utf-8')
+
+        if etag:
+            if self.headers.get('If-None-Match') == etag:
+                with self.server.lock:
+                    self.server.not_modified += 1
+
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+
+        if self.server.features:
+            self.send_header('X-Canvas-Features', ' '.join(self.server.features))
+
+            if 'gzip' in self.headers.get('Accept-Encoding', '') and len(body) > 1024:
+                body = gzip.compress(body)
+                self.send_header('Content-Encoding', 'gzip')
+
+        self.send_header('Content-Length', str(len(body)))
+
+        if cookie:
+            expires = email.utils.formatdate(time.time() + 3600, usegmt=True)
+            self.send_header('Set-Cookie', '{0}; expires={1}; path=/'.format(cookie, expires))
+
+        if etag:
+            self.send_header('ETag', etag)
+
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        url = urllib.parse.urlparse(self.path)
+
+        with server.lock:
+            server.requests.append(url.path)
+            server.connections.add(self.client_address)
+
+        if url.path == '/drop.json':
+            return self._drop()
+
+        elif url.path == '/authorised.json':
+            return self._send_json({}, code=200 if self._authorised() else 403)
+
+        elif url.path == '/api/templates.json':
+            query = dict(urllib.parse.parse_qsl(url.query))
+
+            for uuid, t in server.templates.items():
+                if t['user'] == query.get('user') and t['stub'] == query.get('name'):
+                    return self._send_json([{'uuid': uuid}])
+
+            return self._send_json([])
+
+        elif url.path.startswith('/api/template/'):
+            uuid = url.path[len('/api/template/'):-len('.json')]
+
+            if uuid in server.templates:
+                template = dict(server.templates[uuid])
+                etag = server.etag(uuid) if server.etags else None
+
+                if server.features and self.headers.get('X-Canvas-Packages') == 'columnar':
+                    template['packages'] = {k: [p.get(k) for p in template['packages']] for k in 'nevraz'}
+                    etag = etag and etag[:-1] + '-columnar"'
+
+                return self._send_json(template, etag=etag)
+
+        self._send_json({'error': 'not found'}, code=404)
+
+    def do_POST(self):
+        server = self.server
+        url = urllib.parse.urlparse(self.path)
+        body = self._read_json()
+
+        with server.lock:
+            server.requests.append(url.path)
+            server.connections.add(self.client_address)
+
+        if url.path == '/drop.json':
+            return self._drop()
+
+        elif url.path == '/authenticate.json':
+            if body.get('p') != 'secret':
+                return self._send_json('', code=403)
+
+            with server.lock:
+                session = 'session={0}'.format(len(server.requests))
+                server.sessions.add(session)
+
+            return self._send_json('', cookie=session)
+
+        elif url.path == '/api/templates.json':
+            if not self._authorised():
+                return self._send_json({'error': 'not authenticated.'}, code=403)
+
+            return self._send_json({'uuid': '{0}-{1}'.format(body['user'], body['name'])})
+
+        self._send_json({'error': 'not found'}, code=404)
+
+    def _modify(self, method):
+        server = self.server
+        url = urllib.parse.urlparse(self.path)
+        body = self._read_json()
+
+        with server.lock:
+            server.requests.append(method + ' ' + url.path)
+
+        uuid = url.path[len('/api/template/'):-len('.json')]
+
+        if uuid not in server.templates:
+            return self._send_json({'error': 'template doesn\'t exist'}, code=404)
+
+        if_match = self.headers.get('If-Match')
+
+        if if_match is not None and if_match.replace('-columnar"', '"') != server.etag(uuid):
+            return self._send_json({'error': 'template has been modified.'}, code=412)
+
+        template = server.templates[uuid]
+
+        def expand(packages):
+            if isinstance(packages, dict):
+                return [{k: v[i] for k, v in packages.items() if v[i] is not None} for i in range(len(packages['n']))]
+
+            return packages
+
+        if method == 'PUT':
+            template['packages'] = expand(body['packages'])
+
+        else:
+            def key(p):
+                return (p.get('n'), p.get('a'))
+
+            add = expand(body['packages']['add'])
+            drop = set(key(p) for p in body['packages']['remove'] + add)
+
+            template['packages'] = [p for p in template['packages'] if key(p) not in drop] + add
+
+        self._send_json({'uuid': uuid})
+
+    def do_PATCH(self):
+        self._modify('PATCH')
+
+    def do_PUT(self):
+        self._modify('PUT')
+
+
+class CanvasServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), CanvasHandler)
+
+        self.lock = threading.Lock()
+        self.connections = set()
+        self.requests = []
+        self.templates = {}
+
+        self.etags = True
+        self.not_modified = 0
+
+        self.sessions = set()
+
+        self.features = []
+        self.uploaded = []
+
+    @property
+    def url(self):
+        return 'http://{0}:{1}'.format(*self.server_address)
+
+    def add_template(self, user, name, includes=[], packages=[], uuid=None):
+        if uuid is None:
+            uuid = '{0}-{1}'.format(user, name)
+
+        self.templates[uuid] = {
+            'uuid':     uuid,
+            'user':     user,
+            'stub':     name,
+            'includes': includes,
+            'packages': [{'n': p} for p in packages]
+        }
+
+    def etag(self, uuid):
+        body = json.dumps(self.templates[uuid], sort_keys=True).encode('utf-8')
+
+        return '"{0}"'.format(hashlib.sha256(body).hexdigest())
+
+    def count(self, path):
+        return len([r for r in self.requests if r == path])
+
+
+class ServiceTestCase(TestCase):
+
+    def setUp(self):
+        self.server = CanvasServer()
+
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+        self.cache_dir = tempfile.mkdtemp()
+        self.session_path = os.path.join(self.cache_dir, 'session')
+        self.service = self.connect()
+
+    def connect(self, **kwargs):
+        return Service(host=self.server.url, username='foo', cache_dir=self.cache_dir,
+            session_path=self.session_path, **kwargs)
+
+    def tearDown(self):
+        self.service.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+        shutil.rmtree(self.cache_dir)
+
+    def test_service_resolve_includes_diamond(self):
+        self.server.add_template('foo', 'base', packages=['base'])
+        self.server.add_template('foo', 'left', includes=['foo:base'], packages=['left'])
+        self.server.add_template('foo', 'right', includes=['foo:base'], packages=['right'])
+        self.server.add_template('foo', 'top', includes=['foo:left', 'foo:right'], packages=['top'])
+
+        t = self.service.template_get(Template('foo:top'))
+
+        # base is shared by both includes but only fetched once
+        self.assertEqual(1, self.server.count('/api/template/foo-base.json'))
+        self.assertEqual(1, self.server.count('/api/template/foo-left.json'))
+        self.assertEqual(1, self.server.count('/api/template/foo-right.json'))
+
+        self.assertEqual(
+            PackageSet([Package('top'), Package('left'), Package('right'), Package('base')]),
+            t.packages_all
+        )
+
+    def test_service_resolve_includes_cycle(self):
+        self.server.add_template('foo', 'a', includes=['foo:b'], packages=['a'])
+        self.server.add_template('foo', 'b', includes=['foo:c'], packages=['b'])
+        self.server.add_template('foo', 'c', includes=['foo:a'], packages=['c'])
+
+        with self.assertRaises(ServiceException) as cm:
+            self.service.template_get(Template('foo:a'))
+
+        self.assertIn('cycle', cm.exception.reason)
+
+        # each template is fetched once despite the cycle
+        self.assertEqual(1, self.server.count('/api/template/foo-b.json'))
+
+    def test_service_resolve_includes_default_user(self):
+        self.server.add_template('foo', 'base', packages=['base'])
+        self.server.add_template('foo', 'left', includes=['base'], packages=['left'])
+        self.server.add_template('foo', 'top', includes=['left', 'foo:base'], packages=['top'])
+
+        t = self.service.template_get(Template('foo:top'))
+
+        # includes without a user are the same template as with the user
+        self.assertEqual(1, self.server.count('/api/template/foo-base.json'))
+
+        self.assertEqual(
+            PackageSet([Package('top'), Package('left'), Package('base')]),
+            t.packages_all
+        )
+
+        self.server.add_template('foo', 'a', includes=['b'], packages=['a'])
+        self.server.add_template('foo', 'b', includes=['foo:a'], packages=['b'])
+
+        with self.assertRaises(ServiceException) as cm:
+            self.service.template_get(Template('foo:a'))
+
+        self.assertIn('cycle', cm.exception.reason)
+
+    def test_service_keep_alive(self):
+        self.server.add_template('foo', 'a', packages=['a'])
+
+        for i in range(5):
+            self.service.template_get(Template('foo:a'))
+
+        # six sequential requests over a single connection
+        self.assertEqual(6, len(self.server.requests))
+        self.assertEqual(1, len(self.server.connections))
+
+    def test_service_keep_alive_reconnect(self):
+        self.server.add_template('foo', 'a', packages=['a'])
+
+        self.service.template_get(Template('foo:a'))
+
+        # simulate the server dropping idle connections
+        for conns in self.service._pool._idle.values():
+            for conn in conns:
+                conn.sock.shutdown(socket.SHUT_RDWR)
+
+        t = self.service.template_get(Template('foo:a'))
+        self.assertEqual('a', t.name)
+
+    def test_service_keep_alive_no_resend(self):
+        self.server.add_template('foo', 'a', packages=['a'])
+
+        def request(data=None):
+            self.service.template_get(Template('foo:a'))
+
+            r = urllib.request.Request('{0}/drop.json'.format(self.server.url), data)
+
+            with self.assertRaises(urllib.error.URLError):
+                self.service._opener.open(r)
+
+        # a GET lost on a reused connection is sent again on a fresh one
+        request()
+        self.assertEqual(2, self.server.count('/drop.json'))
+
+        # whereas a POST the server may have acted on is never sent twice
+        request(b'{}')
+        self.assertEqual(3, self.server.count('/drop.json'))
+
+    def test_service_uuid_cache(self):
+        self.server.add_template('foo', 'a', packages=['a'])
+
+        self.service.template_get(Template('foo:a'))
+        self.assertEqual(1, self.server.count('/api/templates.json'))
+
+        # subsequent lookups, even from a new service, skip the search
+        service = self.connect()
+        t = service.template_get(Template('foo:a'))
+        service.close()
+
+        self.assertEqual('a', t.name)
+        self.assertEqual(1, self.server.count('/api/templates.json'))
+        self.assertEqual(2, self.server.count('/api/template/foo-a.json'))
+
+    def test_service_uuid_cache_stale(self):
+        self.server.add_template('foo', 'a', packages=['a'])
+        self.service.template_get(Template('foo:a'))
+
+        # template is recreated with a new uuid
+        del self.server.templates['foo-a']
+        self.server.add_template('foo', 'a', packages=['b'], uuid='foo-a2')
+
+        t = self.service.template_get(Template('foo:a'))
+
+        self.assertEqual(PackageSet([Package('b')]), t.packages)
+        self.assertEqual(2, self.server.count('/api/templates.json'))
+
+        # the fresh uuid is now cached
+        self.service.template_get(Template('foo:a'))
+        self.assertEqual(2, self.server.count('/api/templates.json'))
+
+    def test_service_template_cache(self):
+        self.server.add_template('foo', 'a', packages=['a'])
+
+        self.service.template_get(Template('foo:a'))
+        self.assertEqual(0, self.server.not_modified)
+
+        # unchanged templates are revalidated and parsed from the cache
+        service = self.connect()
+        t = service.template_get(Template('foo:a'))
+        service.close()
+
+        self.assertEqual(1, self.server.not_modified)
+        self.assertEqual(PackageSet([Package('a')]), t.packages)
+
+        # changed templates are fetched in full
+        self.server.add_template('foo', 'a', packages=['b'])
+
+        t = self.service.template_get(Template('foo:a'))
+
+        self.assertEqual(1, self.server.not_modified)
+        self.assertEqual(PackageSet([Package('b')]), t.packages)
+
+    def test_service_template_cache_no_etag(self):
+        self.server.etags = False
+        self.server.add_template('foo', 'a', packages=['a'])
+
+        self.service.template_get(Template('foo:a'))
+        t = self.service.template_get(Template('foo:a'))
+
+        self.assertEqual(0, self.server.not_modified)
+        self.assertEqual(PackageSet([Package('a')]), t.packages)
+
+    def test_service_offline(self):
+        self.server.add_template('foo', 'base', packages=['base'])
+        self.server.add_template('foo', 'top', includes=['foo:base'], packages=['top'])
+
+        self.service.template_get(Template('foo:top'))
+        requests = len(self.server.requests)
+
+        service = self.connect(offline=True)
+
+        # resolved entirely from the cache
+        t = service.template_get(Template('foo:top'))
+
+        self.assertEqual(requests, len(self.server.requests))
+        self.assertEqual(PackageSet([Package('top'), Package('base')]), t.packages_all)
+
+        with self.assertRaises(ServiceException):
+            service.template_get(Template('foo:missing'))
+
+        with self.assertRaises(ServiceException):
+            service.template_update(t)
+
+        self.assertEqual(requests, len(self.server.requests))
+
+    def test_service_session_cache(self):
+        self.service.authenticate(password='secret')
+
+        self.assertEqual(1, self.server.count('/authorised.json'))
+        self.assertEqual(1, self.server.count('/authenticate.json'))
+
+        # the saved session is trusted without probing the server
+        service = self.connect()
+        service.authenticate()
+        service.template_create(Template('foo:a'))
+        service.close()
+
+        self.assertEqual(1, self.server.count('/authorised.json'))
+        self.assertEqual(1, self.server.count('/api/templates.json'))
+
+    def test_service_session_rejected(self):
+        self.service.authenticate(password='secret')
+
+        # the server forgets the session before it expires
+        self.server.sessions.clear()
+
+        service = self.connect()
+
+        with mock.patch('getpass.getpass', return_value='secret') as getpass:
+            res = service.template_create(Template('foo:a'))
+
+        service.close()
+
+        # rejected once, then re-authenticated and retried
+        self.assertEqual('foo-a', res['uuid'])
+        self.assertEqual(1, getpass.call_count)
+        self.assertEqual(2, self.server.count('/authenticate.json'))
+        self.assertEqual(2, self.server.count('/api/templates.json'))
+
+    def test_service_session_forbidden(self):
+        self.service.authenticate(password='secret')
+
+        with mock.patch('getpass.getpass', return_value='wrong'):
+            self.service.authenticate(force=True)
+            self.server.sessions.clear()
+
+            # a verified session isn't retried, the request is forbidden
+            with self.assertRaises(ServiceException):
+                self.service.template_create(Template('foo:a'))
+
+        self.assertEqual(1, self.server.count('/api/templates.json'))
+
+    def test_service_compression(self):
+        self.server.features = ['gzip', 'packages-columnar']
+
+        packages = ['package-{0}'.format(i) for i in range(2000)]
+        self.server.add_template('foo', 'a', packages=packages)
+
+        service = self.connect(compact=True)
+        service.authenticate(password='secret')
+
+        t = service.template_get(Template('foo:a'))
+
+        self.assertEqual(2000, len(t.packages))
+
+        t.add_package(Package('extra'))
+        service.template_update(t)
+        service.close()
+
+        # the upload is compressed and expanded again by the server
+        self.assertLess(self.server.uploaded[-1], len(t.to_json()) // 4)
+        self.assertEqual(2001, len(self.server.templates['foo-a']['packages']))
+        self.assertIn({'n': 'extra', 'z': 1}, self.server.templates['foo-a']['packages'])
+
+    def test_service_compression_unsupported(self):
+        self.server.add_template('foo', 'a', packages=['package-{0}'.format(i) for i in range(200)])
+
+        service = self.connect(compact=True)
+        service.authenticate(password='secret')
+
+        t = service.template_get(Template('foo:a'))
+        service.template_update(t)
+        service.close()
+
+        self.assertEqual(len(t.to_json()), self.server.uploaded[-1])
+
+    def test_service_template_patch(self):
+        self.server.features = ['template-patch']
+        self.server.add_template('foo', 'a', packages=['package-{0}'.format(i) for i in range(2000)])
+
+        self.service.authenticate(password='secret')
+
+        t = self.service.template_get(Template('foo:a'))
+        t.add_package(Package('extra'))
+        t.remove_package(Package('package-0'))
+
+        self.service.template_update(t)
+
+        # only the changes are sent
+        self.assertEqual(1, self.server.count('PATCH /api/template/foo-a.json'))
+        self.assertLess(self.server.uploaded[-1], 1024)
+
+        packages = self.server.templates['foo-a']['packages']
+
+        self.assertEqual(2000, len(packages))
+        self.assertIn({'n': 'extra', 'z': 1}, packages)
+        self.assertNotIn({'n': 'package-0'}, packages)
+
+    def test_service_template_patch_conflict(self):
+        self.server.features = ['template-patch']
+        self.server.add_template('foo', 'a', packages=['a'])
+
+        self.service.authenticate(password='secret')
+
+        t = self.service.template_get(Template('foo:a'))
+        t.add_package(Package('b'))
+
+        # another writer changes the template in the meantime
+        self.server.templates['foo-a']['packages'].append({'n': 'c'})
+
+        with self.assertRaises(ServiceException) as cm:
+            self.service.template_update(t)
+
+        self.assertEqual(412, cm.exception.code)
+        self.assertEqual([{'n': 'a'}, {'n': 'c'}], self.server.templates['foo-a']['packages'])
+
+    def test_service_resolve_includes_missing(self):
+        self.server.add_template('foo', 'a', includes=['foo:missing'], packages=['a'])
+
+        with mock.patch('getpass.getpass', return_value='secret'):
+            with self.assertRaises(ServiceException):
+                self.service.template_get(Template('foo:a'))
+
+
+if __name__ == "__main__":
+    import unittest
+    suite = unittest.TestLoader().loadTestsFromTestCase(ServiceTestCase)
+    unittest.TextTestRunner().run(suite)
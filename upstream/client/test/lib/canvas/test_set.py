@@ -0,0 +1,148 @@
+
+#
+# TESTS
+#
+
+from unittest import TestCase
+from unittest.mock import patch
+
+from canvas.package import Package, PackageSet
+from canvas.set import CanvasSet
+
+
+class Item(object):
+    """ Hashable test item that counts equality comparisons. """
+
+    comparisons = 0
+
+    def __init__(self, name):
+        self.name = name
+
+    def __eq__(self, other):
+        Item.comparisons += 1
+        return isinstance(other, Item) and self.name == other.name
+
+    def __hash__(self):
+        return hash(self.name)
+
+    def __repr__(self):
+        return 'Item: %s' % (self.name)
+
+
+class CanvasSetTestCase(TestCase):
+
+    def setUp(self):
+        Item.comparisons = 0
+
+    def test_canvasset_order(self):
+        s1 = CanvasSet([Item('c'), Item('a'), Item('b'), Item('a')])
+
+        self.assertEqual(['c', 'a', 'b'], [x.name for x in s1])
+        self.assertEqual('a', s1[1].name)
+
+    def test_canvasset_first_seen_wins(self):
+        i1 = Item('a')
+        i2 = Item('a')
+
+        s1 = CanvasSet([i1])
+        s1.add(i2)
+
+        self.assertEqual(1, len(s1))
+        self.assertIs(i1, s1[0])
+
+    def test_canvasset_discard(self):
+        s1 = CanvasSet([Item('a'), Item('b'), Item('c')])
+
+        s1.discard(Item('b'))
+
+        self.assertEqual(2, len(s1))
+        self.assertNotIn(Item('b'), s1)
+        self.assertEqual(['a', 'c'], [x.name for x in s1])
+        self.assertEqual('c', s1[1].name)
+
+        with self.assertRaises(ValueError):
+            s1.discard(Item('b'))
+
+        # re-adding a discarded item appends it
+        s1.add(Item('b'))
+        self.assertEqual(['a', 'c', 'b'], [x.name for x in s1])
+
+    def test_canvasset_union(self):
+        s1 = CanvasSet([Item('a'), Item('b')])
+        s2 = CanvasSet([Item('b'), Item('c')])
+
+        u = s1.union(s2)
+
+        self.assertEqual(['a', 'b', 'c'], [x.name for x in u])
+
+        # sources are untouched
+        self.assertEqual(2, len(s1))
+        self.assertEqual(2, len(s2))
+
+        with self.assertRaises(NotImplementedError):
+            s1.union([Item('d')])
+
+    def test_canvasset_update(self):
+        s1 = CanvasSet([Item('a')])
+        s1.update(CanvasSet([Item('b')]), CanvasSet([Item('a'), Item('c')]))
+
+        self.assertEqual(['a', 'b', 'c'], [x.name for x in s1])
+
+        with self.assertRaises(TypeError):
+            s1.update([Item('d')])
+
+    def test_canvasset_difference(self):
+        s1 = CanvasSet([Item('a'), Item('b')])
+        s2 = CanvasSet([Item('b'), Item('c')])
+
+        (uniq1, uniq2) = s1.difference(s2)
+
+        self.assertEqual(CanvasSet([Item('a')]), uniq1)
+        self.assertEqual(CanvasSet([Item('c')]), uniq2)
+
+    def _union_operations(self, count):
+        # three levels of package includes, similar to a large template that
+        # is resolved through a number of includes
+        def packages(start, stop):
+            return PackageSet(Package({'n': 'pkg-{0}'.format(i), 'a': 'x86_64'}) for i in range(start, stop))
+
+        s1 = packages(0, count)
+        s2 = packages(count // 2, count + count // 2)
+        s3 = packages(count, count * 2)
+
+        # count the lookups and comparisons the union performs
+        operations = [0]
+        eq = Package.__eq__
+        find = PackageSet._find
+
+        def counted_eq(a, b):
+            operations[0] += 1
+            return eq(a, b)
+
+        def counted_find(pset, item):
+            operations[0] += 1
+            return find(pset, item)
+
+        with patch.object(Package, '__eq__', counted_eq), patch.object(PackageSet, '_find', counted_find):
+            u = s1.union(s2, s3)
+
+        self.assertEqual(count * 2, len(u))
+        self.assertIn(Package({'n': 'pkg-0', 'a': 'x86_64'}), u)
+
+        return operations[0]
+
+    def test_canvasset_benchmark_union(self):
+        # a linear scan performs in the order of count^2 comparisons, the
+        # name index a lookup per package, so doubling the templates only
+        # doubles the work
+        small = self._union_operations(10000)
+        large = self._union_operations(20000)
+
+        self.assertLess(small, 10000 * 4)
+        self.assertLessEqual(large, small * 2)
+
+
+if __name__ == "__main__":
+    import unittest
+    suite = unittest.TestLoader().loadTestsFromTestCase(CanvasSetTestCase)
+    unittest.TextTestRunner().run(suite)
@@ -0,0 +1,71 @@
+
+#
+# TESTS
+#
+
+import os
+import subprocess
+import sys
+
+from unittest import TestCase, skipIf
+
+# modules only imported by the commands (or shell completion) that need them
+HEAVY_MODULES = ['argcomplete', 'dnf', 'hawkey', 'pykickstart', 'yaml']
+
+
+def importtime(module):
+    """
+    Import module in a fresh interpreter with -X importtime (python 3.7
+    and later).
+
+    Returns:
+      Dictionary of the cumulative import time (in microseconds) of every
+      module imported, keyed by module name.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p))
+
+    p = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import {0}'.format(module)],
+                       stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, universal_newlines=True)
+
+    if p.returncode != 0:
+        raise AssertionError('Unable to import {0}: {1}'.format(module, p.stderr))
+
+    times = {}
+
+    # import time: self [us] | cumulative | imported package
+    for line in p.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+
+        fields = line[len('import time:'):].split('|')
+
+        try:
+            times[fields[2].strip()] = int(fields[1])
+
+        except ValueError:
+            continue
+
+    return times
+
+
+@skipIf(sys.version_info < (3, 7), 'requires python 3.7 for -X importtime')
+class StartupTestCase(TestCase):
+
+    COMMANDS = ['batch', 'cache', 'config', 'machine', 'object', 'package', 'repo', 'store', 'template']
+
+    def test_startup_lazy_imports(self):
+        for command in self.COMMANDS:
+            module = 'canvas.cli.commands.{0}'.format(command)
+            times = importtime(module)
+
+            self.assertIn(module, times)
+
+            for name in times:
+                self.assertNotIn(name.split('.')[0], HEAVY_MODULES,
+                                 '{0} imports {1} on startup'.format(module, name))
+
+
+if __name__ == "__main__":
+    import unittest
+    suite = unittest.TestLoader().loadTestsFromTestCase(StartupTestCase)
+    unittest.TextTestRunner().run(suite)
@@ -3,13 +3,23 @@
 # TESTS
 #
 
+import json
+import os
+import shutil
+import tempfile
+
+from collections import namedtuple
 from unittest import TestCase
+from unittest.mock import patch
 
 from canvas.template import Template
 from canvas.object import ObjectSet
 from canvas.package import Package, PackageSet
 from canvas.repository import RepoSet
 
+# stand-in for an installed dnf package
+Pkg = namedtuple('Pkg', ['name', 'epoch', 'version', 'release', 'arch'])
+
 
 class TemplateTestCase(TestCase):
 
@@ -141,6 +151,170 @@ class TemplateTestCase(TestCase):
         self.assertEqual(PackageSet([p1, p2, p4]), t1.packages_all)
 
 
+    def test_template_views_cached(self):
+        t1 = Template("foo:bar")
+        t2 = Template("bar:baz")
+
+        p1 = Package("foo")
+        p2 = Package("bar")
+        p3 = Package("baz")
+
+        t1.add_package(p1)
+        t2.add_package(p2)
+
+        # views are reused until the template changes
+        v1 = t1.packages_all
+        self.assertIs(v1, t1.packages_all)
+        self.assertEqual(PackageSet([p1]), v1)
+
+        t1.add_package(p3)
+        self.assertIsNot(v1, t1.packages_all)
+        self.assertEqual(PackageSet([p1, p3]), t1.packages_all)
+
+        t1.includes = [t2]
+        self.assertEqual(PackageSet([p1, p3, p2]), t1.packages_all)
+        self.assertEqual(PackageSet([p1, p3]), t1.packages)
+
+        t1.remove_package(p3)
+        self.assertEqual(PackageSet([p1, p2]), t1.packages_all)
+
+        t1.clear()
+        self.assertEqual(PackageSet(), t1.packages_all)
+
+    def test_template_delta(self):
+        t1 = Template({
+            'user': 'foo',
+            'stub': 'bar',
+            'packages': [{'n': 'foo'}, {'n': 'bar', 'a': 'i686'}, {'n': 'baz'}]
+        })
+
+        # no delta without an origin to compare against
+        self.assertIsNone(Template("foo:bar").to_delta())
+
+        t1.add_package(Package("qux"))
+        t1.remove_package(Package("foo"))
+        t1.update_package(Package({'n': 'baz', 'z': 2}))
+
+        delta = t1.to_delta()
+
+        self.assertEqual([{'n': 'baz', 'z': 2}, {'n': 'qux', 'z': 1}], delta['packages']['add'])
+        self.assertEqual([{'n': 'foo'}], delta['packages']['remove'])
+        self.assertEqual({'add': [], 'remove': []}, delta['repos'])
+        self.assertEqual('bar', delta['name'])
+
+    def test_template_compact(self):
+        t1 = Template("foo:bar")
+        t1.add_package(Package("foo"))
+        t1.add_package(Package("bar:i686"))
+
+        obj = t1.to_object(compact=True)
+        self.assertEqual(['bar', 'foo'], obj['packages']['n'])
+
+        obj['stub'] = obj['name']
+        t2 = Template(obj)
+
+        self.assertEqual(t1.packages, t2.packages)
+        self.assertEqual(t1.to_object()['packages'], t2.to_object()['packages'])
+
+    def test_template_fingerprint(self):
+        t1 = Template("foo:bar")
+        t1.add_package(Package("foo"))
+        t1.add_package(Package("bar:i686"))
+
+        # fields assigned by the server are ignored
+        obj = t1.to_object()
+        obj.update({'stub': 'bar', 'uuid': '1234', 'packages': list(reversed(obj['packages']))})
+        t2 = Template(obj)
+
+        self.assertEqual(t1.fingerprint(), t2.fingerprint())
+
+        t2.add_package(Package("baz"))
+        self.assertNotEqual(t1.fingerprint(), t2.fingerprint())
+
+        t2.remove_package(Package("baz"))
+        t2.includes = ['foo:base']
+        self.assertNotEqual(t1.fingerprint(), t2.fingerprint())
+
+        # as are the fields an import sets
+        t3 = Template(json.loads(t1.to_json()))
+
+        t3.public = True
+        self.assertNotEqual(t1.fingerprint(), t3.fingerprint())
+
+        t3.public = False
+        self.assertEqual(t1.fingerprint(), t3.fingerprint())
+
+        t3.title = 'Bar'
+        self.assertNotEqual(t1.fingerprint(), t3.fingerprint())
+
+        # the title defaults to the name in the fingerprint only
+        self.assertEqual(None, t1.to_object()['title'])
+
+    def test_template_kickstart_cache(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+
+        ks = os.path.join(path, 'test.ks')
+
+        with open(ks, 'w') as f:
+            f.write('lang en_US.UTF-8\n')
+
+        content = {
+            'meta': {'packages': {'default': False}},
+            'repos': ['repo --name=fedora --baseurl=http://localhost/fedora'],
+            'objects': [],
+            'packages': Package.to_columns([Package({'n': '@core', 'z': 1}), Package({'n': 'nano', 'z': 0})]),
+        }
+
+        with patch.dict(os.environ, {'XDG_CACHE_HOME': path}), \
+             patch('canvas.kickstart.pykickstart_version', return_value='2.32'), \
+             patch.object(Template, '_read_kickstart', return_value=content) as read:
+            t1 = Template('foo:bar')
+            self.assertTrue(t1.from_kickstart(ks))
+
+            # the second parse is loaded from the cache
+            t2 = Template('foo:bar')
+            self.assertTrue(t2.from_kickstart(ks))
+
+            self.assertEqual(1, read.call_count)
+            self.assertEqual(t1.to_object(), t2.to_object())
+
+            # changing the kickstart parses it again
+            with open(ks, 'a') as f:
+                f.write('keyboard us\n')
+
+            self.assertTrue(Template('foo:bar').from_kickstart(ks))
+            self.assertEqual(2, read.call_count)
+
+    def test_template_packages_reconcile(self):
+        t1 = Template({})
+
+        for p in ['vim', 'emacs', 'bash:i686', 'kernel@4.5-1', 'kernel-devel@4.6-1',
+                  '~libreoffice-*', '~nano', '~joe', '!gimp', '@core']:
+            t1.add_package(Package(p))
+
+        installed = [
+            Pkg('vim', 0, '7.4', '1', 'x86_64'),
+            Pkg('bash', 0, '4.3', '1', 'x86_64'),
+            Pkg('kernel', 0, '4.5', '1', 'x86_64'),
+            Pkg('kernel-devel', 0, '4.5', '1', 'x86_64'),
+            Pkg('libreoffice-core', 1, '5.1', '1', 'x86_64'),
+            Pkg('libreoffice-calc', 1, '5.1', '1', 'x86_64'),
+            Pkg('libre', 0, '1.0', '1', 'x86_64'),
+            Pkg('nano', 0, '2.5', '1', 'x86_64'),
+            Pkg('nano', 0, '2.5', '1', 'i686'),
+            Pkg('gimp', 0, '2.8', '1', 'x86_64'),
+        ]
+
+        (install, remove) = t1._packages_reconcile(installed)
+
+        self.assertEqual(['emacs', 'bash', 'kernel-devel'], [p.name for p in install])
+        self.assertEqual('i686', install[1].arch)
+        self.assertEqual(
+            sorted(['libreoffice-core', 'libreoffice-calc', 'nano', 'nano']),
+            sorted([pi.name for pi in remove])
+        )
+
 
 if __name__ == "__main__":
     import unittest
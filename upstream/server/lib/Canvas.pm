@@ -28,6 +28,8 @@ use Mojo::Base 'Mojolicious';
 #
 use Data::Dumper;
 
+use IO::Compress::Gzip qw(gzip);
+use IO::Uncompress::Gunzip qw(gunzip);
 use Mojo::ByteStream;
 use Mojo::JSON;
 use Mojo::Pg;
@@ -147,6 +149,46 @@ sub startup {
     state $posts = Canvas::Model::Templates->new(pg => shift->pg)
   });
 
+  #
+  # COMPRESSION
+  $self->hook(before_dispatch => sub {
+    my $c = shift;
+    my $req = $c->req;
+
+    # advertise the optional wire features clients may use
+    $c->res->headers->header('X-Canvas-Features' => 'gzip packages-columnar template-patch');
+
+    # inflate gzip encoded request bodies before any json is decoded
+    return unless ($req->headers->content_encoding // '') =~ /\bgzip\b/i;
+
+    my $body = $req->body;
+    my $inflated;
+
+    return $c->render(status => 400, json => {error => 'invalid gzip body.'})
+      unless gunzip(\$body => \$inflated);
+
+    $req->headers->remove('Content-Encoding');
+    $req->body($inflated);
+  });
+
+  $self->hook(after_render => sub {
+    my ($c, $output, $format) = @_;
+
+    return unless $format eq 'json';
+    return unless ($c->req->headers->accept_encoding // '') =~ /\bgzip\b/i;
+
+    $c->res->headers->append(Vary => 'Accept-Encoding');
+
+    # small responses aren't worth compressing
+    return if length $$output < 1024;
+
+    my $compressed;
+    return unless gzip($output => \$compressed);
+
+    $c->res->headers->content_encoding('gzip');
+    $$output = $compressed;
+  });
+
   #
   # ROUTES
   my $r = $self->routes;
@@ -159,6 +201,7 @@ sub startup {
   $r_api->post('/templates')->to('api#templates_post');
   $r_api->get('/template/:uuid')->to('api#template_get');
   $r_api->put('/template/:uuid')->to('api#template_update');
+  $r_api->patch('/template/:uuid')->to('api#template_patch');
   $r_api->delete('/template/:uuid')->to('api#template_del');
 
 
@@ -25,6 +25,9 @@ use Mojo::Base 'Mojolicious::Controller';
 #
 # PERL INCLUDES
 #
+use Digest::SHA qw(sha256_hex);
+use Mojo::Date;
+use Mojo::JSON qw(encode_json);
 use Mojo::Util qw(dumper);
 use Time::Piece;
 
@@ -32,6 +35,165 @@ use Time::Piece;
 # LOCAL INCLUDES
 #
 
+#
+# HELPERS
+#
+
+use constant PACKAGE_COLUMNS => qw(n e v r a z);
+
+#
+# Packages may be sent in a compact columnar form, a hash of parallel arrays
+# for each package field, rather than a list of package hashes.
+#
+sub _packages_expand {
+  my $packages = shift;
+
+  return $packages unless ref $packages eq 'HASH' and ref $packages->{n} eq 'ARRAY';
+
+  my @packages;
+
+  for my $i (0 .. $#{$packages->{n}}) {
+    push @packages, {
+      map  { $_ => $packages->{$_}[$i] }
+      grep { ref $packages->{$_} eq 'ARRAY' and defined $packages->{$_}[$i] } PACKAGE_COLUMNS
+    };
+  }
+
+  return \@packages;
+}
+
+sub _packages_compact {
+  my $packages = shift;
+
+  my $columns = { map { $_ => [] } PACKAGE_COLUMNS };
+
+  for my $p (ref $packages eq 'ARRAY' ? @$packages : ()) {
+    push @{$columns->{$_}}, $p->{$_} for PACKAGE_COLUMNS;
+  }
+
+  return $columns;
+}
+
+#
+# The ETag of a template is the SHA256 of its canonical JSON encoding.
+#
+sub _template_etag {
+  my $template = shift;
+
+  return '"' . sha256_hex(encode_json $template) . '"';
+}
+
+#
+# Check an If-Match header against the ETag of a template, ignoring the
+# suffix of the encoding the client fetched the template with.
+#
+sub _etag_matches {
+  my ($if_match, $etag) = @_;
+
+  for my $tag (split /\s*,\s*/, $if_match) {
+    return 1 if $tag eq '*';
+
+    $tag =~ s/-columnar"$/"/;
+    return 1 if $tag eq $etag;
+  }
+
+  return 0;
+}
+
+#
+# Apply a delta of items to add (or replace) and remove to a list of items,
+# where items are identified by the specified key fields.
+#
+sub _items_apply_delta {
+  my ($items, $delta, @fields) = @_;
+
+  $items = [] unless ref $items eq 'ARRAY';
+
+  return $items unless ref $delta eq 'HASH';
+
+  my $key = sub { my $i = shift; join "\0", map { $i->{$_} // '' } @fields };
+
+  my @add = @{_packages_expand($delta->{add}) // []};
+  my %drop = map { $key->($_) => 1 } @{$delta->{remove} // []}, @add;
+
+  return [(grep { !$drop{$key->($_)} } @$items), @add];
+}
+
+sub _template_apply_delta {
+  my ($template, $delta) = @_;
+
+  # the stored name is the title, the stub is the name used by clients
+  $template->{title} = delete $template->{name};
+  $template->{stub}  = $delta->{name} if defined $delta->{name};
+
+  for my $k (qw(version title description includes stores meta)) {
+    $template->{$k} = $delta->{$k} if exists $delta->{$k};
+  }
+
+  $template->{packages} = _items_apply_delta(_packages_expand($template->{packages}), $delta->{packages}, qw(n a));
+  $template->{repos}    = _items_apply_delta($template->{repos}, $delta->{repos}, qw(s));
+  $template->{objects}  = _items_apply_delta($template->{objects}, $delta->{objects}, qw(name));
+
+  return $template;
+}
+
+#
+# Modify the template identified by :uuid, verifying any If-Match
+# precondition against the current template first. The modify callback is
+# passed the current template and returns the template to store.
+#
+sub _template_modify {
+  my ($c, $modify) = @_;
+  my $uuid = $c->param('uuid');
+  my $if_match = $c->req->headers->header('If-Match');
+
+  # get auth'd user
+  my $cu = $c->auth_user // { id => -1 };
+
+  $c->render_later;
+
+  $c->canvas->templates->find(
+    uuid    => $uuid,
+    user_id => $cu->{id},
+    sub {
+      my ($err, $templates) = @_;
+
+      return $c->render(status => 500, json => {error => $err}) if $err;
+
+      if ($templates->size != 1) {
+        return $c->render(status => 404, json => {error => 'template doesn\'t exist'});
+      }
+
+      my $current = $templates->first;
+
+      if (defined $if_match and not _etag_matches($if_match, _template_etag($current))) {
+        return $c->render(status => 412, json => {error => 'template has been modified.'});
+      }
+
+      # only store if the template is unchanged since it was checked
+      my $updated  = $current->{updated};
+      my $template = $modify->($current);
+      $template->{uuid} = $uuid;
+
+      $c->canvas->templates->update(
+        template => $template,
+        updated  => $updated,
+        user_id  => $cu->{id},
+        sub {
+          my ($err, $res) = @_;
+
+          if ($err) {
+            my $status = $err eq 'template has been modified.' ? 412 : 500;
+            return $c->render(status => $status, json => {error => $err});
+          }
+
+          $c->render(status => 200, json => {uuid => $uuid});
+        }
+      );
+    }
+  );
+}
+
 sub alpha { shift->render('alpha'); }
 sub index { shift->render('index'); }
 
@@ -188,6 +350,8 @@ sub templates_get {
 # Expected body contents is JSON encoded structure defining the template
 # repositories and packages to be added.
 #
+# Packages may be sent in the compact columnar form.
+#
 # Returns:
 #  - 200 on success
 #  - 403 if entity exists and you don't have sufficient privileges to modify
@@ -205,6 +369,7 @@ sub templates_post {
   my $cu = $c->auth_user // { id => -1 };
 
   my $template = $c->req->json;
+  $template->{packages} = _packages_expand($template->{packages}) if ref $template eq 'HASH';
 
   $c->render_later;
 
@@ -230,8 +395,16 @@ sub templates_post {
 # Returned body contents is an JSON encoded structure defining the template
 # repositories and packages contained within.
 #
+# Packages are returned as parallel arrays of each field when the request
+# carries an "X-Canvas-Packages: columnar" header.
+#
+# The response carries an ETag (the SHA256 of the body) and Last-Modified
+# validator so clients can revalidate a cached copy with If-None-Match or
+# If-Modified-Since.
+#
 # Returns:
 #  - 200 on success
+#  - 304 if the client's cached copy is still current
 #  - 403 if entity exists and you don't have sufficient privileges to modify
 #  - 404 if template doesn't exist
 #  - 500 if template owner doesn't exist or is invalid
@@ -261,7 +434,39 @@ sub template_get {
       # only expect one template
       my $template = $templates->first;
 
-      $c->render(json => $template);
+      # the etag identifies the template version, suffixed by its encoding
+      my $etag = _template_etag($template);
+
+      # send packages in the compact columnar form when requested
+      $c->res->headers->append(Vary => 'X-Canvas-Packages');
+
+      if (($c->req->headers->header('X-Canvas-Packages') // '') eq 'columnar') {
+        $template->{packages} = _packages_compact($template->{packages});
+        $c->res->headers->header('X-Canvas-Packages' => 'columnar');
+        $etag =~ s/"$/-columnar"/;
+      }
+
+      my $headers = $c->res->headers;
+      $headers->etag($etag);
+      $headers->last_modified(Mojo::Date->new(int $template->{updated}))
+        if defined $template->{updated};
+
+      # etag takes precedence over the modification date when both are sent
+      my $req_headers = $c->req->headers;
+      my $fresh;
+
+      if (defined(my $inm = $req_headers->if_none_match)) {
+        $fresh = grep { $_ eq $etag || $_ eq '*' } map { s/^W\///r } split /\s*,\s*/, $inm;
+      }
+      elsif (defined(my $ims = $req_headers->if_modified_since)) {
+        my $since = Mojo::Date->new($ims)->epoch;
+        $fresh = defined $since && defined $template->{updated} &&
+          int($template->{updated}) <= $since;
+      }
+
+      return $c->rendered(304) if $fresh;
+
+      $c->render(data => encode_json($template), format => 'json');
     }
   );
 }
@@ -274,10 +479,16 @@ sub template_get {
 # Expected body contents is JSON encoded structure defining the template
 # repositories and packages to be added (or removed).
 #
+# Packages may be sent in the compact columnar form.
+#
+# An If-Match header with the ETag of the template version being replaced
+# may be supplied to guard against overwriting concurrent changes.
+#
 # Returns:
 #  - 200 on success
 #  - 403 if entity exists and you don't have sufficient privileges to modify
 #  - 404 if template doesn't exist
+#  - 412 if the template has changed since the ETag was issued
 #  - 500 if template owner doesn't exist or is invalid
 #
 sub template_update {
@@ -290,6 +501,11 @@ sub template_update {
   };
 
   my $template = $c->req->json;
+  $template->{packages} = _packages_expand($template->{packages}) if ref $template eq 'HASH';
+
+  # only replace the expected version of the template
+  return _template_modify($c, sub { $template })
+    if defined $c->req->headers->header('If-Match');
 
   # get auth'd user
   my $cu = $c->auth_user // { id => -1 };
@@ -309,6 +525,50 @@ sub template_update {
   );
 }
 
+#
+# PATCH /api/template/:id
+#
+# Apply changes to an existing template
+#
+# Expected body contents is JSON encoded structure of the template fields to
+# replace along with the packages, repos and objects to add (or replace) and
+# remove, ie. {"packages": {"add": [...], "remove": [{"n": ..., "a": ...}]}}.
+#
+# The request must carry an If-Match header with the ETag of the template
+# version the changes are based on.
+#
+# Returns:
+#  - 200 on success
+#  - 400 if the changes are malformed
+#  - 403 if entity exists and you don't have sufficient privileges to modify
+#  - 404 if template doesn't exist
+#  - 412 if the template has changed since the ETag was issued
+#  - 428 if no If-Match header was supplied
+#  - 500 if template owner doesn't exist or is invalid
+#
+sub template_patch {
+  my $c = shift;
+
+  unless ($c->users->is_active) {
+    my $msg = 'not authenticated.';
+    return $c->render(status => 403, json => {error => $msg});
+  };
+
+  unless (defined $c->req->headers->header('If-Match')) {
+    my $msg = 'if-match precondition required.';
+    return $c->render(status => 428, json => {error => $msg});
+  }
+
+  my $delta = $c->req->json;
+
+  unless (ref $delta eq 'HASH') {
+    my $msg = 'invalid template changes.';
+    return $c->render(status => 400, json => {error => $msg});
+  }
+
+  _template_modify($c, sub { _template_apply_delta(shift, $delta) });
+}
+
 #
 # DELETE /api/template/:id
 #
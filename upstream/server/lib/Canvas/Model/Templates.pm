@@ -298,9 +298,11 @@ sub update {
             SET
               name=$1, stub=$2, version=$3, description=$4,
               includes=$5, packages=$6, repos=$7,
-              stores=$8, objects=$9, meta=$10
+              stores=$8, objects=$9, meta=$10,
+              updated=(CURRENT_TIMESTAMP AT TIME ZONE \'utc\')
           WHERE
-            uuid=$11' => (
+            uuid=$11 AND
+            (EXTRACT(EPOCH FROM updated)=$12 OR $12 IS NULL)' => (
             $template->{title},
             $template->{stub}, $template->{version},
             $template->{description},
@@ -311,6 +313,7 @@ sub update {
             {json => $template->{objects}},
             {json => $template->{meta}},
             $template->{uuid},
+            $args->{updated},
           ) => $d->begin);
       },
       sub {
@@ -318,6 +321,10 @@ sub update {
 
         return $cb->('internal server error', undef) if $err;
 
+        # the template was updated since the expected version was read
+        return $cb->('template has been modified.', undef)
+          if $res->rows == 0 and defined $args->{updated};
+
         return $cb->(undef, $res->rows == 1);
       }
     );